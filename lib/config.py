@@ -144,10 +144,43 @@ class Configuration:
       self.set('fontFace', 'Fixed')
       self.set('fontSize', '10')
       
+      # Index every headword of plain dictionaries, not only the
+      # first two letters
+      self.set('fullIndex', 'False')
+
+      # Search plain dictionaries and DICT indexes in memory-mapped files
+      self.set('useMmap', 'False')
+
+      # Megabytes of decompressed DICT dictionary data kept in memory
+      self.set('dictCacheSize', '8')
+
+      # Number and megabytes of recent search results kept in memory
+      self.set('searchCacheEntries', '256')
+      self.set('searchCacheSize', '4')
+
+      # Keep search results on disk between runs, in at most this many
+      # megabytes, and load the most used ones into memory at startup
+      self.set('searchStore', 'True')
+      self.set('searchStoreSize', '32')
+      self.set('searchStorePrewarm', '500')
+
       self.set('dictServer', 'dict.org')
       self.set('dictServerPort', '2628')
       self.set('dict-server-encoding', 'UTF-8')
 
+      # Mirrors of DICT servers, "server[:port]" separated by spaces,
+      # used when the server is down or slower
+      self.set('dictServerMirrors', '')
+
+      # Lookups on DICT servers are cached for this many seconds, ones
+      # without definitions for a shorter time
+      self.set('dictServerCacheTTL', '604800')
+      self.set('dictServerCacheNegativeTTL', '3600')
+
+      # Megabytes of cached DICT server lookups in memory and on disk
+      self.set('dictServerCacheMemory', '2')
+      self.set('dictServerCacheSize', '32')
+
       self.repository = \
                'http://opendict.sf.net/Repository/Data/opendict-add-ons.xml'
 
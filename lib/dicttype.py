@@ -117,18 +117,44 @@ class TypeDict(DictionaryType):
 
 
 
+class TypeSQLite(DictionaryType):
+    """SQLite dictionary type"""
+
+    from . import sqlitedict
+
+    dictClass = sqlitedict.SQLiteDictionary
+    fileExtentions = ('sqlite',)
+    name = "SQLite dictionary"
+    shortIdName = "sqlite"
+
+
+
+class TypeOdx(DictionaryType):
+    """Compiled OpenDict dictionary type"""
+
+    from . import odxdict
+
+    dictClass = odxdict.OdxDictionary
+    fileExtentions = ('odx',)
+    name = "Compiled OpenDict dictionary"
+    shortIdName = "odx"
+
+
+
 # Constant instances
 PLUGIN = TypePlugin()
 SLOWO = TypeSlowo()
 MOVA = TypeMova()
 #TMX = TypeTMX()
 DICT = TypeDict()
+SQLITE = TypeSQLite()
+ODX = TypeOdx()
 
 # Supported types tuple
-supportedTypes = (PLUGIN, SLOWO, MOVA, DICT)
+supportedTypes = (PLUGIN, SLOWO, MOVA, DICT, SQLITE, ODX)
 
 # Plain dictionary types (data file)
-plainTypes = (SLOWO, MOVA, DICT)
+plainTypes = (SLOWO, MOVA, DICT, SQLITE, ODX)
 
 # Types for which index table is made
 indexableTypes = (SLOWO, MOVA)
@@ -0,0 +1,576 @@
+#
+# OpenDict
+# Copyright (c) 2003-2006 Martynas Jocius <martynas.jocius@idiles.com>
+# Copyright (c) 2007 IDILES SYSTEMS, UAB <support@idiles.com>
+# Copyright (c) 2021 Celyo <celyo@mail.bg>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your opinion) any later version.
+#
+# This program is distributed in the hope that will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MECHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more detals.
+#
+# You shoud have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301 USA
+#
+
+"""
+asyncio client for the DICT protocol (RFC2229)
+
+Follows the Connection/Database/Definition model of dictclient, but
+every method talking to the server is a coroutine:
+
+    conn = await connect('dict.org')
+    for d in await conn.define('*', 'word'):
+        print(d.getdb().getdescription(), d.getdefstr())
+    await conn.close()
+
+Many connections can be used concurrently from one event loop, e.g.
+with asyncio.gather().  Concurrent commands on one connection are
+pipelined: they are sent at once and the responses are read in order.
+
+SyncConnection runs the same client on a background event loop and
+offers the blocking interface of dictclient.Connection, so it can be
+used by dictclient.ConnectionPool and ServerGroup, see pool.
+"""
+
+import asyncio
+import collections
+import re
+import socket
+import threading
+import time
+
+from lib.extra import dictclient
+from lib.extra.dictclient import dequote, enquote, ConnectionClosed, \
+     ResponseError
+
+
+# Seconds to wait for the connection and the banner
+CONNECT_TIMEOUT = 15
+
+# Seconds to wait for the whole response to a command
+READ_TIMEOUT = 30
+
+
+async def connect(hostname='localhost', port=2628,
+                  connecttimeout=CONNECT_TIMEOUT, readtimeout=READ_TIMEOUT):
+    """Connect to a server and read its banner.  Returns a Connection
+    object.  asyncio.TimeoutError is raised if it takes longer than
+    connecttimeout seconds."""
+
+    async def opening():
+        reader, writer = await asyncio.open_connection(hostname, port)
+        conn = Connection(reader, writer, hostname, port, readtimeout)
+        try:
+            await conn.saveconnectioninfo()
+        except BaseException:
+            writer.close()
+            raise
+        return conn
+
+    return await asyncio.wait_for(opening(), connecttimeout)
+
+
+class Connection:
+    """A connection to a database server.  Use connect() to make one."""
+
+    def __init__(self, reader, writer, hostname, port,
+                 readtimeout=READ_TIMEOUT):
+        self.reader = reader
+        self.writer = writer
+        self.hostname = hostname
+        self.port = port
+        self.readtimeout = readtimeout
+        self.previous = None
+        self.shown = {}
+        self.dbobjs = {}
+
+    async def command(self, command, getresponse):
+        """Send command and return the result of getresponse coroutine.
+        The command is sent at once; its response is read after the
+        responses to the commands sent before.  asyncio.TimeoutError is
+        raised if the response does not arrive within readtimeout seconds.
+        If reading a response fails, the connection is closed and the
+        following commands fail with ConnectionClosed, since they can not
+        tell where their responses start."""
+        previous = self.previous
+        done = asyncio.get_running_loop().create_future()
+        self.previous = done
+        self.writer.write((command + "\r\n").encode('utf-8'))
+
+        ok = False
+        try:
+            await self.writer.drain()
+            if previous is not None and not await previous:
+                raise ConnectionClosed("Previous command failed")
+            result = await asyncio.wait_for(getresponse(), self.readtimeout)
+            ok = True
+            return result
+        finally:
+            if not ok:
+                self.writer.close()
+            done.set_result(ok)
+
+    async def close(self):
+        """Send QUIT and close the connection."""
+        try:
+            self.writer.write(b"QUIT\r\n")
+            self.writer.close()
+            await self.writer.wait_closed()
+        except OSError:
+            pass
+
+    async def readline(self):
+        """Read one line from the server, without the line ending."""
+        line = await self.reader.readline()
+        if not line:
+            raise ConnectionClosed("Connection closed by server")
+        return line.decode('utf-8', 'replace').strip()
+
+    async def getresultcode(self):
+        """Read a status line.  Returns [intcode, remaindertext]"""
+        line = await self.readline()
+        code, text = (line + ' ').split(' ', 1)
+        return [int(code), text.strip()]
+
+    async def get200result(self):
+        """Read a 200-class status line.  Returns [intcode, remaindertext]"""
+        code, text = await self.getresultcode()
+        if code < 200 or code >= 300:
+            raise ResponseError("Got '%d %s' when 200-class response "
+                                "expected" % \
+                  (code, text))
+        return [code, text]
+
+    async def get100block(self):
+        """Read a text block up to the line holding a single period.
+        Returns a string."""
+        data = []
+        while 1:
+            line = await self.readline()
+            if line == '.':
+                break
+            if line.startswith('..'):
+                line = line[1:]
+            data.append(line)
+        return "\n".join(data)
+
+    async def get100result(self):
+        """Read a 100-class status line, a text block and a 200-class
+        status line.  Returns [initialcode, bodylines, finalcode]"""
+        code, text = await self.getresultcode()
+        if code < 100 or code >= 200:
+            raise ResponseError("Got '%s' when 100-class response expected" % \
+                  code)
+        bodylines = (await self.get100block()).split("\n")
+        code2 = (await self.get200result())[0]
+        return [code, bodylines, code2]
+
+    async def get100dict(self):
+        """Read a 100-class response listing names and descriptions.
+        Returns a dict."""
+        dict = {}
+        for line in (await self.get100result())[1]:
+            key, val = line.split(' ', 1)
+            dict[key] = dequote(val)
+        return dict
+
+    async def saveconnectioninfo(self):
+        """Read the banner and save capabilities and message id."""
+        code, string = await asyncio.wait_for(self.get200result(),
+                                              self.readtimeout)
+        if code != 220:
+            raise ResponseError("Unexpected banner code %d" % code)
+        match = re.search('<(.*)> (<.*>)$', string)
+        capstr, msgid = match.groups()
+        self.capabilities = capstr.split('.')
+        self.messageid = msgid
+        self.banner = string[:match.start(2)].strip()
+
+    def getcapabilities(self):
+        """Returns a list of the capabilities advertised by the server."""
+        return self.capabilities
+
+    def getmessageid(self):
+        """Returns the message id, including angle brackets."""
+        return self.messageid
+
+    def getbanner(self):
+        """Returns the server greeting with capabilities, but without
+        the message id, which differs for every connection."""
+        return self.banner
+
+    async def show(self, command):
+        """Returns the dict of names and descriptions listed by SHOW
+        command.  It is asked from the server once: callers coming while
+        it is being read wait for the same response."""
+        if command not in self.shown:
+            self.shown[command] = asyncio.ensure_future(
+                self.command(command, self.get100dict))
+        # Cancelling one caller must not cancel the shared request
+        return await asyncio.shield(self.shown[command])
+
+    async def getdbdescs(self):
+        """Returns a dict of database names and descriptions.  They are
+        not asked from the server if dbdescs was set already."""
+        if not hasattr(self, 'dbdescs'):
+            self.dbdescs = await self.show("SHOW DB")
+        return self.dbdescs
+
+    async def getstratdescs(self):
+        """Returns a dict of strategy names and descriptions."""
+        return await self.show("SHOW STRAT")
+
+    def getdbobj(self, dbname):
+        """Returns a Database object for the database name.  getdbdescs()
+        must have been called before, except for '*' and '!'."""
+        if dbname in self.dbobjs:
+            return self.dbobjs[dbname]
+
+        if dbname != '*' and dbname != '!' and \
+               not dbname in self.dbdescs:
+            raise ValueError("Invalid database name '%s'" % dbname)
+
+        self.dbobjs[dbname] = Database(self, dbname)
+        return self.dbobjs[dbname]
+
+    async def define(self, database, word):
+        """Returns a list of Definition objects for word in database,
+        which may be '*' or '!'.  An empty list is returned if there are
+        no matches."""
+        await self.checkdefine(database)
+        return await self.command(self.definecommand(database, word),
+                                  self.getdefinitions)
+
+    async def checkdefine(self, database):
+        """Raises an exception if database can not be used for DEFINE."""
+        dbdescs = await self.getdbdescs()   # Prime the cache
+        if database != '*' and database != '!' and \
+           not database in dbdescs:
+            raise ValueError("Invalid database '%s' specified" % database)
+
+    def definecommand(self, database, word):
+        """Returns the DEFINE command for word."""
+        return "DEFINE %s %s" % (enquote(database), enquote(word))
+
+    async def getdefinitions(self):
+        """Reads the response to a DEFINE command.  Returns a list of
+        Definition objects."""
+        code = (await self.getresultcode())[0]
+        if code == 552:
+            return []
+        if code != 150:
+            raise ResponseError("Unknown code %d" % code)
+
+        retval = []
+        while 1:
+            code, text = await self.getresultcode()
+            if code != 151:
+                break
+            resultword, resultdb = re.search(r'^"(.+)" (\S+)',
+                                             text).groups()
+            defstr = await self.get100block()
+            retval.append(Definition(self, self.getdbobj(resultdb),
+                                     resultword, defstr))
+        return retval
+
+    async def match(self, database, strategy, word):
+        """Returns a list of Definition objects, without definition
+        strings, matching word with strategy in database.  An empty list
+        is returned if there are no matches."""
+        await self.checkmatch(database, strategy)
+        return await self.command(self.matchcommand(database, strategy,
+                                                    word),
+                                  self.getmatches)
+
+    async def checkmatch(self, database, strategy):
+        """Raises an exception if database or strategy can not be used
+        for MATCH."""
+        stratdescs = await self.getstratdescs()
+        dbdescs = await self.getdbdescs()   # Prime the cache
+        if not strategy in stratdescs:
+            raise ValueError("Invalid strategy '%s'" % strategy)
+        if database != '*' and database != '!' and \
+               not database in dbdescs:
+            raise ValueError("Invalid database name '%s'" % database)
+
+    def matchcommand(self, database, strategy, word):
+        """Returns the MATCH command for word."""
+        return "MATCH %s %s %s" % (enquote(database), enquote(strategy),
+                                   enquote(word))
+
+    async def getmatches(self):
+        """Reads the response to a MATCH command.  Returns a list of
+        Definition objects without definition strings."""
+        code = (await self.getresultcode())[0]
+        if code == 552:
+            return []
+        if code != 152:
+            raise ResponseError("Unexpected code %d" % code)
+
+        retval = []
+        for matchline in (await self.get100block()).split("\n"):
+            matchdict, matchword = matchline.split(" ", 1)
+            retval.append(Definition(self, self.getdbobj(matchdict),
+                                     dequote(matchword)))
+        code = (await self.getresultcode())[0]
+        if code != 250:
+            raise ResponseError("Unexpected end-of-list code %d" % code)
+        return retval
+
+
+class Database:
+    """A database on a server."""
+
+    def __init__(self, conn, dbname):
+        self.conn = conn
+        self.name = dbname
+
+    def getname(self):
+        """Returns the short name for this database."""
+        return self.name
+
+    def getdescription(self):
+        """Returns the description of this database.  Does not generate
+        network traffic."""
+        if self.name == '*':
+            return 'All Databases'
+        if self.name == '!':
+            return 'First matching database'
+        return self.conn.dbdescs[self.name]
+
+    async def getinfo(self):
+        """Returns a string of info describing this database."""
+        if not hasattr(self, 'info'):
+            if self.name == '*' or self.name == '!':
+                self.info = self.getdescription()
+            else:
+                result = await self.conn.command("SHOW INFO " + self.name,
+                                                 self.conn.get100result)
+                self.info = "\n".join(result[1])
+        return self.info
+
+    async def define(self, word):
+        """Same as Connection.define() for this database."""
+        return await self.conn.define(self.name, word)
+
+    async def match(self, strategy, word):
+        """Same as Connection.match() for this database."""
+        return await self.conn.match(self.name, strategy, word)
+
+
+class Definition:
+    """A single definition or match."""
+
+    def __init__(self, conn, db, word, defstr=None):
+        self.conn = conn
+        self.db = db
+        self.word = word
+        self.defstr = defstr
+
+    def getdb(self):
+        """Returns the Database object of this definition."""
+        return self.db
+
+    def getword(self):
+        """Returns the word this object describes."""
+        return self.word
+
+    def getdefstr(self):
+        """Returns the definition string, None for a match which has not
+        been fetched yet."""
+        return self.defstr
+
+    async def fetchdefstr(self):
+        """Returns the definition string, asking the server for it if
+        needed."""
+        if self.defstr is None:
+            definitions = await self.conn.define(self.db.getname(),
+                                                 self.word)
+            self.defstr = definitions[0].getdefstr()
+        return self.defstr
+
+
+_loop = None
+_loopLock = threading.Lock()
+
+
+def getloop():
+    """Returns the event loop running in a background thread, starting
+    it on first use."""
+
+    global _loop
+
+    _loopLock.acquire()
+    try:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=_loop.run_forever,
+                                      name="DictClientLoop")
+            thread.daemon = True
+            thread.start()
+    finally:
+        _loopLock.release()
+
+    return _loop
+
+
+def run(coroutine):
+    """Run coroutine on the background event loop and wait for its
+    result"""
+
+    return asyncio.run_coroutine_threadsafe(coroutine, getloop()).result()
+
+
+class SyncConnection:
+    """Blocking facade with the interface of dictclient.Connection.
+    The work is done by an asyncio Connection on the background event
+    loop, timeouts raise socket.timeout like in dictclient.  Unlike in
+    dictclient, getdefstr() of a match result does not fetch the
+    definition and Database methods talking to the server are
+    coroutines."""
+
+    def __init__(self, hostname='localhost', port=2628,
+                 connecttimeout=CONNECT_TIMEOUT, readtimeout=READ_TIMEOUT):
+        self.hostname = hostname
+        self.port = port
+        self.pending = collections.deque()
+        self.conn = self.wait(asyncio.run_coroutine_threadsafe(
+            connect(hostname, port, connecttimeout, readtimeout), getloop()))
+
+    @property
+    def dbdescs(self):
+        """Database names and descriptions, set by ConnectionPool if it
+        knows them already."""
+        return self.conn.dbdescs
+
+    @dbdescs.setter
+    def dbdescs(self, dbdescs):
+        self.conn.dbdescs = dbdescs
+
+    def wait(self, future):
+        """Waits for the result of a future of the background loop."""
+        self.lastused = time.time()
+        try:
+            return future.result()
+        except asyncio.TimeoutError:
+            raise socket.timeout("timed out")
+
+    def call(self, coroutine):
+        """Runs coroutine on the background loop and returns its result."""
+        return self.wait(asyncio.run_coroutine_threadsafe(coroutine,
+                                                          getloop()))
+
+    def close(self):
+        """Sends QUIT and closes the connection."""
+        self.call(self.conn.close())
+
+    def settimeout(self, timeout):
+        """Makes responses fail with socket.timeout if they do not arrive
+        within timeout seconds, or wait forever if timeout is None."""
+        self.conn.readtimeout = timeout
+
+    def isalive(self):
+        """Returns true if the connection looks usable.  Does not
+        generate network traffic."""
+        return not self.pending and not self.conn.writer.is_closing() \
+               and not self.conn.reader.at_eof()
+
+    def getcapabilities(self):
+        """Returns a list of the capabilities advertised by the server."""
+        return self.conn.getcapabilities()
+
+    def getmessageid(self):
+        """Returns the message id, including angle brackets."""
+        return self.conn.getmessageid()
+
+    def getdbdescs(self):
+        """Returns a dict of database names and descriptions."""
+        return self.call(self.conn.getdbdescs())
+
+    def getstratdescs(self):
+        """Returns a dict of strategy names and descriptions."""
+        return self.call(self.conn.getstratdescs())
+
+    def getdbobj(self, dbname):
+        """Returns a Database object for the database name."""
+        return self.conn.getdbobj(dbname)
+
+    def define(self, database, word):
+        """See Connection.define()."""
+        return self.call(self.conn.define(database, word))
+
+    def define_many(self, database, words):
+        """Like define(), but looks up a list of words concurrently.
+        Returns a list with the result of define() for each word."""
+        return self.call(_gather([self.conn.define(database, word) \
+                                  for word in words]))
+
+    def match(self, database, strategy, word):
+        """See Connection.match()."""
+        return self.call(self.conn.match(database, strategy, word))
+
+    def match_many(self, database, strategy, words):
+        """Like match(), but for a list of words, matched concurrently.
+        Returns a list with the result of match() for each word."""
+        return self.call(_gather([self.conn.match(database, strategy, word) \
+                                  for word in words]))
+
+    def checkdefine(self, database):
+        """Raises an exception if database can not be used for DEFINE."""
+        self.call(self.conn.checkdefine(database))
+
+    def definecommand(self, database, word):
+        """Returns the DEFINE command for word."""
+        return self.conn.definecommand(database, word)
+
+    def checkmatch(self, database, strategy):
+        """Raises an exception if database or strategy can not be used
+        for MATCH."""
+        self.call(self.conn.checkmatch(database, strategy))
+
+    def matchcommand(self, database, strategy, word):
+        """Returns the MATCH command for word."""
+        return self.conn.matchcommand(database, strategy, word)
+
+    def sendcommand(self, command):
+        """Sends a DEFINE or MATCH command without waiting for its
+        response."""
+        self.sendcommands([command])
+
+    def sendcommands(self, commands):
+        """Sends DEFINE and MATCH commands at once.  Their responses are
+        read by getdefinitions() and getmatches() in the same order."""
+        readers = {'DEFINE': self.conn.getdefinitions,
+                   'MATCH': self.conn.getmatches}
+        for command in commands:
+            name = command.split(" ", 1)[0].upper()
+            if not name in readers:
+                raise ValueError("Can not send '%s' command" % name)
+            self.pending.append(asyncio.run_coroutine_threadsafe(
+                self.conn.command(command, readers[name]), getloop()))
+
+    def getdefinitions(self):
+        """Returns the list of Definition objects answering the next
+        DEFINE command sent."""
+        return self.wait(self.pending.popleft())
+
+    def getmatches(self):
+        """Returns the list of Definition objects, without definition
+        strings, answering the next MATCH command sent."""
+        return self.wait(self.pending.popleft())
+
+
+async def _gather(coroutines):
+    return list(await asyncio.gather(*coroutines))
+
+
+# Pooled connections of the asyncio client for dictclient.ServerGroup
+pool = dictclient.ConnectionPool(connection=SyncConnection)
@@ -16,10 +16,52 @@
 #    along with this program; if not, write to the Free Software
 #    Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
 
-import socket, re
+import socket, re, select, threading, time, queue
 
 version = '1.0'
 
+# Idle connections older than this many seconds are not reused.  dictd
+# drops idle clients after a while, so keep this below its limit.
+POOL_IDLE_TIMEOUT = 60
+
+# Number of idle connections kept per (hostname, port)
+POOL_MAX_IDLE = 4
+
+# Bytes asked from the socket at once
+READ_SIZE = 65536
+
+# Commands sent ahead of the responses read by define_many() and
+# match_many().  Bounded, so neither side blocks writing while the
+# other one is not reading.
+PIPELINE_WINDOW = 64
+
+# Seconds to wait for a connection and the banner when connecting to
+# one of several servers, and the delay before the next server is tried
+# while the previous one has not answered yet
+RACE_TIMEOUT = 3
+RACE_DELAY = 0.25
+
+# Seconds to wait for data from a server of a ServerGroup before it is
+# given up and the next one is tried
+READ_TIMEOUT = 30
+
+# Weight of the latest round trip in the average latency of a server
+LATENCY_WEIGHT = 0.3
+
+# Seconds a failed server is skipped before it is probed again
+PROBE_INTERVAL = 30
+
+# Line holding a single period, which ends a text block
+_blockend = re.compile(br'^\.\r?\n', re.M)
+
+class ConnectionClosed(Exception):
+    """Raised when the server has closed the connection."""
+    pass
+
+class ResponseError(Exception):
+    """Raised when the server sends a response that is not expected."""
+    pass
+
 def dequote(str):
     """Will remove single or double quotes from the start and end of a string
     and return the result."""
@@ -41,21 +83,81 @@ class Connection:
     You will usually use this as the first call into the dictclient library.
     Instantiating it takes two optional arguments: a hostname (a string)
     and a port (an int).  The hostname defaults to localhost
-    and the port to 2628, the port specified in RFC."""
-    def __init__(self, hostname = 'localhost', port = 2628):
-        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.sock.connect((hostname, port))
-        self.rfile = self.sock.makefile("rb")
-        self.wfile = self.sock.makefile("wb", 0)
-        self.saveconnectioninfo()
+    and the port to 2628, the port specified in RFC.  If timeout is
+    given, connecting and reading the banner fails with socket.timeout
+    after that many seconds."""
+    def __init__(self, hostname = 'localhost', port = 2628, timeout = None):
+        self.hostname = hostname
+        self.port = port
+        self.sock = socket.create_connection((hostname, port), timeout)
+        self.buf = bytearray()
+        self.pos = 0
+        self.lastused = time.time()
+        try:
+            self.saveconnectioninfo()
+        except:
+            self.sock.close()
+            raise
+        self.sock.settimeout(None)
+
+    def close(self):
+        """Sends QUIT, if possible, and closes the connection."""
+        try:
+            self.sendcommand("QUIT")
+        except (socket.error, ValueError):
+            pass
+        try:
+            self.sock.close()
+        except socket.error:
+            pass
+
+    def settimeout(self, timeout):
+        """Makes reads fail with socket.timeout after timeout seconds,
+        or wait forever if timeout is None."""
+        self.sock.settimeout(timeout)
+
+    def isalive(self):
+        """Returns true if the connection looks usable.  An idle connection
+        has nothing to read; if it has, the server either closed it or
+        sent a 421 timeout notice.  Does not generate network traffic."""
+        if self.pos < len(self.buf):
+            return 0
+        try:
+            readable = select.select([self.sock], [], [], 0)[0]
+        except (socket.error, ValueError):
+            return 0
+        return not readable
+
+    def fill(self):
+        """Reads more data from the server into the buffer, dropping the
+        part already consumed.  Raises ConnectionClosed at end of stream."""
+        if self.pos:
+            del self.buf[:self.pos]
+            self.pos = 0
+        data = self.sock.recv(READ_SIZE)
+        if not data:
+            raise ConnectionClosed("Connection closed by server")
+        self.buf += data
+
+    def readline(self):
+        """Reads one line from the server, without the line ending.
+        Raises ConnectionClosed at end of stream."""
+        end = self.buf.find(b'\n', self.pos)
+        while end < 0:
+            searched = len(self.buf) - self.pos
+            self.fill()
+            end = self.buf.find(b'\n', searched)
+        line = self.buf[self.pos:end]
+        self.pos = end + 1
+        return line.decode('utf-8', 'replace').strip()
 
     def getresultcode(self):
         """Generic function to get a result code.  It will return a list
         consisting of two items: the integer result code and the text
         following.  You will not usually use this function directly."""
-        line = self.rfile.readline().strip()
-        code, text = line.split(' ', 1)
-        return [int(code), text]
+        line = self.readline()
+        code, text = (line + ' ').split(' ', 1)
+        return [int(code), text.strip()]
 
     def get200result(self):
         """Used when expecting a single line of text -- a 200-class
@@ -63,19 +165,36 @@ class Connection:
 
         code, text = self.getresultcode()
         if code < 200 or code >= 300:
-            raise Exception("Got '%s' when 200-class response expected" % \
-                  line)
+            raise ResponseError("Got '%d %s' when 200-class response "
+                                "expected" % \
+                  (code, text))
         return [code, text]
 
     def get100block(self):
         """Used when expecting multiple lines of text -- gets the block
         part only.  Does not get any codes or anything!  Returns a string."""
-        data = []
-        while 1:
-            line = self.rfile.readline().strip()
-            if line == '.':
-                break
-            data.append(line)
+        # Find the terminating period in the buffer and decode the whole
+        # block at once.  Consumed data is dropped first, so that ^ of
+        # the pattern matches at the block start.
+        if self.pos:
+            del self.buf[:self.pos]
+            self.pos = 0
+        match = _blockend.search(self.buf)
+        while match is None:
+            # Continue from the last, possibly incomplete, line
+            searched = self.buf.rfind(b'\n') + 1
+            self.fill()
+            match = _blockend.search(self.buf, searched)
+        block = self.buf[:match.start()].decode('utf-8', 'replace')
+        self.pos = match.end()
+
+        data = block.split('\n')
+        data.pop()
+        for i, line in enumerate(data):
+            line = line.strip()
+            if line.startswith('..'):
+                line = line[1:]
+            data[i] = line
         return "\n".join(data)
 
     def get100result(self):
@@ -84,7 +203,7 @@ class Connection:
         finalcode]"""
         code, text = self.getresultcode()
         if code < 100 or code >= 200:
-            raise Exception("Got '%s' when 100-class response expected" % \
+            raise ResponseError("Got '%s' when 100-class response expected" % \
                   code)
 
         bodylines = self.get100block().split("\n")
@@ -155,7 +274,7 @@ class Connection:
 
         if dbname != '*' and dbname != '!' and \
                not dbname in list(self.dbdescs.keys()):
-            raise Exception("Invalid database name '%s'" % dbname)
+            raise ValueError("Invalid database name '%s'" % dbname)
 
         self.dbobjs[dbname] = Database(self, dbname)
         return self.dbobjs[dbname]
@@ -163,7 +282,31 @@ class Connection:
     def sendcommand(self, command):
         """Takes a command, without a newline character, and sends it to
         the server."""
-        self.wfile.write(command + "\n")
+        self.sendcommands([command])
+
+    def sendcommands(self, commands):
+        """Sends a list of commands, without newline characters, to the
+        server in one write."""
+        self.lastused = time.time()
+        data = "".join([command + "\r\n" for command in commands])
+        self.sock.sendall(data.encode('utf-8'))
+
+    def pipeline(self, commands, getresponse):
+        """Sends commands without waiting for each response and reads
+        the responses in order with getresponse.  At most PIPELINE_WINDOW
+        commands are outstanding.  Returns a list of the responses."""
+        retval = []
+        sent = min(len(commands), PIPELINE_WINDOW)
+        self.sendcommands(commands[:sent])
+        while len(retval) < len(commands):
+            # Refill the window once half of it has been answered
+            if sent < len(commands) and \
+               sent - len(retval) <= PIPELINE_WINDOW // 2:
+                more = commands[sent:len(retval) + PIPELINE_WINDOW]
+                self.sendcommands(more)
+                sent += len(more)
+            retval.append(getresponse())
+        return retval
 
     def define(self, database, word):
         """Returns a list of Definition objects for each matching
@@ -175,13 +318,33 @@ class Connection:
         Note: database may be '*' which means to search all databases,
         or '!' which means to return matches from the first database that
         has a match."""
+        self.checkdefine(database)
+        self.sendcommand(self.definecommand(database, word))
+        return self.getdefinitions()
+
+    def define_many(self, database, words):
+        """Like define(), but looks up a list of words, pipelining the
+        commands.  Returns a list with the result of define() for each
+        word, in the same order."""
+        self.checkdefine(database)
+        return self.pipeline([self.definecommand(database, word)
+                              for word in words], self.getdefinitions)
+
+    def checkdefine(self, database):
+        """Raises an exception if database can not be used for DEFINE."""
         self.getdbdescs()               # Prime the cache
 
         if database != '*' and database != '!' and \
            not database in self.getdbdescs():
-            raise Exception("Invalid database '%s' specified" % database)
-        
-        self.sendcommand("DEFINE " + enquote(database) + " " + enquote(word))
+            raise ValueError("Invalid database '%s' specified" % database)
+
+    def definecommand(self, database, word):
+        """Returns the DEFINE command for word."""
+        return "DEFINE " + enquote(database) + " " + enquote(word)
+
+    def getdefinitions(self):
+        """Reads the response to a DEFINE command.  Returns a list of
+        Definition objects."""
         code = self.getresultcode()[0]
 
         retval = []
@@ -190,14 +353,14 @@ class Connection:
             # No definitions.
             return []
         if code != 150:
-            raise Exception("Unknown code %d" % code)
+            raise ResponseError("Unknown code %d" % code)
 
         while 1:
             code, text = self.getresultcode()
             if code != 151:
                 break
 
-            resultword, resultdb = re.search('^"(.+)" (\S+)', text).groups()
+            resultword, resultdb = re.search(r'^"(.+)" (\S+)', text).groups()
             defstr = self.get100block()
             retval.append(Definition(self, self.getdbobj(resultdb),
                                      resultword, defstr))
@@ -212,23 +375,43 @@ class Connection:
         Note: database may be '*' which means to search all databases,
         or '!' which means to return matches from the first database that
         has a match."""
+        self.checkmatch(database, strategy)
+        self.sendcommand(self.matchcommand(database, strategy, word))
+        return self.getmatches()
+
+    def match_many(self, database, strategy, words):
+        """Like match(), but for a list of words, pipelining the commands.
+        Returns a list with the result of match() for each word, in the
+        same order."""
+        self.checkmatch(database, strategy)
+        return self.pipeline([self.matchcommand(database, strategy, word)
+                              for word in words], self.getmatches)
+
+    def checkmatch(self, database, strategy):
+        """Raises an exception if database or strategy can not be used
+        for MATCH."""
         self.getstratdescs()            # Prime the cache
         self.getdbdescs()               # Prime the cache
         if not strategy in list(self.getstratdescs().keys()):
-            raise Exception("Invalid strategy '%s'" % strategy)
+            raise ValueError("Invalid strategy '%s'" % strategy)
         if database != '*' and database != '!' and \
                not database in list(self.getdbdescs().keys()):
-            raise Exception("Invalid database name '%s'" % database)
+            raise ValueError("Invalid database name '%s'" % database)
 
-        self.sendcommand("MATCH %s %s %s" % (enquote(database),
-                                             enquote(strategy),
-                                             enquote(word)))
+    def matchcommand(self, database, strategy, word):
+        """Returns the MATCH command for word."""
+        return "MATCH %s %s %s" % (enquote(database), enquote(strategy),
+                                   enquote(word))
+
+    def getmatches(self):
+        """Reads the response to a MATCH command.  Returns a list of
+        Definition objects without definition strings."""
         code = self.getresultcode()[0]
         if code == 552:
             # No Matches
             return []
         if code != 152:
-            raise Exception("Unexpected code %d" % code)
+            raise ResponseError("Unexpected code %d" % code)
 
         retval = []
 
@@ -236,8 +419,9 @@ class Connection:
             matchdict, matchword = matchline.split(" ", 1)
             retval.append(Definition(self, self.getdbobj(matchdict),
                                      dequote(matchword)))
-        if self.getresultcode()[0] != 250:
-            raise Exception("Unexpected end-of-list code %d" % code)
+        code = self.getresultcode()[0]
+        if code != 250:
+            raise ResponseError("Unexpected end-of-list code %d" % code)
         return retval
 
 class Database:
@@ -289,6 +473,16 @@ class Database:
         the same as from Connection.define()."""
         return self.conn.match(self.getname(), strategy, word)
 
+    def define_many(self, words):
+        """Get definitions of a list of words from within this database.
+        The return value is the same as from Connection.define_many()."""
+        return self.conn.define_many(self.getname(), words)
+
+    def match_many(self, strategy, words):
+        """Get matches for a list of words from within this database.
+        The return value is the same as from Connection.match_many()."""
+        return self.conn.match_many(self.getname(), strategy, words)
+
 class Definition:
     """An object corresponding to a single definition."""
     def __init__(self, dictconn, db, word, defstr = None):
@@ -315,3 +509,344 @@ class Definition:
     def getword(self):
         """Get the word this object describes."""
         return self.word
+
+class ConnectionPool:
+    """Keeps idle connections per (hostname, port) so that a lookup does
+    not pay for the TCP handshake, the banner and SHOW DB every time.
+    Connections idle for longer than idletimeout seconds are closed.
+    New connections are made by calling connection with hostname, port
+    and connect timeout.  The pool may be used from several threads."""
+    def __init__(self, idletimeout = POOL_IDLE_TIMEOUT,
+                 maxidle = POOL_MAX_IDLE, connection = Connection):
+        self.idletimeout = idletimeout
+        self.maxidle = maxidle
+        self.connection = connection
+        self.idle = {}
+        self.dbdescs = {}
+        self.lock = threading.Lock()
+
+    def get(self, hostname = 'localhost', port = 2628):
+        """Returns an idle connection to the server, or a new one if
+        there is no usable idle connection."""
+        conn = self.getidle(hostname, port)
+        if conn is None:
+            conn = self.connect(hostname, port)
+        return conn
+
+    def connect(self, hostname, port, timeout = None):
+        """Returns a new connection to the server, knowing the databases
+        if they were cached."""
+        conn = self.connection(hostname, port, timeout)
+        self.lock.acquire()
+        try:
+            dbdescs = self.dbdescs.get((hostname, port))
+        finally:
+            self.lock.release()
+        if dbdescs is not None:
+            conn.dbdescs = dbdescs
+        return conn
+
+    def getidle(self, hostname, port):
+        """Returns an idle connection to the server, None if there is no
+        usable one."""
+        key = (hostname, port)
+        stale = []
+        conn = None
+        self.lock.acquire()
+        try:
+            idle = self.idle.get(key, [])
+            now = time.time()
+            while idle:
+                candidate = idle.pop()
+                if now - candidate.lastused < self.idletimeout and \
+                   candidate.isalive():
+                    conn = candidate
+                    break
+                stale.append(candidate)
+        finally:
+            self.lock.release()
+
+        for candidate in stale:
+            candidate.close()
+
+        return conn
+
+    def put(self, conn):
+        """Returns a connection to the pool after use."""
+        key = (conn.hostname, conn.port)
+        conn.lastused = time.time()
+        # Users of idle connections set their own timeout
+        conn.settimeout(None)
+        self.lock.acquire()
+        try:
+            if hasattr(conn, 'dbdescs'):
+                self.dbdescs[key] = conn.dbdescs
+            idle = self.idle.setdefault(key, [])
+            if len(idle) < self.maxidle:
+                idle.append(conn)
+                conn = None
+        finally:
+            self.lock.release()
+
+        if conn is not None:
+            conn.close()
+
+    def run(self, hostname, port, func):
+        """Calls func with a pooled connection and returns its result.
+        If the connection turns out to be broken, the call is repeated
+        once on a new connection."""
+        for attempt in (0, 1):
+            conn = self.get(hostname, port)
+            try:
+                result = func(conn)
+            except (ConnectionClosed, socket.error):
+                # Other idle connections are likely dead too
+                conn.close()
+                self.clear(hostname, port)
+                if attempt:
+                    raise
+                continue
+            except:
+                conn.close()
+                raise
+            self.put(conn)
+            return result
+
+    def clear(self, hostname = None, port = None):
+        """Closes idle connections and forgets cached descriptions of
+        the given server, or of all servers if none is given."""
+        self.lock.acquire()
+        try:
+            if hostname is None:
+                keys = set(self.idle) | set(self.dbdescs)
+            else:
+                keys = [(hostname, port)]
+            conns = []
+            for key in keys:
+                conns.extend(self.idle.pop(key, []))
+                self.dbdescs.pop(key, None)
+        finally:
+            self.lock.release()
+
+        for conn in conns:
+            conn.close()
+
+pool = ConnectionPool()
+
+def parseservers(text, port = 2628):
+    """Parses a list of servers separated by spaces or commas, each as
+    hostname or hostname:port.  Returns a list of (hostname, port)."""
+    servers = []
+    for item in re.split(r'[\s,]+', text.strip()):
+        if not item:
+            continue
+        hostname, sep, itemport = item.rpartition(':')
+        if sep and itemport.isdigit():
+            servers.append((hostname, int(itemport)))
+        else:
+            servers.append((item, port))
+    return servers
+
+class ServerGroup:
+    """Servers offering the same databases.  A query goes to the healthy
+    server with the lowest average latency.  When new connections are
+    needed, the servers are raced: the next one is tried RACE_DELAY
+    seconds after the previous one unless it has answered already, and
+    the first to answer is used.  Failed servers are skipped until a
+    probe in the background, started every PROBE_INTERVAL seconds,
+    connects to them again.  Reads time out after READ_TIMEOUT
+    seconds, so a server that stops answering fails too."""
+    def __init__(self, servers, pool = pool):
+        self.servers = list(servers)
+        self.pool = pool
+        self.latency = {}
+        self.failed = {}
+        self.probing = set()
+        self.lock = threading.Lock()
+
+    def getlatency(self, server):
+        """Returns the average latency of server in seconds, None if it
+        was not measured yet."""
+        return self.latency.get(server)
+
+    def ishealthy(self, server):
+        """Returns true unless the last attempt to use server failed."""
+        return not server in self.failed
+
+    def record(self, server, seconds):
+        """Adds a round trip to the average latency of server and marks
+        it healthy."""
+        self.lock.acquire()
+        try:
+            average = self.latency.get(server)
+            if average is None:
+                average = seconds
+            else:
+                average += LATENCY_WEIGHT * (seconds - average)
+            self.latency[server] = average
+            self.failed.pop(server, None)
+        finally:
+            self.lock.release()
+
+    def fail(self, server):
+        """Marks server unhealthy."""
+        self.lock.acquire()
+        try:
+            self.failed[server] = time.time()
+        finally:
+            self.lock.release()
+
+    def getcandidates(self):
+        """Returns servers in the order they should be tried: healthy
+        ones not measured yet in configured order, so that each one gets
+        measured, then other healthy ones by latency.  Failed servers are
+        left out until a probe finds them healthy, unless no healthy
+        server is left.  Starts probes of failed servers when due."""
+        now = time.time()
+        self.lock.acquire()
+        try:
+            healthy = [s for s in self.servers if not s in self.failed]
+            failed = [s for s in self.servers if s in self.failed]
+            due = [s for s in failed if not s in self.probing and
+                   now - self.failed[s] >= PROBE_INTERVAL]
+            self.probing.update(due)
+        finally:
+            self.lock.release()
+
+        for server in due:
+            thread = threading.Thread(target=self.probe, args=(server,),
+                                      name="DictProbe")
+            thread.daemon = True
+            thread.start()
+
+        if healthy:
+            healthy.sort(key=lambda s: self.latency.get(s, 0))
+            return healthy
+        failed.sort(key=lambda s: self.failed.get(s, 0))
+        return failed
+
+    def probe(self, server):
+        """Connects to a failed server and marks it healthy if the banner
+        comes in time.  The connection is kept in the pool."""
+        try:
+            start = time.time()
+            try:
+                conn = self.pool.connect(server[0], server[1], RACE_TIMEOUT)
+            except Exception:
+                self.fail(server)
+                return
+            self.record(server, time.time() - start)
+            self.pool.put(conn)
+        finally:
+            self.lock.acquire()
+            self.probing.discard(server)
+            self.lock.release()
+
+    def race(self, servers):
+        """Connects to servers, starting them one after another, and
+        returns (server, connection) of the first one to answer.  Later
+        connections go to the pool.  The last error is raised if no
+        server answers."""
+        results = queue.Queue()
+
+        def connect(server):
+            start = time.time()
+            try:
+                conn = self.pool.connect(server[0], server[1], RACE_TIMEOUT)
+            except Exception as e:
+                self.fail(server)
+                results.put((server, None, e))
+                return
+            self.record(server, time.time() - start)
+            results.put((server, conn, None))
+
+        started = 0
+        finished = 0
+        error = None
+        while finished < len(servers):
+            if started < len(servers):
+                thread = threading.Thread(target=connect,
+                                          args=(servers[started],),
+                                          name="DictConnect")
+                thread.daemon = True
+                thread.start()
+                started += 1
+                wait = RACE_DELAY
+            else:
+                wait = None
+            try:
+                server, conn, e = results.get(timeout=wait)
+            except queue.Empty:
+                continue
+            finished += 1
+            if conn is not None:
+                # Keep the connections made by the losers
+                remaining = started - finished
+                if remaining:
+                    thread = threading.Thread(target=self.collect,
+                                              args=(results, remaining),
+                                              name="DictCollect")
+                    thread.daemon = True
+                    thread.start()
+                return server, conn
+            error = e
+
+        raise error
+
+    def collect(self, results, count):
+        """Puts connections made after a race was won into the pool."""
+        for i in range(count):
+            server, conn, e = results.get()
+            if conn is not None:
+                self.pool.put(conn)
+
+    def run(self, func):
+        """Calls func with a connection to the best server and returns
+        its result.  If the server fails, the next ones are tried."""
+        candidates = self.getcandidates()
+        error = None
+
+        while candidates:
+            server = candidates[0]
+            conn = self.pool.getidle(server[0], server[1])
+            reused = conn is not None
+            if not reused:
+                server, conn = self.race(candidates)
+            conn.settimeout(READ_TIMEOUT)
+
+            start = time.time()
+            try:
+                result = func(conn)
+            except (ConnectionClosed, socket.error) as e:
+                conn.close()
+                self.pool.clear(server[0], server[1])
+                error = e
+                # An idle connection may just have been dropped by the
+                # server, so try it once more on a new connection
+                if not reused:
+                    self.fail(server)
+                    candidates.remove(server)
+                continue
+            except:
+                conn.close()
+                raise
+            self.record(server, time.time() - start)
+            self.pool.put(conn)
+            return result
+
+        raise error
+
+_groups = {}
+_groupslock = threading.Lock()
+
+def getgroup(servers, pool = pool):
+    """Returns the ServerGroup of servers, a list of (hostname, port),
+    shared by all users of the same list and pool."""
+    key = (tuple(servers), pool)
+    _groupslock.acquire()
+    try:
+        if not key in _groups:
+            _groups[key] = ServerGroup(key[0], pool)
+        return _groups[key]
+    finally:
+        _groupslock.release()
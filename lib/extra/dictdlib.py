@@ -16,13 +16,19 @@
 #    along with this program; if not, write to the Free Software
 #    Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
 
-import sys, string, gzip, os
+import sys, string, gzip, os, struct, zlib, threading, mmap, binascii
+import bisect, itertools, heapq, tempfile, multiprocessing
+from array import array
+from collections import OrderedDict
 
 b64_list = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/"
 url_headword = "00-database-url"
 short_headword = "00-database-short"
 info_headword = "00-database-info"
 
+# Encoding of written definitions and index
+ENCODING = 'utf-8'
+
 
 def b64_encode(val):
     """Takes as input an integer val and returns a string of it encoded
@@ -41,19 +47,46 @@ def b64_encode(val):
     else:
         return b64_list[0]
     
+b64_values = {}
+for i in range(len(b64_list)):
+    b64_values[b64_list[i]] = i
+
 def b64_decode(str):
     """Takes as input a string and returns an integer value of it decoded
     with the base64 algorithm used by dict indexes."""
-    if not len(str):
-        return 0
     retval = 0
-    shiftval = 0
-    for i in range(len(str) - 1, -1, -1):
-        val = b64_list.index(str[i])
-        retval = retval | (val << shiftval)
-        shiftval += 6
+    for c in str:
+        retval = (retval << 6) | b64_values[c]
     return retval
 
+def b64_decode_column(values):
+    """Decodes a list of dict index base64 numbers given as bytes at
+    once.  Returns array('Q') of the values.
+
+    The dict alphabet is the standard base64 one, so numbers are
+    padded to 8 digits with zeros ('A') and decoded by binascii to
+    6 big-endian bytes each."""
+    if not values:
+        return array('Q')
+    padded = (b"%8s" * len(values)) % tuple(values)
+    # Only padding may be blank
+    if padded.count(b" ") != len(padded) - sum(map(len, values)):
+        raise ValueError("Invalid number in dict index")
+    padded = padded.replace(b" ", b"A")
+    decoded = binascii.a2b_base64(padded)
+    if len(padded) != 8 * len(values) or len(decoded) != 6 * len(values):
+        # a2b_base64 skips invalid characters instead of failing
+        raise ValueError("Invalid number in dict index")
+    # Widen every 6 byte number to 8 bytes
+    wide = bytearray(8 * len(values))
+    for i in range(6):
+        wide[i + 2::8] = decoded[i::6]
+    column = array('Q')
+    column.frombytes(bytes(wide))
+    if sys.byteorder == 'little':
+        column.byteswap()
+    return column
+
 validdict = {}
 for x in string.ascii_letters + string.digits + " \t":
     validdict[x] = 1
@@ -71,13 +104,779 @@ def sortfunc(x, y):
    """Emulate sort -df."""
    xl = x.split("\0")
    yl = y.split("\0")
-   ret = cmp(xl[0], yl[0])
-   if ret != 0:
-       return ret
-   return cmp(xl[1], yl[1])
+   return (xl > yl) - (xl < yl)
+
+# Emulation of sort -df in C locale for bytes: blanks and ASCII
+# alphanumerics are kept, lower case is folded to upper case
+_collateupper = bytes.maketrans(string.ascii_lowercase.encode(),
+                                string.ascii_uppercase.encode())
+_collateignored = bytes([x for x in range(256) \
+                         if chr(x) not in validdict])
+
+def collatekey(word):
+    """Returns primary sort -df key of word given as bytes."""
+    return word.translate(_collateupper, _collateignored)
+
+def sortkey(line):
+    """Returns key sorting index lines given as bytes exactly like
+    LC_ALL=C sort -df.  The primary key is the one of sortnormalize();
+    lines equal by it are compared byte by byte, as sort does as the
+    last resort."""
+    return (line.translate(_collateupper, _collateignored), line)
+
+# Index lines sorted in memory at once by IndexSorter
+SORT_RUN_SIZE = 500000
+
+# Maximum number of runs merged at once
+SORT_MERGE_FANIN = 64
+
+class IndexSorter:
+    """External sort of index lines with bounded memory.
+
+    Lines are collected in memory up to runsize, then sorted and
+    written to a temporary file.  The sorted runs are merged with
+    heapq.merge() when reading.  Too many runs are merged into one
+    while adding, so the number of open files stays bounded."""
+
+    def __init__(self, runsize = SORT_RUN_SIZE, tempdir = None):
+        self.runsize = runsize
+        self.tempdir = tempdir
+        self.lines = []
+        self.runs = []
+
+    def append(self, line):
+        """Adds index line given as bytes without the newline."""
+        self.lines.append(line)
+        if len(self.lines) >= self.runsize:
+            self._spill()
+
+    def _spill(self):
+        self.lines.sort(key = sortkey)
+        self.runs.append(self._writerun(self.lines))
+        self.lines = []
+        if len(self.runs) >= SORT_MERGE_FANIN:
+            run = self._writerun(self._merge())
+            self.close()
+            self.runs = [run]
+
+    def _writerun(self, lines):
+        run = tempfile.TemporaryFile(dir = self.tempdir)
+        for line in lines:
+            run.write(line + b"\n")
+        return run
+
+    def _readrun(self, run):
+        run.seek(0)
+        for line in run:
+            yield line[:-1]
+
+    def _merge(self):
+        return heapq.merge(*[self._readrun(run) for run in self.runs],
+                           key = sortkey)
+
+    def __iter__(self):
+        """Yields all lines in sort -df order."""
+        if not self.runs:
+            self.lines.sort(key = sortkey)
+            return iter(self.lines)
+        if self.lines:
+            self._spill()
+        return self._merge()
+
+    def close(self):
+        """Removes temporary files."""
+        for run in self.runs:
+            run.close()
+        self.runs = []
+
+# Index lines sharing a primary key are scanned if they take at most
+# this many bytes, larger runs are searched through a sorted table
+TIE_RUN_SCAN = 16384
+
+class TieRun:
+    """Line positions of one run of index lines sharing a primary key,
+    sorted by case folded headword.
+
+    Words without ASCII letters or digits all have an empty primary
+    key, so in Cyrillic, Greek and similar dictionaries most lines
+    form a single run.  The file orders such a run by the rest of the
+    line, not by headword, so it is sorted here once and searched
+    with bisect.
+
+    A table of the whole file serves prefix lookups of words without
+    ASCII letters or digits, whose lines are spread over the file."""
+
+    def __init__(self, index, start, end):
+        self.index = index
+        positions = []
+        pos = start
+        while pos < end:
+            positions.append(pos)
+            pos = index._lineend(pos) + 1
+        self.positions = array('Q', sorted(positions, key = self._fold))
+
+    def _fold(self, pos):
+        return self.index._fold(self.index._headword(pos))
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __getitem__(self, i):
+        """Returns folded headword of i-th line, used by bisect."""
+        return self._fold(self.positions[i])
+
+class MappedIndex:
+    """Index file mapped into memory and searched in place.
+
+    The index must be sorted like sort -df does in C locale, which is
+    the order dictfmt and this module write.  Lookups binary search
+    by the primary collation key, then compare the headwords of lines
+    having that key.  Large runs of lines having one key are searched
+    by TieRun tables, built when first needed.  Otherwise nothing is
+    loaded at open, memory is used by the page cache only."""
+
+    def __init__(self, filename, encoding = 'utf-8'):
+        self.encoding = encoding
+        self.fileobj = open(filename, "rb")
+        self.size = os.fstat(self.fileobj.fileno()).st_size
+        self.tieruns = {}
+        self.foldedrun = None
+        if self.size:
+            self.data = mmap.mmap(self.fileobj.fileno(), 0,
+                                  access = mmap.ACCESS_READ)
+        else:
+            # Empty files can not be mapped
+            self.data = b""
+
+    def _lineend(self, pos):
+        end = self.data.find(b"\n", pos)
+        if end < 0:
+            end = self.size
+        return end
+
+    def _headword(self, pos):
+        end = self._lineend(pos)
+        tab = self.data.find(b"\t", pos, end)
+        if tab < 0:
+            tab = end
+        return self.data[pos:tab]
+
+    def _fold(self, headword):
+        return headword.decode(self.encoding, 'replace').lower()
+
+    def _lowerbound(self, key, upper = 0):
+        """Returns position of the first line with primary key not
+        less than key, or greater than key if upper is true."""
+        data = self.data
+        lo, hi = 0, self.size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            # lo is always at the beginning of a line
+            start = data.rfind(b"\n", max(lo - 1, 0), mid) + 1
+            end = self._lineend(start)
+            tab = data.find(b"\t", start, end)
+            if tab < 0:
+                tab = end
+            linekey = collatekey(data[start:tab])
+            if linekey < key or (upper and linekey == key):
+                lo = end + 1
+            else:
+                hi = start
+        return lo
+
+    def _lines(self, key, prefix = 0):
+        """Yields (headword, line) pairs of lines whose primary key
+        equals key, or starts with it if prefix is true."""
+        data = self.data
+        pos = self._lowerbound(key)
+        while pos < self.size:
+            end = self._lineend(pos)
+            line = data[pos:end]
+            pos = end + 1
+            headword = line.split(b"\t", 1)[0]
+            linekey = collatekey(headword)
+            if linekey != key and not (prefix and linekey.startswith(key)):
+                break
+            yield headword, line
+
+    def _tierun(self, key):
+        """Returns TieRun of lines with primary key, None if they are
+        few enough to be scanned."""
+        run = self.tieruns.get(key)
+        if run is None:
+            start = self._lowerbound(key)
+            end = self._lowerbound(key, 1)
+            if end - start <= TIE_RUN_SCAN:
+                return None
+            run = self.tieruns[key] = TieRun(self, start, end)
+        return run
+
+    def _caselesslines(self, key, folded):
+        """Yields (headword, line) pairs of lines with primary key
+        whose case folded headword equals folded."""
+        run = self._tierun(key)
+        if run is None:
+            for headword, line in self._lines(key):
+                if self._fold(headword) == folded:
+                    yield headword, line
+            return
+
+        for i in range(bisect.bisect_left(run, folded), len(run)):
+            pos = run.positions[i]
+            headword = self._headword(pos)
+            if self._fold(headword) != folded:
+                break
+            yield headword, self.data[pos:self._lineend(pos)]
+
+    def _entry(self, line):
+        splits = line.rstrip().split(b"\t")
+        return [b64_decode(splits[1].decode('ascii')),
+                b64_decode(splits[2].decode('ascii'))]
+
+    def get(self, word):
+        """Returns list of [start, size] entries of word."""
+        encoded = word.encode(self.encoding)
+        return [self._entry(line) \
+                for headword, line in self._caselesslines(
+                    collatekey(encoded), self._fold(encoded)) \
+                if headword == encoded]
+
+    def has(self, word):
+        return len(self.get(word)) > 0
+
+    def caseless(self, word):
+        """Returns headwords equal to word ignoring case."""
+        word = word.lower()
+        words = {}
+        for headword, line in self._caselesslines(
+                collatekey(word.encode(self.encoding)), word):
+            words[headword.decode(self.encoding, 'replace')] = None
+        return list(words)
+
+    def prefix(self, prefix):
+        """Returns headwords starting with prefix ignoring case, in
+        case folded order."""
+        prefix = prefix.lower()
+        key = collatekey(prefix.encode(self.encoding))
+        if prefix and not key:
+            # Every line has a primary key starting with an empty one
+            return self._foldedprefix(prefix)
+
+        words = {}
+        for headword, line in self._lines(key, 1):
+            headword = headword.decode(self.encoding, 'replace')
+            if headword.lower().startswith(prefix):
+                words[headword] = None
+        return sorted(words, key = str.lower)
+
+    def _foldedprefix(self, prefix):
+        """Returns headwords whose case folded form starts with prefix,
+        searching the table of all lines built when first needed."""
+        if self.foldedrun is None:
+            self.foldedrun = TieRun(self, 0, self.size)
+        run = self.foldedrun
+        words = {}
+        for i in range(bisect.bisect_left(run, prefix), len(run)):
+            headword = self._headword(run.positions[i])
+            if not self._fold(headword).startswith(prefix):
+                break
+            words[headword.decode(self.encoding, 'replace')] = None
+        return list(words)
+
+    def words(self):
+        """Returns list of all headwords."""
+        words = {}
+        pos = 0
+        data = self.data
+        while pos < self.size:
+            end = data.find(b"\n", pos)
+            if end < 0:
+                end = self.size
+            tab = data.find(b"\t", pos, end)
+            if tab >= 0:
+                words[data[pos:tab]] = None
+            pos = end + 1
+        return [word.decode(self.encoding, 'replace') for word in words]
+
+    def close(self):
+        if self.size:
+            self.data.close()
+        self.fileobj.close()
+
+def foldkey(word):
+    """Returns case folded key of word given as UTF-8 bytes."""
+    if word.isascii():
+        return word.lower()
+    return word.decode('utf-8', 'surrogateescape').lower().encode(
+        'utf-8', 'surrogateescape')
+
+class CompactIndex:
+    """Index loaded into a few flat columns.
+
+    Headwords and their case folded keys are kept in two byte strings
+    with array offsets, definition starts and sizes in array('Q')
+    columns.  The order column sorts entries by folded key, so both
+    exact and case insensitive prefix lookups are binary searches.
+    This takes much less memory than a dictionary of lists."""
+
+    def __init__(self, filename, encoding = 'utf-8', job = None):
+        self.encoding = encoding
+        fd = open(filename, "rb")
+        try:
+            data = fd.read().replace(b"\r\n", b"\n")
+        finally:
+            fd.close()
+        if job:
+            job.update(1, 4)
+
+        lines = data.split(b"\n")
+        del data
+        if lines and not lines[-1]:
+            lines.pop()
+        tabs = set(map(bytes.count, lines,
+                       itertools.repeat(b"\t", len(lines))))
+        if tabs - set([2, 3]):
+            raise ValueError("Dict index line without 3 or 4 fields in %s" \
+                             % filename)
+        if 3 in tabs:
+            # Optional 4th field holds the headword as it is displayed.
+            # It is not used, like by the index read into memory.
+            lines = [line.rsplit(b"\t", 1)[0] if line.count(b"\t") == 3 \
+                     else line for line in lines]
+
+        # Every line has 3 fields, so columns are slices of all fields
+        fields = b"\t".join(lines).split(b"\t")
+        del lines
+        headwords = fields[0::3]
+        starts = b64_decode_column(fields[1::3])
+        sizes = b64_decode_column(fields[2::3])
+        del fields
+        if job:
+            job.update(2, 4)
+
+        folded = foldkey(b"\n".join(headwords)).split(b"\n")
+        # Columns stay in file order, order lists entries sorted by
+        # folded key.  Sorting is stable, so equal keys keep file order.
+        self.order = array('I', sorted(range(len(headwords)),
+                                       key = folded.__getitem__))
+        if job:
+            job.update(3, 4)
+
+        self.keys, self.keyoffsets = self._pack(headwords)
+        if folded == headwords:
+            # Nothing to fold, share the column
+            self.folded, self.foldedoffsets = self.keys, self.keyoffsets
+        else:
+            self.folded, self.foldedoffsets = self._pack(folded)
+        self.starts = starts
+        self.sizes = sizes
+
+    def _pack(self, words):
+        offsets = array('I', [0])
+        offsets.extend(itertools.accumulate(map(len, words)))
+        return b"".join(words), offsets
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __getitem__(self, i):
+        """Returns folded key of i-th entry in sorted order, used by
+        bisect."""
+        i = self.order[i]
+        return self.folded[self.foldedoffsets[i]:self.foldedoffsets[i + 1]]
+
+    def _key(self, i):
+        return self.keys[self.keyoffsets[i]:self.keyoffsets[i + 1]]
+
+    def _range(self, folded, prefix = 0):
+        """Returns range of entries with folded key, or starting with
+        it if prefix is true."""
+        first = bisect.bisect_left(self, folded)
+        if prefix:
+            # 0xFF never appears in UTF-8, so it sorts after every key
+            # having our key as a prefix
+            last = bisect.bisect_left(self, folded + b"\xff", first)
+        else:
+            last = bisect.bisect_right(self, folded, first)
+        return first, last
+
+    def get(self, word):
+        """Returns list of [start, size] entries of word."""
+        encoded = word.encode(self.encoding, 'surrogateescape')
+        first, last = self._range(foldkey(encoded))
+        return [[self.starts[i], self.sizes[i]] \
+                for i in self.order[first:last] if self._key(i) == encoded]
+
+    def has(self, word):
+        return len(self.get(word)) > 0
+
+    def caseless(self, word):
+        """Returns headwords equal to word ignoring case."""
+        return self._words(*self._range(foldkey(word.encode(
+            self.encoding, 'surrogateescape'))))
+
+    def prefix(self, prefix):
+        """Returns headwords starting with prefix ignoring case, in
+        folded key order."""
+        return self._words(*self._range(foldkey(prefix.encode(
+            self.encoding, 'surrogateescape')), 1))
+
+    def _words(self, first, last):
+        """Returns distinct headwords of entries in sorted range."""
+        words = {}
+        for i in self.order[first:last]:
+            words[self._key(i)] = None
+        return [word.decode(self.encoding, 'surrogateescape') \
+                for word in words]
+
+    def words(self):
+        """Returns list of all headwords in file order."""
+        words = dict.fromkeys(self.keys[self.keyoffsets[i]:
+                                        self.keyoffsets[i + 1]] \
+                              for i in range(len(self)))
+        return [word.decode(self.encoding, 'surrogateescape') \
+                for word in words]
+
+# gzip header flags
+FTEXT, FHCRC, FEXTRA, FNAME, FCOMMENT = 1, 2, 4, 8, 16
+
+class ChunkCache:
+    """LRU cache of decompressed dictzip chunks limited by total size.
+
+    Keys are (file identity, chunk number) tuples, so one cache can be
+    shared by all open files.  hits, misses and evictions count cache
+    use since creation or the last resetstats() call."""
+
+    def __init__(self, budget):
+        """budget is the maximum size of cached data in bytes."""
+        self.budget = budget
+        self.size = 0
+        self.chunks = OrderedDict()
+        self.lock = threading.Lock()
+        self.resetstats()
+
+    def get(self, key):
+        """Return cached data or None."""
+        with self.lock:
+            data = self.chunks.get(key)
+            if data is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.chunks.move_to_end(key)
+            return data
+
+    def put(self, key, data):
+        """Add data to the cache, dropping least recently used chunks
+        to stay within the budget."""
+        with self.lock:
+            if key in self.chunks:
+                self.size -= len(self.chunks.pop(key))
+            if len(data) > self.budget:
+                return
+            self.chunks[key] = data
+            self.size += len(data)
+            self._shrink()
+
+    def setbudget(self, budget):
+        """Change the maximum size of cached data."""
+        with self.lock:
+            self.budget = budget
+            self._shrink()
+
+    def _shrink(self):
+        while self.size > self.budget:
+            key, data = self.chunks.popitem(last = False)
+            self.size -= len(data)
+            self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.chunks.clear()
+            self.size = 0
+
+    def resetstats(self):
+        self.hits = self.misses = self.evictions = 0
+
+    def getstats(self):
+        """Return dictionary of cache counters and sizes."""
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'evictions': self.evictions, 'chunks': len(self.chunks),
+                    'size': self.size, 'budget': self.budget}
+
+# Default budget of the shared chunk cache
+CHUNK_CACHE_SIZE = 8 * 1024 * 1024
+
+# Cache shared by all DictzipFile objects unless given other one
+chunkcache = ChunkCache(CHUNK_CACHE_SIZE)
+
+class DictzipFile:
+    """Read-only file object for dictzip files.
+
+    dictzip is gzip compressed in chunks of fixed uncompressed size.
+    The sizes of compressed chunks are stored in the RA subfield of the
+    gzip header, so any range can be read by inflating only the chunks
+    covering it.  Use opendictzip() to open files which may be plain
+    gzip files too."""
+
+    def __init__(self, filename, cache = None):
+        """Open the file and read its chunk table.  ValueError is
+        raised if the file is not a dictzip file.
+
+        Decompressed chunks are kept in cache, the shared chunkcache
+        by default."""
+        self.fileobj = open(filename, "rb")
+        try:
+            self._readheader()
+        except:
+            self.fileobj.close()
+            raise
+        self.pos = 0
+        if cache is None:
+            cache = chunkcache
+        self.cache = cache
+
+        # Changed file gets new identity, so its old chunks are not used
+        st = os.fstat(self.fileobj.fileno())
+        self.identity = (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+
+    def _readheader(self):
+        """Parse the gzip header, fill in chunk length and offsets."""
+        header = self.fileobj.read(10)
+        if len(header) < 10 or header[:3] != b"\x1f\x8b\x08":
+            raise ValueError("%s is not a gzip file" % self.fileobj.name)
+        flags = header[3]
+        if not flags & FEXTRA:
+            raise ValueError("%s has no dictzip header" % self.fileobj.name)
+
+        xlen, = struct.unpack("<H", self.fileobj.read(2))
+        extra = self.fileobj.read(xlen)
+        sizes = None
+        pos = 0
+        while pos + 4 <= len(extra):
+            subfield = extra[pos:pos + 2]
+            length, = struct.unpack("<H", extra[pos + 2:pos + 4])
+            data = extra[pos + 4:pos + 4 + length]
+            pos += 4 + length
+            if subfield == b"RA" and len(data) >= 6:
+                version, chunklen, chunkcount = struct.unpack("<HHH",
+                                                              data[:6])
+                if version != 1 or len(data) < 6 + 2 * chunkcount:
+                    raise ValueError("Unsupported dictzip header in %s" \
+                                     % self.fileobj.name)
+                sizes = struct.unpack("<%dH" % chunkcount,
+                                      data[6:6 + 2 * chunkcount])
+        if sizes is None:
+            raise ValueError("%s has no dictzip header" % self.fileobj.name)
+
+        if flags & FNAME:
+            self._skipstring()
+        if flags & FCOMMENT:
+            self._skipstring()
+        if flags & FHCRC:
+            self.fileobj.read(2)
+
+        # Compressed chunk i is at offsets[i]:offsets[i + 1]
+        self.chunklen = chunklen
+        self.offsets = [self.fileobj.tell()]
+        for size in sizes:
+            self.offsets.append(self.offsets[-1] + size)
+
+        # Uncompressed size is stored in the gzip trailer (modulo 2**32)
+        self.fileobj.seek(-4, 2)
+        isize, = struct.unpack("<I", self.fileobj.read(4))
+        full = max(len(sizes) - 1, 0) * chunklen
+        self.size = full + (isize - full) % (1 << 32)
+
+    def _skipstring(self):
+        """Skip zero terminated header field."""
+        while self.fileobj.read(1) not in (b"\0", b""):
+            pass
+
+    def _readchunk(self, chunk):
+        """Return uncompressed data of a chunk."""
+        key = (self.identity, chunk)
+        data = self.cache.get(key)
+        if data is not None:
+            return data
+        self.fileobj.seek(self.offsets[chunk])
+        data = self.fileobj.read(self.offsets[chunk + 1] - self.offsets[chunk])
+        # Chunks are flushed with Z_FULL_FLUSH, so each one inflates
+        # as a raw deflate stream on its own
+        data = zlib.decompressobj(-zlib.MAX_WBITS).decompress(data)
+        self.cache.put(key, data)
+        return data
+
+    def seek(self, offset, whence = 0):
+        if whence == 1:
+            offset += self.pos
+        elif whence == 2:
+            offset += self.size
+        self.pos = max(offset, 0)
+        return self.pos
+
+    def tell(self):
+        return self.pos
+
+    def read(self, size = -1):
+        """Read up to size uncompressed bytes from current position."""
+        if size < 0 or self.pos + size > self.size:
+            size = max(self.size - self.pos, 0)
+        parts = []
+        while size > 0:
+            chunk, skip = divmod(self.pos, self.chunklen)
+            data = self._readchunk(chunk)[skip:skip + size]
+            if not data:
+                break
+            parts.append(data)
+            self.pos += len(data)
+            size -= len(data)
+        return b"".join(parts)
+
+    def close(self):
+        self.fileobj.close()
+
+# Uncompressed chunk length used by dictzip, compressed chunks of this
+# size always fit the 16 bit sizes of the RA table
+DICTZIP_CHUNK_LEN = 58315
+
+# Chunk table must fit the 16 bit extra field length with its headers
+DICTZIP_MAX_CHUNKS = (0xffff - 10) // 2
+
+def _compresschunk(chunk):
+    """Compresses one chunk as a raw deflate stream ending at a byte
+    boundary.  Chunks compressed separately form a valid stream when
+    concatenated, like the full flushes dictzip does."""
+    data, last = chunk
+    compressor = zlib.compressobj(9, zlib.DEFLATED, -zlib.MAX_WBITS)
+    if last:
+        return compressor.compress(data) + compressor.flush(zlib.Z_FINISH)
+    return compressor.compress(data) + compressor.flush(zlib.Z_FULL_FLUSH)
+
+def _readchunks(fileobj, size, chunklen, crc):
+    """Yields (data, last) tuples of chunks read.  Each chunk is added
+    to the checksum in crc[0] before it is handed to the workers."""
+    pos = 0
+    while pos < size or pos == 0:
+        data = fileobj.read(chunklen)
+        pos += len(data)
+        crc[0] = zlib.crc32(data, crc[0])
+        yield (data, pos >= size)
+        if not data:
+            break
+
+def writedictzip(source, dest, chunklen = DICTZIP_CHUNK_LEN,
+                 processes = None):
+    """Compresses file source to dictzip file dest.
+
+    Chunks are compressed in a pool of processes, one per CPU by
+    default.  The output is a gzip file readable by any gzip tool,
+    by dictd and by DictzipFile."""
+    if not 0 < chunklen <= DICTZIP_CHUNK_LEN:
+        raise ValueError("Chunk length must be 1 to %d" % DICTZIP_CHUNK_LEN)
+    st = os.stat(source)
+    size = st.st_size
+    chunkcount = max((size + chunklen - 1) // chunklen, 1)
+    if chunkcount > DICTZIP_MAX_CHUNKS:
+        raise ValueError("%s is too large for dictzip" % source)
+
+    name = os.path.basename(source).encode('latin-1', 'replace')
+    ralen = 6 + 2 * chunkcount
+    header = b"\x1f\x8b\x08" + bytes([FEXTRA | FNAME]) \
+             + struct.pack("<I", int(st.st_mtime) & 0xffffffff) \
+             + b"\x02\x03" + struct.pack("<H", ralen + 4) \
+             + b"RA" + struct.pack("<HHHH", ralen, 1, chunklen, chunkcount)
+    tablepos = len(header)
+
+    infile = open(source, "rb")
+    outfile = open(dest, "wb")
+    pool = None
+    try:
+        outfile.write(header)
+        # Sizes are filled in when chunks are written
+        outfile.write(b"\0" * (2 * chunkcount))
+        outfile.write(name + b"\0")
+
+        if processes is None:
+            processes = os.cpu_count() or 1
+        crc = [0]
+        chunks = _readchunks(infile, size, chunklen, crc)
+        if processes > 1 and chunkcount > 1:
+            # Not forked, the caller may be a threaded GUI process
+            pool = multiprocessing.get_context('spawn').Pool(processes)
+            compressed = pool.imap(_compresschunk, chunks, 4)
+        else:
+            compressed = map(_compresschunk, chunks)
+
+        sizes = []
+        for data in compressed:
+            outfile.write(data)
+            sizes.append(len(data))
+
+        if len(sizes) != chunkcount or max(sizes) > 0xffff:
+            raise ValueError("%s changed while compressing" % source)
+        outfile.write(struct.pack("<II", crc[0], size & 0xffffffff))
+        outfile.seek(tablepos)
+        outfile.write(struct.pack("<%dH" % len(sizes), *sizes))
+    finally:
+        if pool:
+            pool.terminate()
+            pool.join()
+        infile.close()
+        outfile.close()
+
+def compressdict(filename, chunklen = DICTZIP_CHUNK_LEN, processes = None):
+    """Replaces file with its dictzip compressed version with .dz
+    extension added.  Returns name of the new file."""
+    dest = filename + ".dz"
+    temp = dest + ".tmp"
+    try:
+        writedictzip(filename, temp, chunklen, processes)
+        os.replace(temp, dest)
+    except:
+        if os.path.exists(temp):
+            os.remove(temp)
+        raise
+    os.remove(filename)
+    return dest
+
+def opendictzip(filename):
+    """Open compressed dictionary file for reading.  Returns
+    DictzipFile if the file has a dictzip chunk table, GzipFile
+    otherwise."""
+    try:
+        return DictzipFile(filename)
+    except ValueError:
+        return gzip.GzipFile(filename, "rb")
+
+def finishvacuum(basename, cleanup = 0):
+    """Puts files written by DictDB.vacuum() in place.
+
+    vacuum() writes basename.dict.new, then basename.index.new, and
+    renames both over the old files.  The pair can not be renamed at
+    once, so if basename.index.new exists, the new files are complete
+    and the renames left undone by a crash are finished here.  Without
+    it, a leftover basename.dict.new is incomplete; it is removed if
+    cleanup is true.  DictDB calls this before opening basename."""
+    dictname = basename + ".dict"
+    indexname = basename + ".index"
+    try:
+        if os.path.exists(indexname + ".new"):
+            if os.path.exists(dictname + ".new"):
+                os.replace(dictname + ".new", dictname)
+            os.replace(indexname + ".new", indexname)
+        elif cleanup:
+            for temp in (dictname + ".new", indexname + ".tmp"):
+                if os.path.exists(temp):
+                    os.remove(temp)
+    except FileNotFoundError:
+        # Finished by another DictDB meanwhile
+        pass
 
 class DictDB:
-    def __init__(self, basename, mode = 'read', quiet = 0):
+    def __init__(self, basename, mode = 'read', quiet = 0, job = None,
+                 lazy = 0, compact = 0):
         #, url = 'unknown', shortname = 'unknown',
         #         longinfo = 'unknown', quiet = 0):
         """Initialize a DictDB object.
@@ -87,7 +886,8 @@ class DictDB:
         read -- read-only access
 
         write -- write-only access, truncates existing files, does not work
-        with .dz.  dict created if nonexistant.
+        with .dz.  dict created if nonexistant.  It can be compressed to
+        .dz by finish().
 
         update -- read/write access, dict created if nonexistant.  Does not
         work with .dz.
@@ -96,15 +896,29 @@ class DictDB:
         with dict.dz files.
         
         If quiet is nonzero, status messages
-        will be suppressed."""
+        will be suppressed.
+
+        job is optional.  If given, index loading progress is reported
+        through its update(processed, total) method, which may raise an
+        exception to cancel loading.
+
+        If lazy is nonzero in read mode, the index is not loaded but
+        searched in the mapped index file, see MappedIndex.  If compact
+        is nonzero in read mode, the index is loaded into CompactIndex
+        instead of indexentries."""
 
         self.mode = mode
         self.quiet = quiet
+        self.lazy = lazy and mode == 'read'
+        self.compact = compact and mode == 'read' and not self.lazy
+        # MappedIndex or CompactIndex, indexentries are used if None
+        self.searchindex = None
         self.indexentries = {}
         self.count = 0
         self.basename = basename
 
         self.indexfilename = self.basename + ".index"
+        finishvacuum(self.basename, mode != 'read')
         if os.path.isfile(self.basename + ".dict.dz"):
             self.dictfilename = self.basename + ".dict.dz"
             self.usecompression = 1
@@ -113,18 +927,23 @@ class DictDB:
             self.usecompression = 0
 
         if mode == 'read':
-            self.indexfile = open(self.indexfilename, "rt")
+            if self.lazy:
+                self.searchindex = MappedIndex(self.indexfilename)
+            elif self.compact:
+                self.searchindex = CompactIndex(self.indexfilename, job = job)
+            else:
+                self.indexfile = open(self.indexfilename, "rt")
             if self.usecompression:
-                self.dictfile = gzip.GzipFile(self.dictfilename, "rb")
+                self.dictfile = opendictzip(self.dictfilename)
             else:
                 self.dictfile = open(self.dictfilename, "rb")
-            self._initindex()
+            if not self.searchindex:
+                self._initindex(job)
         elif mode == 'write':
-            self.indexfile = open(self.indexfilename, "wt")
             if self.usecompression:
                 raise ValueError("'write' mode incompatible with .dz files")
-            else:
-                self.dictfile = open(self.dictfilename, "wb")
+            self.indexfile = open(self.indexfilename, "wb")
+            self.dictfile = open(self.dictfilename, "wb")
         elif mode == 'update':
             try:
                 self.indexfile = open(self.indexfilename, "r+b")
@@ -132,13 +951,13 @@ class DictDB:
                 self.indexfile = open(self.indexfilename, "w+b")
             if self.usecompression:
                 # Open it read-only since we don't support mods.
-                self.dictfile = gzip.GzipFile(self.dictfilename, "rb")
+                self.dictfile = opendictzip(self.dictfilename)
             else:
                 try:
                     self.dictfile = open(self.dictfilename, "r+b")
                 except IOError:
                     self.dictfile = open(self.dictfilename, "w+b")
-            self._initindex()
+            self._initindex(job)
         else:
             raise ValueError("mode must be 'read', 'write', or 'update'")
 
@@ -147,10 +966,21 @@ class DictDB:
         #                [short_headword])
         #self.writeentry(info_headword + "\n" + longinfo, [info_headword])
 
-    def _initindex(self):
+    def _initindex(self, job = None):
         """Load the entire index off disk into memory."""
         self.indexfile.seek(0)
+        total = os.path.getsize(self.indexfilename)
+        processed = 0
+        linenum = 0
         for line in self.indexfile:
+            if job:
+                processed += len(line)
+                linenum += 1
+                if linenum % 10000 == 0:
+                    job.update(processed, total)
+            if isinstance(line, bytes):
+                # Index is opened in binary mode for updating
+                line = line.decode(ENCODING)
             splits = line.rstrip().split("\t")
             if splits[0] not in self.indexentries:
                 self.indexentries[splits[0]] = []
@@ -233,6 +1063,8 @@ class DictDB:
         self.dictfile.seek(0, 2)        # Seek to end of file
         start = self.dictfile.tell()
         defstr += "\n"
+        if isinstance(defstr, str):
+            defstr = defstr.encode(ENCODING)
         self.dictfile.write(defstr)
         for word in headwords:
             self.addindexentry(word, start, len(defstr))
@@ -241,91 +1073,258 @@ class DictDB:
         if self.count % 1000 == 0:
             self.update("Processed %d records\r" % self.count)
 
-    def finish(self, dosort = 1):
+    def finish(self, dosort = 1, compress = 0):
         """Called to finish the writing process.
         **REQUIRED IF OPENED WITH 'update' OR 'write' MODES**.
         This will write the index and close the files.
 
         dosort is optional and defaults to true.  If set to false,
         dictlib will not sort the index file.  In this case, you
-        MUST manually sort it through "sort -df" before it can be used."""
+        MUST manually sort it through "sort -df" before it can be used.
+
+        If compress is nonzero, the .dict file is replaced by a
+        dictzip compressed .dict.dz file."""
 
         self.update("Processed %d records.\n" % self.count)
 
-        if dosort:
-            self.update("Sorting index: converting")
+        self.indexfile.seek(0)
+        self._writeindex(self.indexfile, dosort)
 
-            indexlist = []
-            for word, defs in list(self.indexentries.items()):
-                for thisdef in defs:
-                    indexlist.append("%s\t%s\t%s" % (word,
-                                                     b64_encode(thisdef[0]),
-                                                     b64_encode(thisdef[1])))
-
-            self.update(" mapping")
-                
-            sortmap = {}
-            for entry in indexlist:
-                norm = sortnormalize(entry)
-                if norm in sortmap:
-                    sortmap[norm].append(entry)
-                    sortmap[norm].sort(sortfunc)
-                else:
-                    sortmap[norm] = [entry]
-
-            self.update(" listing")
-                
-            normalizedentries = list(sortmap.keys())
-
-            self.update(" sorting")
-
-            normalizedentries.sort()
-
-            self.update(" re-mapping")
-            indexlist = []
+        if self.mode == 'update':
+            # In case things were deleted
+            self.indexfile.truncate()
+        self.indexfile.close()
+        self.dictfile.close()
 
-            for normentry in normalizedentries:
-                for entry in sortmap[normentry]:
-                    indexlist.append(entry)
+        if compress and not self.usecompression:
+            self.update("Compressing...\n")
+            compressdict(self.dictfilename)
 
-            self.update(", done.\n")
+        self.update("Complete.\n")
+
+    def _writeindex(self, fileobj, dosort = 1, entries = None):
+        """Writes index entries to fileobj, sorted if dosort is true.
+        entries default to indexentries."""
+        if entries is None:
+            entries = self.indexentries
+        if dosort:
+            self.update("Sorting index...\n")
+            indexlist = IndexSorter()
+        else:
+            indexlist = []
+
+        for word, defs in list(entries.items()):
+            for thisdef in defs:
+                indexlist.append(("%s\t%s\t%s" % (word,
+                                                  b64_encode(thisdef[0]),
+                                                  b64_encode(thisdef[1]))) \
+                                 .encode(ENCODING))
 
         self.update("Writing index...\n")
 
-        self.indexfile.seek(0)
-            
         for entry in indexlist:
-            self.indexfile.write(entry + "\n")
+            fileobj.write(entry + b"\n")
+
+        if dosort:
+            indexlist.close()
+
+    def vacuum(self):
+        """Compacts a database opened in 'update' mode.
+
+        Deleted and replaced definitions stay in the .dict file, as
+        delindexentry() and addentry() never remove data.  This
+        rewrites the .dict file with live definitions only, in index
+        order, so neighbouring headwords are read from neighbouring
+        places.  Definitions shared by several headwords are written
+        once.  The new .dict and .index files are written to temporary
+        files and renamed over the old ones, see finishvacuum().
+
+        Returns the number of bytes reclaimed."""
+        if self.mode != 'update' or self.usecompression:
+            raise ValueError("vacuum needs uncompressed database " \
+                             "opened in 'update' mode")
+
+        self.dictfile.flush()
+        oldsize = os.path.getsize(self.dictfilename)
+        dicttemp = self.dictfilename + ".new"
+        indextemp = self.indexfilename + ".tmp"
+
+        self.update("Compacting definitions...\n")
+        words = sorted(self.indexentries,
+                       key = lambda word: sortkey(word.encode(ENCODING)))
+        entries = {}
+        moved = {}
+        try:
+            out = open(dicttemp, "wb")
+            try:
+                for word in words:
+                    entries[word] = []
+                    for start, size in self.indexentries[word]:
+                        if (start, size) not in moved:
+                            self.dictfile.seek(start)
+                            moved[(start, size)] = out.tell()
+                            out.write(self.dictfile.read(size))
+                        entries[word].append([moved[(start, size)], size])
+                newsize = out.tell()
+                out.flush()
+                os.fsync(out.fileno())
+            finally:
+                out.close()
+
+            out = open(indextemp, "wb")
+            try:
+                self._writeindex(out, entries = entries)
+                out.flush()
+                os.fsync(out.fileno())
+            finally:
+                out.close()
+        except:
+            for temp in (dicttemp, indextemp):
+                if os.path.exists(temp):
+                    os.remove(temp)
+            raise
 
-        if self.mode == 'update':
-            # In case things were deleted
-            self.indexfile.truncate()
-        self.indexfile.close()
         self.dictfile.close()
+        self.indexfile.close()
+        # Both new files are complete once the index is renamed
+        os.replace(indextemp, self.indexfilename + ".new")
+        finishvacuum(self.basename)
+        self.indexentries = entries
+        self.dictfile = open(self.dictfilename, "r+b")
+        self.indexfile = open(self.indexfilename, "r+b")
 
-        self.update("Complete.\n")
+        self.update("Reclaimed %d bytes.\n" % (oldsize - newsize))
+        return oldsize - newsize
+
+    def close(self):
+        """Closes files opened in read mode."""
+        if self.lazy:
+            self.searchindex.close()
+        elif not self.compact:
+            self.indexfile.close()
+        self.dictfile.close()
 
     def getdeflist(self):
         """Returns a list of strings naming all definitions contained
         in this dictionary."""
+        if self.searchindex:
+            return self.searchindex.words()
         return list(self.indexentries.keys())
 
     def hasdef(self, word):
+        if self.searchindex:
+            return self.searchindex.has(word)
         return word in self.indexentries
 
+    def getprefix(self, prefix):
+        """Returns a list of definition names starting with prefix,
+        ignoring case, sorted by case folded name."""
+        if self.searchindex:
+            return self.searchindex.prefix(prefix)
+        prefix = prefix.lower()
+        return sorted([word for word in self.indexentries \
+                       if word.lower().startswith(prefix)], key = str.lower)
+
+    def getcaseless(self, word):
+        """Returns a list of definition names equal to word, ignoring
+        case."""
+        if self.searchindex:
+            return self.searchindex.caseless(word)
+        word = word.lower()
+        return [other for other in self.indexentries \
+                if other.lower() == word]
+
     def getdef(self, word):
         """Given a definition name, returns a list of strings with all
         matching definitions.  This is an *exact* match, not a
         case-insensitive one.  Returns [] if word is not in the dictionary."""
         retval = []
-        if not self.hasdef(word):
+        if self.searchindex:
+            entries = self.searchindex.get(word)
+        elif self.hasdef(word):
+            entries = self.indexentries[word]
+        else:
             return retval
-        for start, length in self.indexentries[word]:
+        for start, length in entries:
             self.dictfile.seek(start)
             retval.append(self.dictfile.read(length))
         return retval
             
 
+class DictCompiler:
+    """Writes .dict and .index files of any size with bounded memory.
+
+    Unlike DictDB in write mode, the index is not kept in memory.
+    Definitions are streamed to the .dict file and index lines are
+    sorted by IndexSorter, spilling to temporary files in tempdir."""
+
+    def __init__(self, basename, quiet = 0, runsize = SORT_RUN_SIZE,
+                 tempdir = None):
+        """Creates basename.dict, basename.index is written by
+        finish().  If quiet is nonzero, status messages are
+        suppressed."""
+        self.basename = basename
+        self.quiet = quiet
+        self.count = 0
+        self.sorter = IndexSorter(runsize, tempdir)
+        self.dictfile = open(basename + ".dict", "wb")
+
+    def update(self, string):
+        """Writes string out, if not quiet."""
+        if not self.quiet:
+            sys.stdout.write(string)
+            sys.stdout.flush()
+
+    def seturl(self, url):
+        self.addentry(url_headword + "\n     " + url, [url_headword])
+
+    def setshortname(self, shortname):
+        self.addentry(short_headword + "\n     " + shortname,
+                      [short_headword])
+
+    def setlonginfo(self, longinfo):
+        self.addentry(info_headword + "\n" + longinfo, [info_headword])
+
+    def addentry(self, defstr, headwords):
+        """Writes an entry.  defstr holds the content of the definition.
+        headwords is a list specifying one or more words under which this
+        definition should be indexed.  This function always adds \\n
+        to the end of defstr."""
+        start = self.dictfile.tell()
+        defstr += "\n"
+        if isinstance(defstr, str):
+            defstr = defstr.encode(ENCODING)
+        self.dictfile.write(defstr)
+        location = ("\t%s\t%s" % (b64_encode(start),
+                                  b64_encode(len(defstr)))).encode(ENCODING)
+        for word in headwords:
+            self.sorter.append(word.encode(ENCODING) + location)
+            self.count += 1
+
+        if self.count % 1000 == 0:
+            self.update("Processed %d records\r" % self.count)
+
+    def finish(self, compress = 0):
+        """Writes the sorted index and closes the files.  **REQUIRED**.
+        If compress is nonzero, the .dict file is replaced by a dictzip
+        compressed .dict.dz file."""
+        self.update("Processed %d records.\n" % self.count)
+        self.dictfile.close()
+        if compress:
+            self.update("Compressing...\n")
+            compressdict(self.basename + ".dict")
+
+        self.update("Sorting and writing index...\n")
+        indexfile = open(self.basename + ".index", "wb")
+        try:
+            for line in self.sorter:
+                indexfile.write(line + b"\n")
+        finally:
+            indexfile.close()
+            self.sorter.close()
+
+        self.update("Complete.\n")
+
 class DictReader:
     """This object provides compatibility with earlier versions
     of dictdlib.  It is now deprecated."""
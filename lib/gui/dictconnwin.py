@@ -25,10 +25,12 @@ from wx.lib.rcsizer import RowColSizer
 import traceback
 
 from lib.logger import systemLog, debugLog, DEBUG, INFO, WARNING, ERROR
-from lib.parser import DictConnection
+from lib.parser import DictConnection, WORD_LIST_STRATEGY
 from lib.extra import dictclient
-from lib.threads import Process
+from lib.extra import aiodictclient
+from lib.threads import Process, Job
 from lib.gui import errorwin
+from lib import servermeta
 from lib import misc
 
 _ = wx.GetTranslation
@@ -112,17 +114,19 @@ class DictConnWindow(wx.Frame):
 
       hboxServer.Add(self.entryEncoding, flag=wx.EXPAND, row=3, col=1, border=1)
 
-      #hboxServer.Add(wx.StaticText(self, -1, _("Strategy: ")),
-      #               flag=wx.ALIGN_RIGHT | wx.ALIGN_CENTER_VERTICAL,
-      #               row=3, col=0, rowspan=1, border=1)
       #
-      #self.choiceStrat = wx.ComboBox(self, 1006, #size=(-1, 20),
-      #                         choices=[])
-      #hboxServer.Add(self.choiceStrat, flag=wx.EXPAND, row=3, col=1,
-      #               rowspan=1, border=1)
+      # Word list strategy row, filled from server metadata
       #
-      #hboxServer.Add(wx.Button(self, 1007, _("Update")), #size=(-1, 18)),
-      #               flag=wx.EXPAND, row=3, col=2, border=5)
+      hboxServer.Add(wx.StaticText(self, -1, _("Word list: ")),
+                     flag=wx.ALIGN_RIGHT | wx.ALIGN_CENTER_VERTICAL,
+                     row=4, col=0, border=1)
+
+      self.msgDefaultStrategy = _("Match prefixes")
+      self.choiceStrat = wx.ComboBox(self, 1008, self.msgDefaultStrategy,
+                                     choices=[self.msgDefaultStrategy],
+                                     style=wx.CB_READONLY)
+      hboxServer.Add(self.choiceStrat, flag=wx.EXPAND, row=4, col=1,
+                     border=1)
 
       hboxServer.AddGrowableCol(1)
 
@@ -147,39 +151,103 @@ class DictConnWindow(wx.Frame):
 
       self.update = None
       self.connection = None
+      self.metadata = None
 
       self.Bind(wx.EVT_BUTTON, self.onDefaultServer, id=1000)
       self.Bind(wx.EVT_BUTTON, self.onDefaultPort, id=1001)
       self.Bind(wx.EVT_BUTTON, self.onUpdateDB, id=1003)
-      self.Bind(wx.EVT_BUTTON, self.onUpdateStrats, id=1007)
       self.Bind(wx.EVT_BUTTON, self.onOK, id=1004)
       self.Bind(wx.EVT_BUTTON, self.onCancel, id=1005)
       self.Bind(wx.EVT_TIMER, self.onTimerUpdateDB, id=1006)
       self.Bind(wx.EVT_TIMER, self.onTimerConnect, id=1007)
 
+      # Known servers get their database list without connecting
+      self.loadCachedMetadata()
+
+
+   def getServerPort(self):
+      """Return (server, port) entered, None if port is invalid"""
+
+      try:
+         return (self.entryServer.GetValue(), int(self.entryPort.GetValue()))
+      except ValueError:
+         return None
+
+
+   def loadCachedMetadata(self):
+      """Show database list of entered server from metadata cache.
+      Return True if it was cached."""
+
+      serverPort = self.getServerPort()
+      if serverPort is None:
+         return False
+
+      metadata = servermeta.loadMetadata(
+         servermeta.getMetadataPath(*serverPort))
+      if metadata is None:
+         return False
+
+      self.showMetadata(serverPort, metadata)
+      return True
+
+
+   def showMetadata(self, serverPort, metadata):
+      """Fill database and strategy lists from server metadata"""
+
+      self.metadata = (serverPort, metadata)
+
+      databases = metadata['databases']
+      self.choiceDB.Clear()
+      self.choiceDB.Append(self.msgSearchInAll)
+      for name in list(databases.values()):
+         self.choiceDB.Append(name)
+      self.choiceDB.SetValue(self.msgSearchInAll)
+      self.choiceDB.SetInsertionPoint(0)
+
+      strategies = metadata['strategies']
+      self.choiceStrat.Clear()
+      for name in sorted(strategies):
+         self.choiceStrat.Append(strategies[name])
+      if WORD_LIST_STRATEGY in strategies:
+         self.choiceStrat.SetValue(strategies[WORD_LIST_STRATEGY])
+      elif strategies:
+         self.choiceStrat.SetSelection(0)
+
+
+   def getStrategy(self):
+      """Return name of word list strategy chosen, empty string for
+      the default one"""
+
+      if not self.metadata \
+             or self.metadata[0] != (self.server, int(self.port)):
+         return ""
+
+      strategies = self.metadata[1]['strategies']
+      chosen = self.choiceStrat.GetValue()
+      for name in strategies:
+         if strategies[name] == chosen:
+            return name
+      return ""
+
 
    def onTimerUpdateDB(self, event):
       
       systemLog(DEBUG, "DictConnection: [IDLE] Receiving DB list...")
       if self.update != None:
-         if self.update.isDone():
-            systemLog(DEBUG, "DictConnection: DB list received")
-            obj = self.update()
-            if type(obj) == type({}):
-               self.timerUpdateDB.Stop()
-               self.update = None
-               self.choiceDB.Clear()
-               self.choiceDB.Append(self.msgSearchInAll)
-               for name in list(obj.values()):
-                  self.choiceDB.Append(name)
+         job, serverPort, cached = self.update
+         if job.isDone():
+            self.timerUpdateDB.Stop()
+            self.update = None
+            metadata = job.getResult()
+            if metadata is not None:
+               systemLog(DEBUG, "DictConnection: DB list received")
+               self.showMetadata(serverPort, metadata)
                self.SetStatusText(_("Done"))
-               self.choiceDB.SetValue(self.msgSearchInAll)
-               self.choiceDB.SetInsertionPoint(0)
-            elif obj != None:
-               self.SetStatusText(_("Receiving database list..."))
-               self.update = Process(obj.getdbdescs)
+            elif cached:
+               systemLog(WARNING, "DictConnection: Unable to update DB " \
+                         "list: %s" % job.getError())
+               self.SetStatusText(_("Unable to connect to server"))
             else:
-               self.timerUpdateDB.Stop()
                self.SetStatusText('')
                title = _("Connection Error")
                msg = _("Unable to connect to server")
@@ -215,20 +283,19 @@ class DictConnWindow(wx.Frame):
 
 
    def onUpdateDB(self, event):
-      
-      self.SetStatusText(_("Connecting..."))
-      self.timerUpdateDB.Start(CONNECTION_CHECK_INTERVAL)
-      self.update = Process(dictclient.Connection,
-                                self.entryServer.GetValue(),
-                                int(self.entryPort.GetValue()))
 
-   # not used, remove
-   def onUpdateStrats(self, event):
-      conn = dictclient.Connection()
-      strats = conn.getstratdescs()
+      serverPort = self.getServerPort()
+      if serverPort is None:
+         self.SetStatusText(_("Invalid port"))
+         return
 
-      for name in list(strats.values()):
-         self.choiceStrat.Append(name)
+      # Show what is known at once, check for changes in the background
+      cached = self.loadCachedMetadata()
+
+      self.SetStatusText(_("Connecting..."))
+      self.timerUpdateDB.Start(CONNECTION_CHECK_INTERVAL)
+      self.update = (Job(servermeta.updateMetadata, *serverPort),
+                     serverPort, cached)
 
 
    # Thread is not used there, because program don't hang if can't
@@ -254,7 +321,7 @@ class DictConnWindow(wx.Frame):
       self.timerUpdateDB.Stop()
       self.SetStatusText(_("Connecting to %s...") % self.server)
       self.timerConnect.Start(CONNECTION_CHECK_INTERVAL)
-      self.connection = Process(dictclient.Connection,
+      self.connection = Process(aiodictclient.SyncConnection,
                                 self.server, int(self.port))
 
          
@@ -269,7 +336,11 @@ class DictConnWindow(wx.Frame):
          db_name = ""
       else:
          try:
-            dbs = self.conn.getdbdescs()
+            if self.metadata \
+                   and self.metadata[0] == (self.server, int(self.port)):
+               dbs = self.metadata[1]['databases']
+            else:
+               dbs = self.conn.getdbdescs()
             for d in list(dbs.keys()):
                if dbs[d] == db:
                   db = d
@@ -279,10 +350,16 @@ class DictConnWindow(wx.Frame):
             self.app.window.SetStatusText(misc.errors[4])
             return
 
+      # Searches will reuse this connection
+      aiodictclient.pool.put(self.conn)
+      self.conn = None
+
       self.app.window.onCloseDict(None)
+      mirrors = dictclient.parseservers(
+         self.app.config.get('dictServerMirrors') or '')
       self.app.window.activeDictionary = DictConnection(self.server,
                                                         int(self.port), 
-                                            db, "")
+                                            db, self.getStrategy(), mirrors)
                                             
       self.app.config.set('dict-server-encoding', self.encoding[0])
       self.parent.changeEncoding(self.encoding[1])
@@ -44,7 +44,7 @@ from lib.parser import SlowoParser
 from lib.parser import MovaParser
 from lib.parser import TMXParser
 from lib.parser import DictParser
-from lib.threads import Process
+from lib.threads import Process, Job, JobCancelled
 from lib.history import History
 from lib.installer import Installer
 from lib.extra.html2text import html2text
@@ -57,12 +57,18 @@ from lib import enc
 from lib import errortype
 from lib import dicttype
 from lib import plaindict
+from lib import searchcache
 
 _ = wx.GetTranslation
 
 # Constants
 titleTemplate = "OpenDict - %s"
 NORMAL_FONT_SIZE = '10'
+LOAD_TIMER_DELAY = 200 # miliseconds
+
+# Word list of dictionaries listing words while typing is updated when
+# no key was pressed for this long
+WORD_LIST_DELAY = 300 # miliseconds
 
 # Used to remember word when searching by entering text to the entry,
 # selecting one from the list or clicking a link.
@@ -107,7 +113,7 @@ class HtmlWindow(wx.html.HtmlWindow):
       parent.SetStatusText(_("Searching..."))
       parent.entry.SetValue(word)
       parent.timerSearch.Start(parent.delay)
-      parent.search = Process(parent.activeDictionary.search,
+      parent.search = Process(searchcache.search, parent.activeDictionary,
                               word)
 
       
@@ -447,6 +453,7 @@ class MainWindow(wx.Frame):
 
       self.timerSearch = wx.Timer(self, 5000)
       self.timerLoad = wx.Timer(self, 5001)
+      self.timerWordList = wx.Timer(self, 5002)
 
       idClipboard = wx.NewId()
       self.timerClipboard = wx.Timer(self, idClipboard)
@@ -455,6 +462,15 @@ class MainWindow(wx.Frame):
       self.search = None
       self.load = None
 
+      # Background dictionary loading jobs, {name: (dictionary, job)}
+      self.loadJobs = {}
+
+      # Word list job started while typing, (job, prefix) tuple, and
+      # the last (dictionary, prefix) listed
+      self.wordListJob = None
+      self.wordListPrefix = None
+      self.pendingDictionary = None
+
       self.SetIcon(wx.Icon(os.path.join(info.GLOBAL_HOME,
                                        "pixmaps",
                                        "icon-32x32.png"),
@@ -519,9 +535,12 @@ class MainWindow(wx.Frame):
       self.Bind(wx.EVT_BUTTON, self.onClean, id=151)
       self.Bind(wx.EVT_BUTTON, self.onHideUnhide, id=152)
       self.Bind(wx.EVT_TEXT_ENTER, self.onSearch, id=153)
+      self.Bind(wx.EVT_TEXT, self.onEntryText, id=153)
       self.Bind(wx.EVT_LISTBOX, self.onWordSelected, id=154)
       
       self.Bind(wx.EVT_TIMER, self.onTimerSearch, id=5000)
+      self.Bind(wx.EVT_TIMER, self.onTimerLoad, id=5001)
+      self.Bind(wx.EVT_TIMER, self.onTimerWordList, id=5002)
       self.Bind(wx.EVT_TIMER, self.onTimerClipboard, id=idClipboard)
       
       self.Bind(wx.EVT_CLOSE, self.onCloseWindow)
@@ -572,6 +591,19 @@ class MainWindow(wx.Frame):
 
    def onCloseWindow(self, event):
 
+      for dictInstance, job in list(self.loadJobs.values()):
+         job.stop()
+
+      systemLog(DEBUG, "Search result cache: %(hits)d hits, " \
+                "%(misses)d misses (%(storeHits)d found in store), " \
+                "%(evictions)d evictions" \
+                % searchcache.resultCache.getStats())
+
+      # Let the store finish writing results found in this run
+      if getattr(self.app, 'prewarmJob', None):
+         self.app.prewarmJob.stop()
+      searchcache.resultCache.setStore(None)
+
       self.onCloseDict(None)
       self.savePreferences()
       self.Destroy()
@@ -695,6 +727,47 @@ class MainWindow(wx.Frame):
          self.search = None
 
 
+   def onEntryText(self, event):
+      """Restart word list timer while the user types"""
+
+      if self.activeDictionary and self.activeDictionary.getListsWords() \
+             and not self.wordListHidden():
+         self.timerWordList.Start(WORD_LIST_DELAY, wx.TIMER_ONE_SHOT)
+
+
+   def onTimerWordList(self, event):
+      """Word list timer. Lists words starting with entered text once
+      typing stopped and shows them when listed"""
+
+      if self.wordListJob:
+         job, prefix = self.wordListJob
+         if not job.isDone():
+            self.timerWordList.Start(LOAD_TIMER_DELAY, wx.TIMER_ONE_SHOT)
+            return
+
+         self.wordListJob = None
+         words = job.getResult()
+         if words is not None and prefix == self.entry.GetValue().strip() \
+                and not (self.search and not self.search.isDone()):
+            self.wordList.Clear()
+            self.words = list(map(enc.toWX, words))
+            if self.words:
+               self.wordList.InsertItems(self.words, 0)
+
+      dictionary = self.activeDictionary
+      if not dictionary or not dictionary.getListsWords():
+         return
+
+      prefix = self.entry.GetValue().strip()
+      if prefix and (dictionary, prefix) != self.wordListPrefix:
+         self.wordListPrefix = (dictionary, prefix)
+         self.wordListJob = (Job(lambda word, job: \
+                                 dictionary.listWords(word),
+                                 enc.fromWX(prefix)),
+                             prefix)
+         self.timerWordList.Start(LOAD_TIMER_DELAY, wx.TIMER_ONE_SHOT)
+
+
    def onTimerClipboard(self, event):
       """Clipboard timer, used to watch new text in a clipboard"""
 
@@ -792,7 +865,8 @@ class MainWindow(wx.Frame):
 
          return
          
-      self.search = Process(self.activeDictionary.search, word)
+      self.search = Process(searchcache.search, self.activeDictionary,
+                            word)
 
 
    def onBack(self, event):
@@ -816,15 +890,16 @@ class MainWindow(wx.Frame):
       self.entry.Enable(1)
       self.SetStatusText(_("Stopped"))
       self.timerSearch.Stop()
-      self.timerLoad.Stop()
 
       if self.search:
          self.search.stop()
          self.search = None
 
       if self.load:
+         # onTimerLoad forgets the job when its thread has finished
          self.load.stop()
          self.load = None
+         self.pendingDictionary = None
 
       wx.EndBusyCursor()
       self.buttonStop.Disable()
@@ -1094,31 +1169,80 @@ class MainWindow(wx.Frame):
          else:
             self.app.agreements.addAgreement(dictInstance.getPath())
 
-      self.onCloseDict(None)
-      self.activeDictionary = dictInstance
-        
-      if dictInstance.getType() in dicttype.indexableTypes:
-         if plaindict.indexShouldBeMade(dictInstance):
-            # Notify about indexing
-            from lib.gui import errorwin
-            title = _("Dictionary Index")
-            msg = _("This is the first time you use this dictionary or it " \
-                    "has been changed on disk since last indexing. " \
-                    "Indexing is used to make search more efficient. " \
-                    "The dictionary will be indexed now. It can take a few " \
-                    "or more seconds.\n\n" \
-                    "Press OK to continue...")
-            errorwin.showInfoMessage(title, msg)
-
-            # Make index
-            try:
-               wx.BeginBusyCursor()
-               plaindict.makeIndex(dictInstance, 
-                                   self.app.config.get('encoding'))
-               wx.EndBusyCursor()
-            except Exception as e:
-               wx.EndBusyCursor()
-               traceback.print_exc()
+      if dictInstance is self.activeDictionary:
+         self.onCloseDict(None)
+
+      if dictInstance.getType() in dicttype.indexableTypes \
+             or dictInstance.getType() == dicttype.DICT:
+         dictInstance.setUseMmap(self.app.config.get('useMmap') == 'True')
+      else:
+         self.pendingDictionary = None
+         self.activateDictionary(dictInstance)
+         return
+
+      #
+      # Index making and loading runs in background, current dictionary
+      # stays usable. onTimerLoad activates this one when it is ready.
+      # A stopped job keeps running until it notices that, so a new
+      # one is started by onTimerLoad after it has finished.
+      #
+      name = dictInstance.getName()
+      if not name in self.loadJobs:
+         self.startLoadJob(dictInstance)
+
+      self.pendingDictionary = dictInstance
+      self.load = self.loadJobs[name][1]
+      self.buttonStop.Enable(1)
+      self.SetStatusText(enc.toWX(_("Loading dictionary \"%s\"...") % name))
+      self.timerLoad.Start(LOAD_TIMER_DELAY)
+
+
+   def startLoadJob(self, dictInstance):
+      """Start making and loading index of dictionary in background"""
+
+      if dictInstance.getType() == dicttype.DICT:
+         func = dictInstance.start
+         args = ()
+      else:
+         func = plaindict.prepareIndex
+         args = (dictInstance, self.app.config.get('encoding'),
+                 self.app.config.get('fullIndex') == 'True')
+
+      self.loadJobs[dictInstance.getName()] = (dictInstance,
+                                               Job(func, *args))
+
+
+   def onTimerLoad(self, event):
+      """Load timer. Shows progress of background dictionary loading
+      and activates dictionary when it is ready"""
+
+      for name, (dictInstance, job) in list(self.loadJobs.items()):
+         if not job.isDone():
+            continue
+
+         del self.loadJobs[name]
+         error = job.getError()
+         pending = self.pendingDictionary
+
+         if dictInstance is not pending or isinstance(error, JobCancelled):
+            # Stopped or another dictionary was chosen meanwhile. Index
+            # files are made anyway, but dictd index is not needed.
+            if dictInstance.getType() == dicttype.DICT:
+               dictInstance.stop()
+            if pending and pending.getName() == name:
+               # Chosen again while the stopped job was finishing
+               self.startLoadJob(pending)
+               self.load = self.loadJobs[name][1]
+            continue
+
+         self.pendingDictionary = None
+         self.load = None
+         self.buttonStop.Disable()
+
+         if error:
+            systemLog(ERROR, "Unable to load dictionary %s: %s" \
+                      % (name, error))
+            if dictInstance.getType() in dicttype.indexableTypes:
                title = _("Index Creation Error")
                msg = _("Error occured while indexing file. " \
                        "This may be because of currently selected " \
@@ -1126,29 +1250,36 @@ class MainWindow(wx.Frame):
                        "dictionary. Try selecting " \
                        "another encoding from View > Character Encoding " \
                        "menu") % self.app.config.get('encoding')
+            else:
+               title = _("Error")
+               msg = _("Unable to load dictionary. Got error: %s") % error
+            self.SetStatusText(title)
+            errorwin.showErrorMessage(title, msg)
+         else:
+            self.activateDictionary(dictInstance,
+               started=dictInstance.getType() == dicttype.DICT)
 
-               from lib.gui import errorwin
-               errorwin.showErrorMessage(title, msg)
-               return
+      entry = self.pendingDictionary \
+              and self.loadJobs.get(self.pendingDictionary.getName())
+      if entry and not entry[1].isCancelled():
+         self.SetStatusText(enc.toWX(_("Loading dictionary \"%s\"... %d%%") \
+                                     % (self.pendingDictionary.getName(),
+                                        entry[1].getPercentage())))
 
-         # Load index
-         try:
-            wx.BeginBusyCursor()
-            index = plaindict.loadIndex(dictInstance)
-            self.activeDictionary.setIndex(index)
-            wx.EndBusyCursor()
-         except Exception as e:
-            wx.EndBusyCursor()
-            traceback.print_exc()
-            title = _("Error")
-            msg = _("Unable to load dictionary index table. "
-                    "Got error: %s") % e
-            from lib.gui import errorwin
-            errorwin.showErrorMessage(title, msg)
-            return
+      if not self.loadJobs:
+         self.timerLoad.Stop()
+
+
+   def activateDictionary(self, dictInstance, started=False):
+      """Make dictionary the active one. Resources are allocated
+      unless they already are"""
+
+      self.onCloseDict(None)
+      self.activeDictionary = dictInstance
 
       wx.BeginBusyCursor()
-      self.activeDictionary.start()
+      if not started:
+         self.activeDictionary.start()
       self.checkIfNeedsList()
       self.SetTitle(titleTemplate % dictInstance.getName())
       self.SetStatusText(enc.toWX(_("Dictionary \"%s\" loaded") \
@@ -1365,10 +1496,12 @@ class MainWindow(wx.Frame):
       word = event.GetString()
       global lastLookupWord
       lastLookupWord = word
-      self.entry.SetValue(word)
+      # Does not send text event, so the word list stays the same
+      self.entry.ChangeValue(word)
       word = enc.fromWX(word)
       word = word.encode(self.activeDictionary.getEncoding())
-      self.search = Process(self.activeDictionary.search, word)
+      self.search = Process(searchcache.search, self.activeDictionary,
+                            word)
       wx.BeginBusyCursor()
 
 
@@ -145,6 +145,17 @@ class PrefsWindow(wx.Dialog):
       self.clipboard.SetValue(self.app.config.get('useClipboard') == 'True')
       vboxMain.Add(self.clipboard, 0, wx.ALL, 3)
 
+      self.fullIndex = wx.CheckBox(self, -1,
+                                  _("Index every headword of plain " \
+                                    "dictionaries (faster search)"))
+      self.fullIndex.SetValue(self.app.config.get('fullIndex') == 'True')
+      vboxMain.Add(self.fullIndex, 0, wx.ALL, 3)
+
+      self.useMmap = wx.CheckBox(self, -1,
+                                _("Map dictionary files into memory"))
+      self.useMmap.SetValue(self.app.config.get('useMmap') == 'True')
+      vboxMain.Add(self.useMmap, 0, wx.ALL, 3)
+
       vboxMain.Add(wx.StaticLine(self, -1), 0, wx.ALL | wx.EXPAND, 5)
 
       self.buttonOK = wx.Button(self, 1104, _("OK"))
@@ -226,6 +237,8 @@ class PrefsWindow(wx.Dialog):
       self.app.config.set('saveWindowPos', str(self.winPos.GetValue()))
       self.app.config.set('saveSashPos', str(self.sashPos.GetValue()))
       self.app.config.set('useClipboard', str(self.clipboard.GetValue()))
+      self.app.config.set('fullIndex', str(self.fullIndex.GetValue()))
+      self.app.config.set('useMmap', str(self.useMmap.GetValue()))
 
       frame = self.GetParent()
       if self.app.config.get('saveWinSize'):
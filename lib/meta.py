@@ -123,6 +123,13 @@ class Dictionary:
         pass
 
 
+    def getCacheKey(self):
+        """Return tuple identifying dictionary for search result cache,
+        None if its results should not be cached"""
+
+        return (self.__class__.__name__, self.getName(), self.getPath())
+
+
     def getAuthors(self):
         """Return list of authors"""
 
@@ -147,6 +154,19 @@ class Dictionary:
         return None
 
 
+    def getListsWords(self):
+        """Return True if listWords() should be used to fill word list
+        while the user types"""
+
+        return False
+
+
+    def listWords(self, prefix):
+        """Return list of words starting with prefix"""
+
+        return []
+
+
     def getDescription(self):
         """Returns description text"""
         
@@ -0,0 +1,557 @@
+#
+# OpenDict
+# Copyright (c) 2003-2006 Martynas Jocius <martynas.jocius@idiles.com>
+# Copyright (c) 2007 IDILES SYSTEMS, UAB <support@idiles.com>
+# Copyright (c) 2021 Celyo <celyo@mail.bg>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your opinion) any later version.
+#
+# This program is distributed in the hope that will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MECHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more detals.
+#
+# You shoud have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301 USA
+#
+
+"""
+Compiled OpenDict dictionaries (.odx)
+
+A read-only single file format any plain dictionary can be compiled
+into. The file is memory-mapped and only the header is read on start,
+so dictionaries of any size open at once. Headwords are sorted by case
+folded key and prefix-compressed in groups; the group table makes
+lookups binary searches. Definitions are stored in compressed blocks
+with CRC of their data, decompressed blocks are kept in the chunk cache
+shared with dictzip files.
+
+File layout (little-endian):
+
+  header, see _header
+  metadata (JSON)
+  definition blocks
+  block table: offset (Q), compressed size (I), CRC32 (I) per block
+  key block: per headword shared prefix length (B), suffix length (H)
+             and suffix, in UTF-8; the first headword of every group
+             is stored in full
+  group table: key block offset (I) per group
+  entry table: block (I), offset (I) and length (I) of the definition
+               per headword
+
+A definition is its title and HTML separated by a zero byte.
+"""
+
+import os
+import json
+import lzma
+import mmap
+import time
+import zlib
+import struct
+from html import escape
+
+from lib import meta
+from lib import errortype
+from lib import plaindict
+from lib import sqlitedict
+from lib.extra import dictdlib
+from lib.logger import systemLog, debugLog, DEBUG
+
+
+MAGIC = b'ODX\x1a'
+VERSION = 1
+
+# Compression methods
+NONE = 0
+ZLIB = 1
+LZMA = 2
+
+compressions = {'none': NONE, 'zlib': ZLIB, 'lzma': LZMA}
+
+# Uncompressed size of definition blocks
+BLOCK_SIZE = 64 * 1024
+
+# Headwords per prefix-compressed group
+GROUP_SIZE = 16
+
+# Longest headword in characters, 4 bytes each in UTF-8 at most
+MAX_HEADWORD = 0xffff // 4
+
+# Most headwords returned for the word list
+WORD_LIST_LIMIT = 1000
+
+WORD_BG = "#dde2f1"
+
+# magic, version, compression, group size, entry count, group count,
+# block count, block size, metadata offset and size, offsets of block
+# table, key block, group table and entry table
+_header = struct.Struct('<4sHBBIIIIQIQQQQ')
+_block = struct.Struct('<QII')
+_group = struct.Struct('<I')
+_entry = struct.Struct('<III')
+_key = struct.Struct('<BH')
+
+
+class OdxError(Exception):
+    """Raised when .odx file is invalid or damaged"""
+
+    pass
+
+
+def _foldKey(headword):
+    """Return sort key of headword as UTF-8"""
+
+    return sqlitedict.foldKey(headword).encode('UTF-8')
+
+
+def _compress(data, compression):
+    """Return compressed block data"""
+
+    if compression == ZLIB:
+        return zlib.compress(data, 9)
+    if compression == LZMA:
+        return lzma.compress(data, lzma.FORMAT_XZ)
+    return data
+
+
+def _decompress(data, compression):
+    """Return decompressed block data"""
+
+    if compression == ZLIB:
+        return zlib.decompress(data)
+    if compression == LZMA:
+        return lzma.decompress(data, lzma.FORMAT_XZ)
+    return bytes(data)
+
+
+class OdxDictionary(plaindict.PlainDictionary):
+    """Compiled dictionary reader"""
+
+    def __init__(self, filePath):
+        """Initialize"""
+
+        self.filePath = filePath
+        self.needsList = True
+        self.name = os.path.splitext(os.path.basename(filePath))[0]
+        self.encoding = 'UTF-8'
+        self.checksum = None
+
+        self.configChanged = False
+
+        self.fd = None
+        self.data = None
+        self.metadata = {}
+
+
+    def start(self):
+        """Map file into memory and read its header"""
+
+        self.fd = open(self.filePath, 'rb')
+        try:
+            self.data = mmap.mmap(self.fd.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+            self._readHeader()
+        except (ValueError, EnvironmentError, struct.error) as e:
+            self.stop()
+            raise OdxError("Unable to open %s: %s" % (self.filePath, e))
+        except:
+            self.stop()
+            raise
+
+        # Changed file gets new identity, so its old blocks are not used
+        st = os.fstat(self.fd.fileno())
+        self.identity = (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+
+
+    def stop(self):
+        """Unmap and close file"""
+
+        if self.data is not None:
+            self.data.close()
+            self.data = None
+        if self.fd is not None:
+            self.fd.close()
+            self.fd = None
+
+
+    def _readHeader(self):
+        """Read and check header and metadata"""
+
+        if len(self.data) < _header.size:
+            raise OdxError("%s is truncated" % self.filePath)
+
+        try:
+            (magic, version, self.compression, self.groupSize,
+             self.entryCount, self.groupCount, self.blockCount,
+             self.blockSize, metaOffset, metaSize, self.blockTable,
+             self.keyOffset, self.groupTable,
+             self.entryTable) = _header.unpack_from(self.data)
+        except struct.error as e:
+            raise OdxError("Invalid header in %s: %s" % (self.filePath, e))
+
+        if magic != MAGIC:
+            raise OdxError("%s is not an OpenDict compiled dictionary" \
+                           % self.filePath)
+        if version > VERSION:
+            raise OdxError("%s needs newer OpenDict" % self.filePath)
+        if not self.compression in compressions.values():
+            raise OdxError("Unknown compression in %s" % self.filePath)
+        if self.groupSize < 1 \
+               or self.groupCount * self.groupSize < self.entryCount:
+            raise OdxError("Invalid header in %s" % self.filePath)
+
+        # Tables read later must lie within the file
+        for offset, size in ((metaOffset, metaSize),
+                             (self.blockTable, self.blockCount * _block.size),
+                             (self.groupTable, self.groupCount * _group.size),
+                             (self.entryTable, self.entryCount * _entry.size),
+                             (self.keyOffset, 0)):
+            if offset < _header.size or offset + size > len(self.data):
+                raise OdxError("%s is truncated" % self.filePath)
+
+        try:
+            self.metadata = json.loads(self.data[metaOffset:metaOffset \
+                                                 + metaSize].decode('UTF-8'))
+        except ValueError as e:
+            raise OdxError("Invalid metadata in %s: %s" % (self.filePath, e))
+
+
+    def getPath(self):
+        """Return full file path"""
+
+        return self.filePath
+
+
+    def getType(self):
+        """Return dictionary type"""
+
+        from lib import dicttype
+        return dicttype.ODX
+
+
+    def setName(self, name):
+        """Set new name"""
+
+        self.name = name
+
+
+    def getName(self):
+        """Return file name"""
+
+        return self.name
+
+
+    def setEncoding(self, encoding):
+        """Set encoding"""
+
+        self.encoding = encoding
+
+
+    def getEncoding(self):
+        """Return encoding set for that dictionary"""
+
+        return self.encoding
+
+
+    def setChecksum(self, newSum, first=False):
+        """Set checksum. Used after checksum change"""
+
+        if self.checksum == None:
+            self.configChanged = True
+
+        self.checksum = newSum
+
+
+    def getChecksum(self):
+        """Return checksum"""
+
+        return self.checksum
+
+
+    def getUsesWordList(self):
+        """Return True if uses word list, False otherwise"""
+
+        return self.needsList
+
+
+    def __len__(self):
+        """Return number of headwords"""
+
+        return self.entryCount
+
+
+    def _readGroup(self, group, first=False):
+        """Return list of headwords of group as UTF-8, only the first
+        one if first is True"""
+
+        position = self.keyOffset + _group.unpack_from(self.data,
+                      self.groupTable + group * _group.size)[0]
+        count = min(self.groupSize, self.entryCount - group * self.groupSize)
+        if first:
+            count = 1
+
+        headwords = []
+        previous = b''
+        for i in range(count):
+            try:
+                shared, length = _key.unpack_from(self.data, position)
+            except struct.error:
+                raise OdxError("Group %d of %s is damaged" \
+                               % (group, self.filePath))
+            position += _key.size
+            previous = previous[:shared] + self.data[position:position \
+                                                     + length]
+            position += length
+            headwords.append(previous)
+
+        return headwords
+
+
+    def _findGroup(self, key):
+        """Return number of group where headwords with key would start"""
+
+        low, high = 0, self.groupCount
+        while low < high:
+            middle = (low + high) // 2
+            first = self._readGroup(middle, True)[0]
+            if _foldKey(first.decode('UTF-8')) < key:
+                low = middle + 1
+            else:
+                high = middle
+
+        return max(low - 1, 0)
+
+
+    def findPrefix(self, prefix, limit=WORD_LIST_LIMIT):
+        """Return list of (entry number, headword) of headwords starting
+        with prefix, ignoring case"""
+
+        key = _foldKey(self._decodeWord(prefix))
+
+        found = []
+        group = self._findGroup(key)
+        while group < self.groupCount and len(found) < limit:
+            for i, headword in enumerate(self._readGroup(group)):
+                headword = headword.decode('UTF-8')
+                folded = _foldKey(headword)
+                if folded.startswith(key):
+                    found.append((group * self.groupSize + i, headword))
+                    if len(found) >= limit:
+                        break
+                elif folded > key:
+                    return found
+            group += 1
+
+        return found
+
+
+    def _readBlock(self, block):
+        """Return decompressed and checked data of block"""
+
+        cacheKey = (self.identity, block)
+        data = dictdlib.chunkcache.get(cacheKey)
+        if data is not None:
+            return data
+
+        offset, size, crc = _block.unpack_from(self.data,
+                               self.blockTable + block * _block.size)
+        try:
+            data = _decompress(self.data[offset:offset + size],
+                               self.compression)
+        except (zlib.error, lzma.LZMAError):
+            data = None
+        if data is None or zlib.crc32(data) != crc:
+            raise OdxError("Block %d of %s is damaged" \
+                           % (block, self.filePath))
+
+        dictdlib.chunkcache.put(cacheKey, data)
+
+        return data
+
+
+    def getEntry(self, number):
+        """Return (title, definition) of entry number"""
+
+        block, offset, length = _entry.unpack_from(self.data,
+                                   self.entryTable + number * _entry.size)
+        data = self._readBlock(block)[offset:offset + length]
+        title, definition = data.decode('UTF-8').split('\0', 1)
+
+        return (title, definition)
+
+
+    def getEntries(self):
+        """Return iterator over (headword, title, definition) of all
+        entries in order of headwords"""
+
+        for group in range(self.groupCount):
+            for i, headword in enumerate(self._readGroup(group)):
+                yield (headword.decode('UTF-8'),) \
+                      + self.getEntry(group * self.groupSize + i)
+
+
+    def search(self, word):
+        """Lookup word"""
+
+        _start = time.time()
+
+        result = meta.SearchResult()
+
+        word = self._decodeWord(word).strip()
+        key = _foldKey(word)
+
+        found = self.findPrefix(word)
+        words = [headword for number, headword in found]
+
+        # Same case entries first, then other case ones, then the
+        # first one with this prefix
+        exact = [(headword != word, number) for number, headword in found \
+                 if _foldKey(headword) == key]
+        entry = None
+        if exact:
+            entry = self.getEntry(min(exact)[1])
+        elif found:
+            entry = self.getEntry(found[0][0])
+
+        html = []
+
+        html.append("<html><head>")
+        html.append("<meta http-equiv=\"Content-Type\" " \
+                    "content=\"text/html; charset=%s\">" \
+                    % str(self.getEncoding()))
+        html.append("<head><body>")
+
+        if entry:
+            title, definition = entry
+            html.append("<table width=\"100%\"><tr>")
+            html.append("<td bgcolor=\"%s\">" % WORD_BG)
+            html.append("<b>%s</b></td></tr>" % escape(title))
+            html.append("<tr><td>")
+            html.append("<p>%s</p>" % definition)
+            html.append("</td></tr></table>")
+        else:
+            result.setError(errortype.NOT_FOUND)
+
+        html.append("</body></html>")
+
+        result.setTranslation("".join(html))
+        result.setWordList(words)
+
+        debugLog(DEBUG, "OdxDictionary: Search took %f seconds" \
+                 % (time.time() - _start))
+
+        return result
+
+
+
+def writeDictionary(entries, filePath, name=None, compression=ZLIB,
+                    blockSize=BLOCK_SIZE, job=None):
+    """Write compiled dictionary of (headword, title, definition)
+    tuples. Definitions are written to blocks as they come, only
+    headwords and their positions are kept in memory for sorting.
+    Return number of entries written."""
+
+    tempPath = filePath + '.tmp'
+    fd = open(tempPath, 'wb')
+    try:
+        metadata = json.dumps({'name': name}).encode('UTF-8')
+        fd.write(b'\0' * _header.size)
+        metaOffset = fd.tell()
+        fd.write(metadata)
+
+        blocks = []
+        keys = []
+        block = []
+        blockLength = 0
+
+        def flush():
+            data = b''.join(block)
+            compressed = _compress(data, compression)
+            blocks.append((fd.tell(), len(compressed), zlib.crc32(data)))
+            fd.write(compressed)
+
+        for headword, title, definition in entries:
+            headword = headword.strip()
+            if not headword:
+                continue
+            data = ('%s\0%s' % (title.replace('\0', ''), definition)) \
+                   .encode('UTF-8')
+            if block and blockLength + len(data) > blockSize:
+                flush()
+                block = []
+                blockLength = 0
+            # Suffix length of a key has to fit in 16 bits
+            headword = headword[:MAX_HEADWORD]
+            keys.append((_foldKey(headword), headword.encode('UTF-8'),
+                         len(blocks), blockLength, len(data)))
+            block.append(data)
+            blockLength += len(data)
+        if block:
+            flush()
+
+        if job is not None:
+            job.update(99, 100)
+
+        keys.sort()
+
+        blockTable = fd.tell()
+        for entry in blocks:
+            fd.write(_block.pack(*entry))
+
+        keyOffset = fd.tell()
+        groups = []
+        previous = b''
+        for i, (folded, headword, blockNumber, offset, length) \
+                in enumerate(keys):
+            shared = 0
+            if i % GROUP_SIZE == 0:
+                groups.append(fd.tell() - keyOffset)
+            else:
+                limit = min(len(previous), len(headword), 0xff)
+                while shared < limit \
+                          and previous[shared] == headword[shared]:
+                    shared += 1
+            fd.write(_key.pack(shared, len(headword) - shared))
+            fd.write(headword[shared:])
+            previous = headword
+
+        groupTable = fd.tell()
+        for offset in groups:
+            fd.write(_group.pack(offset))
+
+        entryTable = fd.tell()
+        for folded, headword, blockNumber, offset, length in keys:
+            fd.write(_entry.pack(blockNumber, offset, length))
+
+        fd.seek(0)
+        fd.write(_header.pack(MAGIC, VERSION, compression, GROUP_SIZE,
+                              len(keys), len(groups), len(blocks), blockSize,
+                              metaOffset, len(metadata), blockTable,
+                              keyOffset, groupTable, entryTable))
+    finally:
+        fd.close()
+
+    os.replace(tempPath, filePath)
+
+    return len(keys)
+
+
+def compileDictionary(dictionary, filePath, compression=ZLIB,
+                      blockSize=BLOCK_SIZE, job=None):
+    """Compile plain dictionary of any type into .odx file. Takes long
+    for big dictionaries, so it is meant to be run as threads.Job."""
+
+    _start = time.time()
+    count = writeDictionary(sqlitedict.getEntries(dictionary, job), filePath,
+                            dictionary.getName(), compression, blockSize,
+                            job)
+    systemLog(DEBUG, "Compiled %d entries of %s in %f seconds" \
+              % (count, dictionary.getName(), time.time() - _start))
+
+    return count
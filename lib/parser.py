@@ -21,25 +21,34 @@
 #
 
 import time
-import string
 import re
 import os
+import socket
 import traceback
+import threading
 import xml.parsers.expat
+from collections import OrderedDict
 
 from lib.extra import dictclient
+from lib.extra import aiodictclient
 from lib.extra import dictdlib
-from lib import info
-from lib import misc
 from lib import errortype
 from lib import meta
 from lib import plaindict
-from lib.logger import systemLog, debugLog, DEBUG, INFO, WARNING, ERROR
+from lib import remotecache
+from lib.logger import systemLog, debugLog, DEBUG, WARNING, ERROR
 
 
 WORD_BG = "#dde2f1" # Bright blue
 DICT_BG = "#b4bedb"
 
+# DICT server word lists: default MATCH strategy, shortest prefix
+# listed and number of prefixes whose word lists are kept. Lists of
+# shorter prefixes are reused with WORD_LIST_STRATEGY only.
+WORD_LIST_STRATEGY = 'prefix'
+WORD_LIST_MIN_PREFIX = 2
+WORD_LIST_CACHE_SIZE = 64
+
 class SlowoParser(plaindict.PlainDictionary):
    """
    Built-in Slowo Parser
@@ -47,6 +56,8 @@ class SlowoParser(plaindict.PlainDictionary):
    Parses file in Slowo format.
    """
 
+   headwordSeparator = b'='
+
    def __init__(self, filePath):
       """Initialize"""
 
@@ -67,7 +78,8 @@ class SlowoParser(plaindict.PlainDictionary):
       """Open file handle"""
 
       debugLog(DEBUG, "Opening file %s" % self.filePath)
-      self.fd = open(self.filePath)
+      self.fd = open(self.filePath, 'rb')
+      self._mapFile()
 
 
    def stop(self):
@@ -75,6 +87,7 @@ class SlowoParser(plaindict.PlainDictionary):
 
       try:
          debugLog(DEBUG, "Closing file %s" % self.filePath)
+         self._unmapFile()
          self.fd.close()
       except:
          pass
@@ -145,6 +158,45 @@ class SlowoParser(plaindict.PlainDictionary):
       return self.needsList
 
 
+   def getHeadword(self, line):
+      """Return headword of decoded line"""
+
+      if not '=' in line:
+         return None
+
+      return line.split('=', 1)[0].strip()
+
+
+   def _formatTranslation(self, line):
+      """Return HTML code of translations in the line"""
+
+      end = line.split('=', 1)[1]
+      chunks = end.split(';')
+
+      translation = ["<ul>"]
+      for chunk in chunks:
+         comment = []
+         trans = chunk.split('//')
+         
+         if len(trans) > 1:
+            comment = trans[1:]
+
+         trans = trans[:1]
+            
+         trans = "".join(trans).strip()
+         comment = "".join(comment).strip()
+         
+         if len(trans) and len(comment) != 0:
+            translation.append("<li>%s (<i>%s</i>)</li>" \
+                               % (trans, comment))
+         elif len(trans):
+            translation.append("<li>%s</li>" % trans)
+
+      translation.append("</ul>")
+
+      return "".join(translation)
+
+
    def _appendTranslation(self, html, orig, trans):
       """Appends HTML strings to list"""
 
@@ -161,25 +213,9 @@ class SlowoParser(plaindict.PlainDictionary):
 
       _start = time.time()
 
+      word = self._decodeWord(word)
       word_lowered = word.lower()
 
-      encodedIndex = {}
-      for literal in self.index:
-         encodedIndex[literal.encode(self.getEncoding())] = \
-                      self.index.get(literal)
-
-      #
-      # Seek to the beginning of the block
-      #
-      position = 0
-      if word_lowered[:2] in list(encodedIndex.keys()):
-         position = encodedIndex[word_lowered[:2]]
-
-      debugLog(DEBUG, "Index: %s->%d" % (word_lowered[:2], position))
-      debugLog(DEBUG, "SlowoParser: Seeking to %d" % position)
-      
-      self.fd.seek(position)
-
       html = []
 
       html.append("<html><head>")
@@ -188,77 +224,53 @@ class SlowoParser(plaindict.PlainDictionary):
                   % str(self.getEncoding()))
       html.append("<head><body>")
 
-      found = False
       words = []
 
       result = meta.SearchResult()
 
+      # Entries are (headword, line); translations are parsed only
+      # for the entry being shown
+      exact = None
+      suggested = None
+
       # DEBUG
       _linesRead = 0
 
-      for line in self.fd:
+      for line in self._getLines(word):
          _linesRead += 1
          line = line.strip()
-         try:
-            orig = ""
-            end = ""
-            try:
-                orig, end = line.split('=', 1)
-            except ValueError as e:
-                systemLog(ERROR, '%s (line %s)' % (e, line))
-            orig = orig.strip()
-            chunks = end.split(';')
-
-            translation = ["<ul>"]
-            for chunk in chunks:
-               comment = []
-               trans = chunk.split('//')
-               
-               if len(trans) > 1:
-                  comment = trans[1:]
-
-               trans = trans[:1]
-                  
-               trans = "".join(trans).strip()
-               comment = "".join(comment).strip()
-               
-               if len(trans) and len(comment) != 0:
-                  translation.append("<li>%s (<i>%s</i>)</li>" \
-                                     % (trans, comment))
-               elif len(trans):
-                  translation.append("<li>%s</li>" % trans)
 
-            translation.append("</ul>")
+         orig = self.getHeadword(line)
+         if orig is None:
+            if line:
+               systemLog(ERROR, 'No headword (line %s)' % line)
+            continue
 
-            translation = "".join(translation)
+         origLowered = orig.lower()
 
-         except:
-            traceback.print_exc()
-            continue
+         if origLowered.startswith(word_lowered):
+            if exact is None and origLowered == word_lowered:
+               exact = (orig, line)
 
-         if line.lower().startswith(word_lowered):   
-            
-            if not orig.lower().startswith(word_lowered):
-               break
-            
-            if orig.lower() == word_lowered and not found:
-               found = True
-               self._appendTranslation(html, orig, translation)               
-               
             words.append(orig)
-            if len(words) == 1:
-               suggestedWord = orig
-               suggestedTrans = translation
+            if suggested is None:
+               suggested = (orig, line)
          elif len(words):
             break
 
       debugLog(DEBUG, "%d lines scanned" % _linesRead)
-      
-      if not found:
-         if words:
-            self._appendTranslation(html, suggestedWord, suggestedTrans)
-         else:
-            result.setError(errortype.NOT_FOUND)
+
+      entry = exact or suggested
+      if entry:
+         orig, line = entry
+         try:
+            translation = self._formatTranslation(line)
+         except:
+            traceback.print_exc()
+            translation = ""
+         self._appendTranslation(html, orig, translation)
+      else:
+         result.setError(errortype.NOT_FOUND)
 
       html.append("</font></body></html>")
 
@@ -286,6 +298,8 @@ class MovaParser(plaindict.PlainDictionary):
    the search.
    """
 
+   headwordSeparator = b'  '
+
    def __init__(self, filePath):
       """Initialize"""
 
@@ -309,7 +323,8 @@ class MovaParser(plaindict.PlainDictionary):
       """Open file handle"""
 
       debugLog(DEBUG, "Opening file %s" % self.filePath)
-      self.fd = open(self.filePath)
+      self.fd = open(self.filePath, 'rb')
+      self._mapFile()
       
 
    def stop(self):
@@ -317,6 +332,7 @@ class MovaParser(plaindict.PlainDictionary):
 
       try:
          debugLog(DEBUG, "Closing file %s" % self.filePath)
+         self._unmapFile()
          self.fd.close()
       except:
          pass
@@ -392,6 +408,17 @@ class MovaParser(plaindict.PlainDictionary):
       return self.needsList
 
 
+   def getHeadword(self, line):
+      """Return headword of decoded line"""
+
+      try:
+         orig, trans = line.strip().split("  ", 1)
+      except ValueError:
+         return None
+
+      return orig
+
+
    def _appendTranslation(self, html, orig, trans):
       """Appends HTML strings to list"""
 
@@ -408,24 +435,9 @@ class MovaParser(plaindict.PlainDictionary):
 
       _start = time.time()
 
+      word = self._decodeWord(word)
       word_lowered = word.lower()
 
-      encodedIndex = {}
-      for literal in self.index:
-         encodedIndex[literal.encode(self.getEncoding())] = \
-                      self.index.get(literal)
-
-      #
-      # Seek to the beginning of the block
-      #
-      position = 0
-      if word_lowered[:2] in list(encodedIndex.keys()):
-         position = encodedIndex[word_lowered[:2]]
-
-      debugLog(DEBUG, "Index: %s->%d" % (word_lowered[:2], position))
-      debugLog(DEBUG, "MovaParser: Seeking to %d" % position)
-      self.fd.seek(position)
-
       html = []
 
       html.append("<html><head>")
@@ -442,7 +454,7 @@ class MovaParser(plaindict.PlainDictionary):
       # DEBUG
       _linesRead = 0
 
-      for line in self.fd:
+      for line in self._getLines(word):
          _linesRead += 1
          line = line.strip()
          try:
@@ -668,24 +680,32 @@ class DictParser(plaindict.PlainDictionary):
       self.configChanged = False
 
       self.dict = None
-      self.definitions = None
 
 
-   def start(self):
-      """Allocate resources"""
+   def start(self, job=None):
+      """Allocate resources. Loading the index may take long, so
+      progress is reported to job if given"""
 
       name = os.path.splitext(os.path.splitext(\
          os.path.basename(self.filePath))[0])[0]
       indexFile = os.path.join(os.path.dirname(self.filePath),
                                name)
-      self.dict = dictdlib.DictDB(indexFile)
+      try:
+         self.dict = dictdlib.DictDB(indexFile, job=job,
+                                     lazy=self.getUseMmap(), compact=1)
+      except ValueError as e:
+         # Index not in the format CompactIndex reads, load it as is
+         systemLog(WARNING, "Unable to load compact index of %s: %s" \
+                   % (self.filePath, e))
+         self.dict = dictdlib.DictDB(indexFile, job=job)
 
 
    def stop(self):
       """Free resources"""
 
       if self.dict:
-         del self.dict
+         self.dict.close()
+         self.dict = None
 
 
    def getPath(self):
@@ -740,9 +760,10 @@ class DictParser(plaindict.PlainDictionary):
       return self.needsList
 
 
-   def _getTranslation(self, word):
+   def _getTranslation(self, word, markup=True):
       """Return word and translation code without formatting
-      full HTML document"""
+      full HTML document. The word is returned as plain text if
+      markup is False"""
 
       translations = self.dict.getdef(word)
 
@@ -750,15 +771,15 @@ class DictParser(plaindict.PlainDictionary):
       translation = None
       
       for source in translations:
-         chunks = source.split('\n')
-         list(map(string.strip, chunks))
+         source = source.decode(self.getEncoding(), 'replace')
+         chunks = [chunk.strip() for chunk in source.split('\n')]
          
          orig = chunks[0]
          pron = re.findall("\[(.*?)\]", orig)
-         if len(pron) > 0:
+         if markup and len(pron) > 0:
             orig = "<b>%s</b> [<i>%s</i>]" % \
                    (orig.replace(" [%s]" % pron[0], ""), pron[0])
-         else:
+         elif markup:
             orig = "<b>%s</b>" % orig
 
          translation = ['<ul>']
@@ -785,17 +806,11 @@ class DictParser(plaindict.PlainDictionary):
 
       result = meta.SearchResult()
 
-      word_lowered = word.lower()
-      
-      if self.definitions is None:
-         self.definitions = self.dict.getdeflist()
-         self.definitions.sort()
+      word = self._decodeWord(word)
 
-      words = []
-
-      for definition in self.definitions:
-         if definition.lower().startswith(word_lowered):
-            words.append(definition)
+      # Index keeps case folded keys sorted, so these are bisects.
+      # Words come in case insensitive order.
+      words = self.dict.getprefix(word)
 
       html = []
 
@@ -808,15 +823,19 @@ class DictParser(plaindict.PlainDictionary):
       (orig, translation) = self._getTranslation(word)
 
       if not translation:
-         if len(words):
-            debugLog(DEBUG, "Retrying search...")
-            _word = words[0]
-            orig, translation = self._getTranslation(_word)
-            if not translation:
-               result.setError(errortype.NOT_FOUND)
-         else:
-            result.setError(errortype.NOT_FOUND)
-            translation = ""
+         # Same word written in other case
+         for other in self.dict.getcaseless(word):
+            orig, translation = self._getTranslation(other)
+            if translation:
+               break
+
+      if not translation and len(words):
+         debugLog(DEBUG, "Retrying search...")
+         orig, translation = self._getTranslation(words[0])
+
+      if not translation:
+         result.setError(errortype.NOT_FOUND)
+         translation = ""
 
       html.append("<table width=\"100%\"><tr>")
       html.append("<td bgcolor=\"%s\">" % WORD_BG)
@@ -844,16 +863,29 @@ class DictConnection(meta.Dictionary):
    Connects to a DICT server abd does the search.
    """
 
-   def __init__(self, server, port, db, strategy):
+   def __init__(self, server, port, db, strategy, mirrors=()):
 
       self.server = server
       self.port = port
+
+      # Mirrors, list of (server, port), are used when the server is
+      # down or slower than them
+      self.servers = [(server, port)]
+      for mirror in mirrors:
+         if not mirror in self.servers:
+            self.servers.append(mirror)
       self.db = db
-      self.strategy = strategy
+
+      # MATCH strategy of word lists
+      self.strategy = strategy or WORD_LIST_STRATEGY
       self.encoding = "UTF-8"
-      self.needsList = 0
+      self.needsList = 1
       self.name = 'Connection to DICT server'
 
+      # Word lists by lower-cased prefix, least recently used first
+      self.wordLists = OrderedDict()
+      self.wordListsLock = threading.Lock()
+
 
    def getUsesWordList(self):
       """Return True if uses word list, False otherwise"""
@@ -861,6 +893,152 @@ class DictConnection(meta.Dictionary):
       return self.needsList
 
 
+   def getListsWords(self):
+      """Return True if words can be listed while typing"""
+
+      return self.needsList
+
+
+   def getCacheKey(self):
+      """Return tuple identifying dictionary for search result cache"""
+
+      return (self.__class__.__name__, tuple(self.servers), self.db,
+              self.strategy)
+
+
+   def _decodeWord(self, word):
+      """Return word as unicode string"""
+
+      if isinstance(word, bytes):
+         word = word.decode(self.getEncoding())
+
+      return word.strip()
+
+
+   def _getCachedWords(self, prefix):
+      """Return word list of prefix from cache, filtering the list of
+      a shorter prefix if possible. Return None if it is not known."""
+
+      key = prefix.lower()
+      if len(key) < WORD_LIST_MIN_PREFIX:
+         return []
+
+      # Other strategies may match words not starting with the prefix
+      shortest = len(key)
+      if self.strategy == WORD_LIST_STRATEGY:
+         shortest = WORD_LIST_MIN_PREFIX
+
+      self.wordListsLock.acquire()
+      try:
+         for length in range(len(key), shortest - 1, -1):
+            words = self.wordLists.get(key[:length])
+            if words is not None:
+               self.wordLists.move_to_end(key[:length])
+               break
+         else:
+            return None
+      finally:
+         self.wordListsLock.release()
+
+      if length < len(key):
+         words = [w for w in words if w.lower().startswith(key)]
+         self._rememberWords(prefix, words)
+
+      return words
+
+
+   def _rememberWords(self, prefix, words):
+      """Put word list of prefix into cache"""
+
+      self.wordListsLock.acquire()
+      try:
+         self.wordLists[prefix.lower()] = words
+         self.wordLists.move_to_end(prefix.lower())
+         while len(self.wordLists) > WORD_LIST_CACHE_SIZE:
+            self.wordLists.popitem(last=False)
+      finally:
+         self.wordListsLock.release()
+
+
+   def _getMatchedWords(self, matches):
+      """Return words of MATCH result without duplicates"""
+
+      words = []
+      seen = set()
+      for match in matches:
+         word = match.getword()
+         if not word in seen:
+            seen.add(word)
+            words.append(word)
+
+      return words
+
+
+   def _canListWords(self, conn):
+      """Return True if server supports word list strategy"""
+
+      return self.strategy in conn.getstratdescs()
+
+
+   def listWords(self, prefix):
+      """Return list of words matching prefix by the word list
+      strategy"""
+
+      prefix = self._decodeWord(prefix)
+      words = self._getCachedWords(prefix)
+      if words is not None:
+         return words
+
+      def match(conn):
+         if not self._canListWords(conn):
+            return []
+         return self._getMatchedWords(
+            conn.match(self.db, self.strategy, prefix))
+
+      try:
+         words = self._run(match)
+      except Exception as e:
+         systemLog(WARNING, "Unable to list words of %s: %s" \
+                   % (self.server, e))
+         return []
+
+      self._rememberWords(prefix, words)
+
+      return words
+
+
+   def _run(self, func):
+      """Call func with a connection to the best server, return its
+      result"""
+
+      return dictclient.getgroup(self.servers, aiodictclient.pool).run(func)
+
+
+   def _lookup(self, conn, word, listWords):
+      """Define word and, if listWords is True, list words matching
+      it. Both commands are sent at once. Return (definitions,
+      words) tuple, words is None if not listed."""
+
+      conn.checkdefine(self.db)
+      commands = [conn.definecommand(self.db, word)]
+
+      listWords = listWords and self._canListWords(conn)
+      if listWords:
+         conn.checkmatch(self.db, self.strategy)
+         commands.append(conn.matchcommand(self.db, self.strategy,
+                                           word))
+
+      conn.sendcommands(commands)
+      data = [(d.getdb().getdescription(), d.getdefstr()) \
+              for d in conn.getdefinitions()]
+
+      words = None
+      if listWords:
+         words = self._getMatchedWords(conn.getmatches())
+
+      return (data, words)
+
+
    def setName(self, name):
       """Set new name"""
 
@@ -890,11 +1068,31 @@ class DictConnection(meta.Dictionary):
 
       result = meta.SearchResult()
 
-      try:
-         conn = dictclient.Connection(self.server, self.port)
-      except:
-         result.setError(errortype.CONNECTION_ERROR)
-         return result
+      word = self._decodeWord(word)
+      words = self._getCachedWords(word)
+
+      key = (self.server, self.port, self.db, self.strategy, word)
+      data = remotecache.lookupCache.get(key)
+
+      if data is None:
+         lookup = lambda conn: self._lookup(conn, word, words is None)
+         try:
+            data, listed = self._run(lookup)
+         except (dictclient.ConnectionClosed, dictclient.ResponseError,
+                 socket.error, ValueError) as e:
+            # ValueError means the database is not offered any more
+            systemLog(WARNING, "Unable to look up %s at %s: %s" \
+                      % (word, self.server, e))
+            result.setError(errortype.CONNECTION_ERROR)
+            return result
+         else:
+            remotecache.lookupCache.put(key, data)
+            if listed is not None:
+               self._rememberWords(word, listed)
+               words = listed
+
+      if words is None:
+         words = self.listWords(word)
 
       html = []
       html.append("<html><head>" \
@@ -904,19 +1102,13 @@ class DictConnection(meta.Dictionary):
 
       found = False
 
-      try:
-         data = conn.define(self.db, word)
-      except:
-         data = []
-
-      for d in data:
+      for description, source in data:
          found = True
 
          html.append("<p><table width=\"100%\"><tr>")
          html.append("<td bgcolor=\"%s\">" % DICT_BG)
-         html.append("<b><i>%s</i></b></td></tr>" % d.getdb().getdescription())
+         html.append("<b><i>%s</i></b></td></tr>" % description)
 
-         source = d.getdefstr()
          source = source.replace('<', '&lt;')
          source = source.replace('>', '&gt;')
          orig = source.split("\n", 1)[0]
@@ -953,6 +1145,7 @@ class DictConnection(meta.Dictionary):
       html.append("</body></html>")
 
       result.setTranslation(''.join(html))
+      result.setWordList(words)
       
       if not found:
          result.setError(errortype.NOT_FOUND)
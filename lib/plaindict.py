@@ -25,16 +25,40 @@ Module for plain dictionaries
 """
 
 import os
+import re
+import mmap
+import hashlib
 import traceback
+import multiprocessing
 
 from lib import info
 from lib import meta
 from lib import util
 from lib import xmltools
 from lib import util
+from lib import plainindex
 from lib.logger import systemLog, debugLog, DEBUG, INFO, WARNING, ERROR
 
 
+# Literal index file name in dictionary data directory
+INDEX_FILE = 'index.xml'
+
+# Full headword index file name in dictionary data directory
+FULL_INDEX_FILE = 'headwords.idx'
+
+# Fingerprint of the indexed file, see plainindex.makeFingerprint()
+FINGERPRINT_FILE = 'fingerprint'
+
+# Indexing progress is reported once per this number of lines
+PROGRESS_LINES = 10000
+
+# Files of at least this size are indexed in several processes
+PARALLEL_MIN_SIZE = 16 * 1024 * 1024
+
+# Number of file ranges per indexing process
+PARALLEL_SPLIT = 4
+
+
 class PlainDictInfo:
     """Plain dictionary configuration"""
 
@@ -141,6 +165,13 @@ class PlainDictionary(meta.Dictionary):
     licenceFile = None
     version = None
     authors = []
+    fullIndex = None
+    useMmap = False
+    mappedFile = None
+
+    # Raw separator between headword and translation in a line,
+    # used by line-oriented formats
+    headwordSeparator = None
     
 
     def getConfigDir(self):
@@ -241,6 +272,196 @@ class PlainDictionary(meta.Dictionary):
         """Get description"""
 
         return self.description
+
+
+    def setFullIndex(self, index):
+        """Set full headword index, None to use literal index only"""
+
+        self.fullIndex = index
+
+
+    def getFullIndex(self):
+        """Return full headword index"""
+
+        return self.fullIndex
+
+
+    def getHeadword(self, line):
+        """Return headword of decoded line, None if line has no entry.
+        Used by line-oriented formats only."""
+
+        return None
+
+
+    def _decodeWord(self, word):
+        """Return word as unicode string"""
+
+        if isinstance(word, bytes):
+            return word.decode(self.getEncoding())
+
+        return word
+
+
+    def setUseMmap(self, useMmap):
+        """Set whether dictionary file should be memory-mapped on start"""
+
+        self.useMmap = useMmap
+
+
+    def getUseMmap(self):
+        """Return True if dictionary file is memory-mapped on start"""
+
+        return self.useMmap
+
+
+    def _mapFile(self):
+        """Map opened file handle into memory if requested"""
+
+        self.mappedFile = None
+
+        if not self.useMmap:
+            return
+
+        try:
+            self.mappedFile = mmap.mmap(self.fd.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+        except (ValueError, EnvironmentError) as e:
+            # Empty files cannot be mapped
+            systemLog(WARNING, "Unable to map %s into memory: %s" \
+                      % (self.getPath(), e))
+
+
+    def _unmapFile(self):
+        """Release memory map"""
+
+        if self.mappedFile is not None:
+            self.mappedFile.close()
+            self.mappedFile = None
+
+
+    def _getHeadwordBytes(self, data, start, end):
+        """Return raw headword of line data[start:end], None if
+        the line has no entry"""
+
+        sepPos = data.find(self.headwordSeparator, start, end)
+        if sepPos < 0:
+            return None
+
+        return data[start:sepPos].strip()
+
+
+    def _getLines(self, word):
+        """Return iterator over decoded lines to be scanned for word.
+
+        With a full index only lines of headwords starting with word
+        are returned. Otherwise lines are read from the beginning of the
+        block for the first two letters of word up to the end of file,
+        so the caller must stop when matches are over."""
+
+        encoding = self.getEncoding()
+
+        if self.fullIndex is not None:
+            first, last = self.fullIndex.findPrefix(word)
+            debugLog(DEBUG, "Full index: %s->%d entries" \
+                     % (word, last - first))
+
+            def _indexed():
+                for i in range(first, last):
+                    position = self.fullIndex.getOffset(i)
+                    if self.mappedFile is not None:
+                        end = self.mappedFile.find(b'\n', position)
+                        if end < 0:
+                            end = len(self.mappedFile)
+                        line = self.mappedFile[position:end]
+                    else:
+                        self.fd.seek(position)
+                        line = self.fd.readline()
+                    yield line.decode(encoding, 'replace')
+
+            return _indexed()
+
+        position = self.index.get(word.lower()[:2], 0)
+        debugLog(DEBUG, "Index: %s->%d" % (word.lower()[:2], position))
+
+        if self.mappedFile is not None:
+            return self._scanMapped(word, position)
+
+        self.fd.seek(position)
+
+        return (line.decode(encoding, 'replace') for line in self.fd)
+
+
+    def _scanMapped(self, word, position):
+        """Yield decoded lines of headwords starting with word.
+
+        Memory map is scanned from position on raw bytes. Only headwords
+        are compared and only matching lines are decoded. Scanning stops
+        at the first mismatch after a block of matches."""
+
+        encoding = self.getEncoding()
+        data = self.mappedFile
+        size = len(data)
+
+        wordLowered = word.lower()
+        try:
+            wordBytes = wordLowered.encode(encoding)
+        except UnicodeError:
+            # Word cannot be written in dictionary encoding
+            return
+
+        # Case-insensitive regular expression search runs in C and
+        # skips lines which cannot match. It is usable for ASCII only.
+        jump = None
+        if wordBytes.isascii():
+            jump = re.compile(b'^[ \t]*' + re.escape(wordBytes),
+                              re.IGNORECASE | re.MULTILINE)
+
+        _linesRead = 0
+        found = False
+
+        while position < size:
+            if jump is not None and not found:
+                match = jump.search(data, position)
+                if match is None:
+                    break
+                position = match.start()
+
+            end = data.find(b'\n', position)
+            if end < 0:
+                end = size
+
+            _linesRead += 1
+            start = position
+            position = end + 1
+
+            # Most lines are rejected by their first bytes already
+            prefix = data[start:start + len(wordBytes)]
+            if prefix.isascii() and not prefix[:1].isspace() \
+                   and prefix.lower() != wordBytes:
+                if found \
+                       and data.find(self.headwordSeparator, start, end) >= 0:
+                    break
+                continue
+
+            head = self._getHeadwordBytes(data, start, end)
+            if head is None:
+                continue
+
+            prefix = head[:len(wordBytes)]
+            if prefix.isascii():
+                # ASCII is the same in all supported encodings
+                matches = prefix.lower() == wordBytes
+            else:
+                matches = head.decode(encoding, 'replace').lower() \
+                          .startswith(wordLowered)
+
+            if matches:
+                found = True
+                yield data[start:end].decode(encoding, 'replace')
+            elif found:
+                break
+
+        debugLog(DEBUG, "%d mapped lines scanned" % _linesRead)
     
 
 
@@ -334,93 +555,257 @@ def loadPlainDictionaries(dictionaries):
 
 
 
-def indexShouldBeMade(dictionary):
+def getDataFile(dictionary, fileName, write=False):
+    """Return path of index data file of dictionary.
+
+    Index files are made in the local home, so files to be written are
+    always there. A file is read from the global home only if there is
+    no local one, so files written locally take precedence."""
+
+    dictDir = os.path.basename(dictionary.getPath())
+    localPath = os.path.join(info.LOCAL_HOME, info.PLAIN_DICT_DIR, dictDir,
+                             'data', fileName)
+    if write or os.path.exists(localPath):
+        return localPath
+
+    globalPath = os.path.join(info.GLOBAL_HOME, info.PLAIN_DICT_DIR, dictDir,
+                              'data', fileName)
+    if os.path.exists(globalPath):
+        return globalPath
+
+    return localPath
+
+
+
+def indexShouldBeMade(dictionary, fullIndex=False, job=None):
     """Check if index exists and is up to date.
 
-    Return True if dictionary must be indexed.
+    Return True if dictionary must be indexed. If fullIndex is True,
+    missing full headword index also requires indexing. If job is given,
+    checksum calculation progress is reported to it.
     """
 
     filePath = dictionary.getPath()
-    fileName = os.path.basename(filePath)
-
-    dictLocalHome = os.path.join(info.LOCAL_HOME,
-                                 info.PLAIN_DICT_DIR,
-                                 fileName)
 
-    dictGlobalHome = os.path.join(info.GLOBAL_HOME,
-                                  info.PLAIN_DICT_DIR,
-                                  fileName)
+    if not os.path.exists(getDataFile(dictionary, INDEX_FILE)):
+        return True
 
-    if not os.path.exists(os.path.join(dictGlobalHome, 'data', 'index.xml')) \
-           and not os.path.exists(os.path.join(dictLocalHome, 'data',
-                                               'index.xml')):
+    if fullIndex \
+           and not os.path.exists(getDataFile(dictionary, FULL_INDEX_FILE)):
         return True
 
+    fingerprint = plainindex.makeFingerprint(filePath)
+    if fingerprint == _loadFingerprint(dictionary):
+        debugLog(INFO, "Fingerprint of %s has not changed" % filePath)
+        return False
+
     debugLog(INFO, "Old checksum: %s" % dictionary.getChecksum())
-    newChecksum = util.getMD5Sum(filePath)
+    newChecksum = util.getMD5Sum(filePath, job)
     debugLog(INFO, "New checksum: %s" % newChecksum)
 
-    return dictionary.getChecksum() != newChecksum
+    if dictionary.getChecksum() != newChecksum:
+        return True
+
+    # File was touched or copied, but contents are the same
+    _saveFingerprint(dictionary, fingerprint)
 
+    return False
 
 
-def makeIndex(dictionary, currentlySetEncoding):
-    """Index dictionary"""
+
+def _makeIndexSerial(dictionary, currentlySetEncoding, fullIndex, size,
+                     job=None):
+    """Index dictionary file line by line.
+    Return (index, headwords, checksum) tuple."""
 
     filePath = dictionary.getPath()
-    fd = open(filePath)
+    generator = hashlib.md5()
+    fd = open(filePath, 'rb')
 
     index = {}
+    headwords = []
     count = 0
     linenum = -1
     
-    for line in fd:
-        linenum += 1
-        try:
-            literal = str(line.strip(),
-                              dictionary.getEncoding())[:2].lower()
-        except:
+    try:
+        for line in fd:
+            linenum += 1
+            generator.update(line)
             try:
-                literal = str(line.strip(),
-                                  currentlySetEncoding)[:2].lower()
-                dictionary.setEncoding(currentlySetEncoding)
+                text = str(line.strip(), dictionary.getEncoding())
             except:
-                raise Exception("Unable to encode data in %s nor %s " \
-                      "at line %d" \
-                      % (dictionary.getEncoding(), currentlySetEncoding,
-                         linenum))
+                try:
+                    text = str(line.strip(), currentlySetEncoding)
+                    dictionary.setEncoding(currentlySetEncoding)
+                except:
+                    raise Exception("Unable to encode data in %s nor %s " \
+                          "at line %d" \
+                          % (dictionary.getEncoding(), currentlySetEncoding,
+                             linenum))
 
-        # Ignore if control character found
-        if literal and not literal in list(index.keys()) and literal[0] > '\x19':
-            try:
-                index[literal] = count
-            except Exception as e:
-                systemLog(ERROR, e)
+            literal = text[:2].lower()
+
+            # Ignore if control character found
+            if literal and not literal in index and literal[0] > '\x19':
+                try:
+                    index[literal] = count
+                except Exception as e:
+                    systemLog(ERROR, e)
+
+            if fullIndex:
+                headword = dictionary.getHeadword(text)
+                if headword:
+                    headwords.append((plainindex.foldKey(headword), count))
+
+            # Offsets are counted in bytes, so they can be used for seeking
+            count += len(line)
 
-        count += len(line)
+            if job and linenum % PROGRESS_LINES == 0:
+                job.update(count, size)
+    finally:
+        fd.close()
 
+    return (index, headwords, generator.hexdigest())
 
-    fileName = os.path.basename(filePath)
 
-    dictHome = os.path.join(info.LOCAL_HOME,
-                            info.PLAIN_DICT_DIR,
-                            fileName)
 
+def _indexRangeWorker(task):
+    """Index one byte range of dictionary file in worker process.
+    Return None if the range can not be decoded."""
 
-    toUnicode = lambda s: str(s, dictionary.getEncoding())
+    dictClass, filePath, start, end, encoding, fullIndex = task
+
+    getHeadword = None
+    if fullIndex:
+        getHeadword = dictClass(filePath).getHeadword
+
+    try:
+        return plainindex.indexRange(filePath, start, end, encoding,
+                                     getHeadword)
+    except (UnicodeError, LookupError, TypeError):
+        return None
+
+
+def _makeIndexParallel(dictionary, fullIndex, size, processes, job=None):
+    """Index file ranges in worker processes. Checksum is counted
+    while workers run. Return (index, headwords, checksum) tuple or
+    None if some range could not be decoded in dictionary encoding."""
+
+    filePath = dictionary.getPath()
+    ranges = plainindex.splitRanges(filePath, processes * PARALLEL_SPLIT)
+    tasks = [(dictionary.__class__, filePath, start, end,
+              dictionary.getEncoding(), fullIndex) for start, end in ranges]
+
+    generator = hashlib.md5()
+    results = []
+
+    fd = open(filePath, 'rb')
+    # Workers are spawned, not forked: forking the threaded GUI process
+    # could copy locks held by other threads and deadlock the children
+    pool = multiprocessing.get_context('spawn').Pool(processes)
+    try:
+        # Results come in order, so each range is hashed while
+        # workers index the following ones
+        for (start, end), result in zip(ranges,
+                                        pool.imap(_indexRangeWorker, tasks)):
+            if result is None:
+                return None
+            results.append(result)
+
+            fd.seek(start)
+            left = end - start
+            while left > 0:
+                data = fd.read(min(left, util.MD5_CHUNK_SIZE))
+                if not data:
+                    break
+                generator.update(data)
+                left -= len(data)
+
+            if job:
+                job.update(end, size)
+    finally:
+        pool.terminate()
+        pool.join()
+        fd.close()
+
+    index, headwords = plainindex.mergeRanges(results)
+
+    return (index, headwords, generator.hexdigest())
+
+
+def makeIndex(dictionary, currentlySetEncoding, fullIndex=False, job=None,
+              processes=None):
+    """Index dictionary.
+
+    Literal index keeps position of the first line for every two-letter
+    prefix. If fullIndex is True, full headword index with position of
+    every headword is made as well. If job is given, number of bytes
+    processed is reported to it.
+
+    Files larger than PARALLEL_MIN_SIZE are indexed by processes
+    workers, one per CPU by default. The result is the same as of
+    indexing in one process."""
+
+    filePath = dictionary.getPath()
+    fingerprint = plainindex.makeFingerprint(filePath)
+    size = fingerprint['size']
+
+    if processes is None:
+        processes = 1
+        if size >= PARALLEL_MIN_SIZE:
+            processes = os.cpu_count() or 1
+
+    result = None
+    if processes > 1:
+        result = _makeIndexParallel(dictionary, fullIndex, size, processes,
+                                    job)
+        if result is None:
+            systemLog(INFO, "Unable to decode %s in %s, indexing " \
+                      "in one process" % (filePath, dictionary.getEncoding()))
+
+    if result is None:
+        result = _makeIndexSerial(dictionary, currentlySetEncoding,
+                                  fullIndex, size, job)
+
+    index, headwords, checksum = result
 
     doc = xmltools.generateIndexFile(index)
-    xmltools.writeIndexFile(doc, os.path.join(dictHome, 'data', 'index.xml'))
+    xmltools.writeIndexFile(doc, getDataFile(dictionary, INDEX_FILE, True))
+
+    fullIndexPath = getDataFile(dictionary, FULL_INDEX_FILE, True)
+    if fullIndex:
+        plainindex.writeHeadwordIndex(
+            plainindex.buildHeadwordIndex(headwords), fullIndexPath)
+    elif os.path.exists(fullIndexPath):
+        # Outdated full index must not be used with changed file
+        os.remove(fullIndexPath)
+
+    # Checksum is made while reading, no need to read the file again
+    dictionary.setChecksum(checksum)
+    _saveFingerprint(dictionary, fingerprint)
+    savePlainConfiguration(dictionary, dictionary.getChecksum())
 
-    savePlainConfiguration(dictionary)
+
+
+def prepareIndex(dictionary, currentlySetEncoding, fullIndex=False,
+                 job=None):
+    """Make index if needed and load it into dictionary.
+
+    This may take long for big files, so it is meant to be run as
+    a background threads.Job."""
+
+    if indexShouldBeMade(dictionary, fullIndex, job):
+        makeIndex(dictionary, currentlySetEncoding, fullIndex, job)
+
+    dictionary.setIndex(loadIndex(dictionary))
+    dictionary.setFullIndex(loadFullIndex(dictionary))
 
 
 
 def loadIndex(dictionary):
     """Load index table"""
 
-    dictIndex = os.path.join(dictionary.getConfigDir(),
-                                 'data', 'index.xml')
+    dictIndex = getDataFile(dictionary, INDEX_FILE)
 
     index = None
 
@@ -430,10 +815,42 @@ def loadIndex(dictionary):
         raise Exception("Index for %s does not exist" % dictionary.getName())
 
     return index
+
+
+def loadFullIndex(dictionary):
+    """Load full headword index, return None if it was not made"""
+
+    dictIndex = getDataFile(dictionary, FULL_INDEX_FILE)
+
+    if not os.path.exists(dictIndex):
+        return None
+
+    return plainindex.loadHeadwordIndex(dictIndex)
      
 
-def savePlainConfiguration(dictionary):
-    """Write configuration to disk"""
+def _loadFingerprint(dictionary):
+    """Return fingerprint of the indexed file, None if unknown"""
+
+    return plainindex.loadFingerprint(getDataFile(dictionary,
+                                                  FINGERPRINT_FILE))
+
+
+def _saveFingerprint(dictionary, fingerprint):
+    """Remember fingerprint of the indexed file"""
+
+    path = getDataFile(dictionary, FINGERPRINT_FILE, True)
+
+    try:
+        plainindex.writeFingerprint(fingerprint, path)
+    except EnvironmentError as e:
+        systemLog(WARNING, "Unable to write fingerprint %s: %s" % (path, e))
+
+
+def savePlainConfiguration(dictionary, md5sum=None):
+    """Write configuration to disk.
+
+    If md5sum is not given, dictionary checksum is reused when file
+    fingerprint has not changed and calculated otherwise."""
 
     from lib import dicttype
 
@@ -442,7 +859,14 @@ def savePlainConfiguration(dictionary):
            % (dictionary.getName(), dictionary.getType()))
        return
 
-    md5sum = util.getMD5Sum(dictionary.getPath())
+    if md5sum is None:
+        if dictionary.getChecksum() \
+               and _loadFingerprint(dictionary) \
+               == plainindex.makeFingerprint(dictionary.getPath()):
+            md5sum = dictionary.getChecksum()
+        else:
+            md5sum = util.getMD5Sum(dictionary.getPath())
+
     dictDir = dictionary.getConfigDir()
 
     doc = xmltools.generatePlainDictConfig(name=dictionary.getName(),
@@ -0,0 +1,331 @@
+#
+# OpenDict
+# Copyright (c) 2003-2006 Martynas Jocius <martynas.jocius@idiles.com>
+# Copyright (c) 2007 IDILES SYSTEMS, UAB <support@idiles.com>
+# Copyright (c) 2021 Celyo <celyo@mail.bg>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your opinion) any later version.
+#
+# This program is distributed in the hope that will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MECHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more detals.
+#
+# You shoud have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301 USA
+#
+
+"""
+Full headword index for plain dictionaries
+
+The index holds one entry per headword: a lower-cased key encoded in
+UTF-8 and the byte offset of the line the headword starts at. Entries
+are sorted by key, so exact and prefix lookups are binary searches.
+
+File layout (little-endian):
+
+  magic 'ODHI', version (H), reserved (H), entry count N (I)
+  N line offsets (Q)
+  N + 1 key offsets into the key block (I)
+  key block
+
+Fingerprint of the indexed file is kept next to the index, so changes
+of the file can be noticed without reading it all.
+"""
+
+import os
+import sys
+import struct
+import bisect
+import hashlib
+from array import array
+
+
+MAGIC = b'ODHI'
+VERSION = 1
+
+_header = struct.Struct('<4sHHI')
+
+# Number and size of blocks hashed for the fingerprint
+SAMPLE_BLOCKS = 16
+SAMPLE_SIZE = 4096
+
+_fingerprintFields = ('size', 'mtime_ns', 'inode', 'sample')
+
+
+def foldKey(word):
+    """Return index key for given headword"""
+
+    return word.strip().lower().encode('UTF-8')
+
+
+class HeadwordIndex:
+    """Sorted headword table with binary search lookups"""
+
+    def __init__(self, offsets, keyOffsets, keys):
+        """Store index columns"""
+
+        self.offsets = offsets
+        self.keyOffsets = keyOffsets
+        self.keys = keys
+
+
+    def __len__(self):
+        """Return number of entries"""
+
+        return len(self.offsets)
+
+
+    def __getitem__(self, i):
+        """Return key of i-th entry"""
+
+        return self.keys[self.keyOffsets[i]:self.keyOffsets[i + 1]]
+
+
+    def getKey(self, i):
+        """Return key of i-th entry"""
+
+        return self[i]
+
+
+    def getOffset(self, i):
+        """Return byte offset of i-th entry in the dictionary file"""
+
+        return self.offsets[i]
+
+
+    def findPrefix(self, word):
+        """Return (first, last) range of entries starting with word"""
+
+        key = foldKey(word)
+        first = bisect.bisect_left(self, key)
+
+        # 0xFF never appears in UTF-8, so it sorts after every key
+        # having our key as a prefix
+        last = bisect.bisect_left(self, key + b'\xff', first)
+
+        return (first, last)
+
+
+    def findExact(self, word):
+        """Return number of the first entry equal to word, -1 if none"""
+
+        key = foldKey(word)
+        i = bisect.bisect_left(self, key)
+        if i < len(self) and self[i] == key:
+            return i
+
+        return -1
+
+
+
+def buildHeadwordIndex(entries):
+    """Make index from list of (key, offset) tuples"""
+
+    entries.sort()
+
+    offsets = array('Q')
+    keyOffsets = array('I', [0])
+    keys = []
+    size = 0
+
+    for key, offset in entries:
+        keys.append(key)
+        size += len(key)
+        offsets.append(offset)
+        keyOffsets.append(size)
+
+    return HeadwordIndex(offsets, keyOffsets, b''.join(keys))
+
+
+def writeHeadwordIndex(index, path):
+    """Write index to file"""
+
+    offsets = array('Q', index.offsets)
+    keyOffsets = array('I', index.keyOffsets)
+    if sys.byteorder != 'little':
+        offsets.byteswap()
+        keyOffsets.byteswap()
+
+    fd = open(path, 'wb')
+    fd.write(_header.pack(MAGIC, VERSION, 0, len(offsets)))
+    fd.write(offsets.tobytes())
+    fd.write(keyOffsets.tobytes())
+    fd.write(index.keys)
+    fd.close()
+
+
+def loadHeadwordIndex(path):
+    """Read index from file"""
+
+    fd = open(path, 'rb')
+    data = fd.read()
+    fd.close()
+
+    if len(data) < _header.size:
+        raise ValueError("Headword index %s is truncated" % path)
+
+    magic, version, reserved, count = _header.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("%s is not a headword index file" % path)
+
+    pos = _header.size
+    offsets = array('Q')
+    offsets.frombytes(data[pos:pos + count * offsets.itemsize])
+    pos += count * offsets.itemsize
+
+    keyOffsets = array('I')
+    keyOffsets.frombytes(data[pos:pos + (count + 1) * keyOffsets.itemsize])
+    pos += (count + 1) * keyOffsets.itemsize
+
+    if sys.byteorder != 'little':
+        offsets.byteswap()
+        keyOffsets.byteswap()
+
+    if len(offsets) != count or len(keyOffsets) != count + 1 \
+           or len(data) - pos != keyOffsets[-1]:
+        raise ValueError("Headword index %s is truncated" % path)
+
+    return HeadwordIndex(offsets, keyOffsets, data[pos:])
+
+
+def makeFingerprint(path):
+    """Return fingerprint of file: size, modification time, inode
+    and MD5 sum of sampled blocks"""
+
+    st = os.stat(path)
+    size = st.st_size
+
+    generator = hashlib.md5()
+    fd = open(path, 'rb')
+    positions = set()
+    for i in range(SAMPLE_BLOCKS):
+        positions.add(size * i // SAMPLE_BLOCKS)
+    positions.add(max(size - SAMPLE_SIZE, 0))
+    for position in sorted(positions):
+        fd.seek(position)
+        generator.update(fd.read(SAMPLE_SIZE))
+    fd.close()
+
+    return {'size': size,
+            'mtime_ns': st.st_mtime_ns,
+            'inode': st.st_ino,
+            'sample': generator.hexdigest()}
+
+
+def writeFingerprint(fingerprint, path):
+    """Write fingerprint to file"""
+
+    fd = open(path, 'w')
+    for name in _fingerprintFields:
+        print(name, fingerprint[name], file=fd)
+    fd.close()
+
+
+def loadFingerprint(path):
+    """Read fingerprint from file, return None if it is not available"""
+
+    fingerprint = {}
+
+    try:
+        fd = open(path)
+        for line in fd:
+            name, value = line.split()
+            if name == 'sample':
+                fingerprint[name] = value
+            else:
+                fingerprint[name] = int(value)
+        fd.close()
+    except (EnvironmentError, ValueError):
+        return None
+
+    for name in _fingerprintFields:
+        if not name in fingerprint:
+            return None
+
+    return fingerprint
+
+
+def splitRanges(path, parts):
+    """Split file into at most parts byte ranges. Every range starts
+    at the beginning of a line. Return list of (start, end) tuples."""
+
+    size = os.path.getsize(path)
+    bounds = [0]
+
+    fd = open(path, 'rb')
+    for i in range(1, parts):
+        position = size * i // parts
+        if position <= bounds[-1]:
+            continue
+        # Skip rest of the line unless we are at its beginning already
+        fd.seek(position - 1)
+        fd.readline()
+        position = fd.tell()
+        if bounds[-1] < position < size:
+            bounds.append(position)
+    fd.close()
+
+    bounds.append(size)
+
+    return [(bounds[i], bounds[i + 1]) for i in range(len(bounds) - 1) \
+            if bounds[i] < bounds[i + 1]]
+
+
+def indexRange(path, start, end, encoding, getHeadword=None):
+    """Index lines of byte range the same way plaindict.makeIndex() does.
+
+    Return (literals, headwords) tuple: dictionary of two-letter prefixes
+    with position of the first line having them, and list of (key,
+    offset) headword entries if getHeadword function is given.
+    UnicodeError is raised if line can not be decoded."""
+
+    literals = {}
+    headwords = []
+    count = start
+
+    fd = open(path, 'rb')
+    try:
+        fd.seek(start)
+        for line in fd:
+            if count >= end:
+                break
+
+            text = str(line.strip(), encoding)
+            literal = text[:2].lower()
+
+            # Ignore if control character found
+            if literal and not literal in literals and literal[0] > '\x19':
+                literals[literal] = count
+
+            if getHeadword:
+                headword = getHeadword(text)
+                if headword:
+                    headwords.append((foldKey(headword), count))
+
+            count += len(line)
+    finally:
+        fd.close()
+
+    return (literals, headwords)
+
+
+def mergeRanges(results):
+    """Merge indexRange() results of consecutive ranges, keeping the
+    first position of every literal"""
+
+    literals = {}
+    headwords = []
+
+    for rangeLiterals, rangeHeadwords in results:
+        for literal, position in rangeLiterals.items():
+            if not literal in literals:
+                literals[literal] = position
+        headwords.extend(rangeHeadwords)
+
+    return (literals, headwords)
@@ -0,0 +1,343 @@
+#
+# OpenDict
+# Copyright (c) 2003-2006 Martynas Jocius <martynas.jocius@idiles.com>
+# Copyright (c) 2007 IDILES SYSTEMS, UAB <support@idiles.com>
+# Copyright (c) 2021 Celyo <celyo@mail.bg>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your opinion) any later version.
+#
+# This program is distributed in the hope that will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MECHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more detals.
+#
+# You shoud have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301 USA
+#
+
+"""
+Cache of DICT server lookups
+
+Results are kept in memory (least recently used ones are dropped first)
+and, if a directory is given, on disk, one file per lookup. Results
+without definitions are cached too, but expire after their own, usually
+shorter, time.
+"""
+
+import os
+import time
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+
+from lib.logger import systemLog, DEBUG, WARNING
+
+
+# Seconds results with and without definitions are valid
+TTL = 7 * 24 * 3600
+NEGATIVE_TTL = 3600
+
+# Bytes of definitions kept in memory and on disk
+MEMORY_SIZE = 2 * 1024 * 1024
+DISK_SIZE = 32 * 1024 * 1024
+
+_suffix = '.json'
+
+
+def _resultSize(data):
+    """Return approximate size of lookup result in bytes"""
+
+    return 64 + sum([len(description) + len(text) \
+                     for description, text in data])
+
+
+class LookupCache:
+    """Two-tier cache of DICT lookups. Keys are tuples of strings and
+    numbers, values are lists of (description, definition) tuples."""
+
+    def __init__(self, path=None, ttl=TTL, negativeTTL=NEGATIVE_TTL,
+                 memorySize=MEMORY_SIZE, diskSize=DISK_SIZE):
+        """Make cache, storing files in path directory if given"""
+
+        self.ttl = ttl
+        self.negativeTTL = negativeTTL
+        self.memorySize = memorySize
+        self.diskSize = diskSize
+
+        self.entries = OrderedDict()
+        self.size = 0
+        self.path = None
+        self.diskUsed = None
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+        if path:
+            self.setPath(path)
+
+
+    def setPath(self, path):
+        """Store files in path directory, None to keep memory only"""
+
+        self.lock.acquire()
+        try:
+            self.path = path
+            self.diskUsed = None
+        finally:
+            self.lock.release()
+
+
+    def setTTL(self, ttl, negativeTTL):
+        """Set seconds results with and without definitions are valid"""
+
+        self.ttl = ttl
+        self.negativeTTL = negativeTTL
+
+
+    def setSizes(self, memorySize, diskSize):
+        """Set bytes kept in memory and on disk"""
+
+        self.lock.acquire()
+        try:
+            self.memorySize = memorySize
+            self.diskSize = diskSize
+            self._trimMemory()
+            self._trimDisk()
+        finally:
+            self.lock.release()
+
+
+    def _isFresh(self, stored, data, now):
+        """Return True if result stored at given time is still valid"""
+
+        if data:
+            ttl = self.ttl
+        else:
+            ttl = self.negativeTTL
+
+        return 0 <= now - stored < ttl
+
+
+    def _fileName(self, key):
+        """Return path of cache file for key"""
+
+        digest = hashlib.sha1(repr(key).encode('UTF-8')).hexdigest()
+        return os.path.join(self.path, digest + _suffix)
+
+
+    def get(self, key):
+        """Return cached result for key, None if there is no valid one"""
+
+        now = time.time()
+
+        self.lock.acquire()
+        try:
+            entry = self.entries.get(key)
+            if entry is not None:
+                stored, data, size = entry
+                if self._isFresh(stored, data, now):
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return data
+                del self.entries[key]
+                self.size -= size
+
+            data = self._load(key, now)
+            if data is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return data
+        finally:
+            self.lock.release()
+
+
+    def put(self, key, data):
+        """Store lookup result"""
+
+        now = time.time()
+        data = [tuple(item) for item in data]
+
+        self.lock.acquire()
+        try:
+            self._remember(key, now, data)
+            self._save(key, now, data)
+        finally:
+            self.lock.release()
+
+
+    def clear(self):
+        """Forget all results, also the ones on disk"""
+
+        self.lock.acquire()
+        try:
+            self.entries.clear()
+            self.size = 0
+            for name, size, mtime in self._listFiles():
+                self._remove(name)
+            self.diskUsed = None
+        finally:
+            self.lock.release()
+
+
+    def _remember(self, key, stored, data):
+        """Put result into memory tier"""
+
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.size -= old[2]
+
+        size = _resultSize(data)
+        if size > self.memorySize:
+            return
+
+        self.entries[key] = (stored, data, size)
+        self.size += size
+        self._trimMemory()
+
+
+    def _trimMemory(self):
+        """Drop least recently used results over memory size"""
+
+        while self.size > self.memorySize and self.entries:
+            key, entry = self.entries.popitem(last=False)
+            self.size -= entry[2]
+
+
+    def _load(self, key, now):
+        """Return valid result for key from disk, None if there is none"""
+
+        if not self.path:
+            return None
+
+        fileName = self._fileName(key)
+        try:
+            fd = open(fileName, encoding='UTF-8')
+            try:
+                record = json.load(fd)
+            finally:
+                fd.close()
+        except FileNotFoundError:
+            return None
+        except (EnvironmentError, ValueError) as e:
+            systemLog(DEBUG, "Unable to read cached lookup %s: %s" \
+                      % (fileName, e))
+            self._remove(fileName)
+            return None
+
+        data = [tuple(item) for item in record.get('data', [])]
+        stored = record.get('stored', 0)
+        if record.get('key') != list(key) \
+               or not self._isFresh(stored, data, now):
+            self._remove(fileName)
+            return None
+
+        # Modification time tells which files were used last
+        try:
+            os.utime(fileName)
+        except EnvironmentError:
+            pass
+
+        self._remember(key, stored, data)
+
+        return data
+
+
+    def _save(self, key, stored, data):
+        """Write result to disk tier"""
+
+        if not self.path:
+            return
+
+        fileName = self._fileName(key)
+        record = json.dumps({'key': list(key), 'stored': stored,
+                             'data': data})
+
+        try:
+            if not os.path.isdir(self.path):
+                os.makedirs(self.path)
+            if self.diskUsed is None:
+                self.diskUsed = sum([size for name, size, mtime \
+                                     in self._listFiles()])
+            if os.path.exists(fileName):
+                self.diskUsed -= os.path.getsize(fileName)
+
+            tempName = fileName + '.tmp'
+            fd = open(tempName, 'w', encoding='UTF-8')
+            try:
+                fd.write(record)
+            finally:
+                fd.close()
+            os.replace(tempName, fileName)
+            self.diskUsed += os.path.getsize(fileName)
+        except EnvironmentError as e:
+            systemLog(WARNING, "Unable to write lookup cache: %s" % e)
+            return
+
+        self._trimDisk()
+
+
+    def _listFiles(self):
+        """Return list of (name, size, mtime) of cache files"""
+
+        files = []
+        if not self.path:
+            return files
+
+        try:
+            names = os.listdir(self.path)
+        except EnvironmentError:
+            return files
+
+        for name in names:
+            if not name.endswith(_suffix):
+                continue
+            fileName = os.path.join(self.path, name)
+            try:
+                st = os.stat(fileName)
+            except EnvironmentError:
+                continue
+            files.append((fileName, st.st_size, st.st_mtime))
+
+        return files
+
+
+    def _trimDisk(self):
+        """Remove least recently used files over disk size"""
+
+        if self.diskUsed is None or self.diskUsed <= self.diskSize:
+            return
+
+        files = self._listFiles()
+        files.sort(key=lambda f: f[2])
+        self.diskUsed = sum([size for name, size, mtime in files])
+
+        # Go somewhat below the limit, so that the directory is not
+        # listed on every following write
+        limit = self.diskSize * 9 // 10
+        for name, size, mtime in files:
+            if self.diskUsed <= limit:
+                break
+            self._remove(name)
+            self.diskUsed -= size
+
+
+    def _remove(self, fileName):
+        """Remove cache file, ignoring errors"""
+
+        try:
+            os.unlink(fileName)
+        except EnvironmentError:
+            pass
+
+
+
+# Cache used by DICT server connections
+lookupCache = LookupCache()
@@ -0,0 +1,324 @@
+#
+# OpenDict
+# Copyright (c) 2003-2006 Martynas Jocius <martynas.jocius@idiles.com>
+# Copyright (c) 2007 IDILES SYSTEMS, UAB <support@idiles.com>
+# Copyright (c) 2021 Celyo <celyo@mail.bg>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your opinion) any later version.
+#
+# This program is distributed in the hope that will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MECHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more detals.
+#
+# You shoud have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301 USA
+#
+
+"""
+Persistent store of search results
+
+Results are kept in an SQLite database, so lookups stay fast after
+restart. Rows are found by dictionary identity, encoding and word; the
+dictionary checksum and file state are stored as fingerprint and have
+to match. Writes are done by a background thread, so searches never
+wait for the disk. When the store gets too big, results used longest
+ago are removed.
+"""
+
+import os
+import ast
+import json
+import time
+import queue
+import sqlite3
+import threading
+
+from lib.logger import systemLog, DEBUG, WARNING
+
+
+MAX_SIZE = 32 * 1024 * 1024
+
+# Results of dictionaries without checksum and file state, like DICT
+# servers, are used for this many seconds
+MAX_AGE = 7 * 24 * 3600
+
+# Number of most used results loaded into memory at startup
+PREWARM_COUNT = 500
+
+# Maximum number of writes done in one transaction
+WRITE_BATCH = 256
+
+_schema = """
+CREATE TABLE IF NOT EXISTS results (
+    key TEXT PRIMARY KEY,
+    fingerprint TEXT NOT NULL,
+    data TEXT NOT NULL,
+    notfound INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    stored REAL NOT NULL,
+    used REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS results_used ON results (used);
+CREATE INDEX IF NOT EXISTS results_hits ON results (hits);
+"""
+
+
+def splitKey(key):
+    """Return (row key, fingerprint) texts of search cache key"""
+
+    identity, checksum, state, encoding, word = key
+    return (repr((identity, encoding, word)), repr((checksum, state)))
+
+
+def joinKey(rowKey, fingerprint):
+    """Return search cache key of row key and fingerprint texts"""
+
+    identity, encoding, word = ast.literal_eval(rowKey)
+    checksum, state = ast.literal_eval(fingerprint)
+    return (identity, checksum, state, encoding, word)
+
+
+class ResultStore:
+    """SQLite store of search results with background writing"""
+
+    def __init__(self, path, maxSize=MAX_SIZE):
+        """Open or create store in file path"""
+
+        self.path = path
+        self.maxSize = maxSize
+
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        self.db = self._connect()
+        self.db.executescript(_schema)
+        self.db.commit()
+        self.lock = threading.Lock()
+        self.closed = False
+
+        self.queue = queue.Queue()
+        self.writer = threading.Thread(target=self._write,
+                                       name="ResultStoreWriter")
+        self.writer.daemon = True
+        self.writer.start()
+
+
+    def _connect(self):
+        """Return new database connection"""
+
+        db = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        return db
+
+
+    def _enqueue(self, task):
+        """Queue write task for the writer thread unless the store is
+        closed"""
+
+        self.lock.acquire()
+        try:
+            if not self.closed:
+                self.queue.put(task)
+        finally:
+            self.lock.release()
+
+
+    def get(self, key, makeResult):
+        """Return stored result for search cache key, None if there is
+        no valid one. makeResult(translation, words, notFound) is used
+        to make the result object."""
+
+        rowKey, fingerprint = splitKey(key)
+
+        self.lock.acquire()
+        try:
+            if self.closed:
+                return None
+            row = self.db.execute("SELECT fingerprint, data, notfound, "
+                                  "stored FROM results WHERE key = ?",
+                                  (rowKey,)).fetchone()
+        finally:
+            self.lock.release()
+
+        if row is None:
+            return None
+
+        storedFingerprint, data, notFound, stored = row
+        if storedFingerprint != fingerprint or not self._isFresh(key, stored):
+            self._enqueue(('delete', rowKey))
+            return None
+
+        try:
+            translation, words = json.loads(data)
+        except Exception as e:
+            systemLog(WARNING, "Invalid stored result: %s" % e)
+            self._enqueue(('delete', rowKey))
+            return None
+
+        self._enqueue(('touch', rowKey, time.time()))
+
+        return makeResult(translation, words, notFound)
+
+
+    def touch(self, key):
+        """Count use of result found elsewhere, like in memory cache"""
+
+        self._enqueue(('touch', splitKey(key)[0], time.time()))
+
+
+    def put(self, key, translation, words, notFound):
+        """Store result in the background"""
+
+        rowKey, fingerprint = splitKey(key)
+        # Translation is a string and words a list of strings, JSON
+        # keeps them without running code on load like pickle could
+        try:
+            data = json.dumps((translation, words))
+        except (TypeError, ValueError) as e:
+            systemLog(DEBUG, "Unable to store result: %s" % e)
+            return
+        self._enqueue(('put', rowKey, fingerprint, data, notFound,
+                       time.time()))
+
+
+    def getMostUsed(self, count=PREWARM_COUNT):
+        """Return list of (key, translation, words, notFound) of most
+        used results"""
+
+        self.lock.acquire()
+        try:
+            if self.closed:
+                return []
+            rows = self.db.execute("SELECT key, fingerprint, data, notfound, "
+                                   "stored FROM results ORDER BY hits DESC "
+                                   "LIMIT ?", (count,)).fetchall()
+        finally:
+            self.lock.release()
+
+        results = []
+        for rowKey, fingerprint, data, notFound, stored in rows:
+            try:
+                key = joinKey(rowKey, fingerprint)
+                translation, words = json.loads(data)
+            except Exception:
+                continue
+            if self._isFresh(key, stored):
+                results.append((key, translation, words, notFound))
+
+        return results
+
+
+    def flush(self):
+        """Wait until queued writes are done"""
+
+        self.queue.join()
+
+
+    def close(self):
+        """Finish writing and close the store"""
+
+        self.lock.acquire()
+        try:
+            if self.closed:
+                return
+            self.closed = True
+            self.db.close()
+        finally:
+            self.lock.release()
+
+        self.queue.put(None)
+        self.writer.join()
+
+
+    def _isFresh(self, key, stored):
+        """Return False if result of dictionary without fingerprint is
+        too old"""
+
+        identity, checksum, state, encoding, word = key
+        if checksum is None and state is None:
+            return 0 <= time.time() - stored < MAX_AGE
+
+        return True
+
+
+    def _write(self):
+        """Writer thread: do queued writes in batches"""
+
+        db = self._connect()
+        running = True
+
+        while running:
+            tasks = [self.queue.get()]
+            while len(tasks) < WRITE_BATCH:
+                try:
+                    tasks.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            wrote = False
+            try:
+                for task in tasks:
+                    if task is None:
+                        running = False
+                    elif task[0] == 'put':
+                        rowKey, fingerprint, data, notFound, now = task[1:]
+                        db.execute("INSERT OR REPLACE INTO results (key, "
+                                   "fingerprint, data, notfound, size, "
+                                   "stored, used, hits) VALUES (?, ?, ?, ?, "
+                                   "?, ?, ?, COALESCE((SELECT hits FROM "
+                                   "results WHERE key = ?), 0))",
+                                   (rowKey, fingerprint, data, notFound,
+                                    len(rowKey) + len(data), now, now,
+                                    rowKey))
+                        wrote = True
+                    elif task[0] == 'touch':
+                        db.execute("UPDATE results SET used = ?, "
+                                   "hits = hits + 1 WHERE key = ?",
+                                   (task[2], task[1]))
+                    elif task[0] == 'delete':
+                        db.execute("DELETE FROM results WHERE key = ?",
+                                   (task[1],))
+                if wrote:
+                    self._evict(db)
+                db.commit()
+            except sqlite3.Error as e:
+                systemLog(WARNING, "Unable to write result store: %s" % e)
+                db.rollback()
+
+            for task in tasks:
+                self.queue.task_done()
+
+        db.close()
+
+
+    def _evict(self, db):
+        """Remove results used longest ago while over size"""
+
+        size = db.execute("SELECT COALESCE(SUM(size), 0) "
+                          "FROM results").fetchone()[0]
+        if size <= self.maxSize:
+            return
+
+        # Go somewhat below the limit, so that eviction is not needed
+        # on every following write
+        excess = size - self.maxSize * 9 // 10
+        removed = 0
+        keys = []
+        for rowKey, rowSize in db.execute("SELECT key, size FROM results "
+                                          "ORDER BY used"):
+            keys.append((rowKey,))
+            removed += rowSize
+            if removed >= excess:
+                break
+
+        db.executemany("DELETE FROM results WHERE key = ?", keys)
+        systemLog(DEBUG, "Removed %d results from store" % len(keys))
@@ -0,0 +1,302 @@
+#
+# OpenDict
+# Copyright (c) 2003-2006 Martynas Jocius <martynas.jocius@idiles.com>
+# Copyright (c) 2007 IDILES SYSTEMS, UAB <support@idiles.com>
+# Copyright (c) 2021 Celyo <celyo@mail.bg>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your opinion) any later version.
+#
+# This program is distributed in the hope that will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MECHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more detals.
+#
+# You shoud have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301 USA
+#
+
+"""
+Cache of search results
+
+Results of Dictionary.search() are kept in memory, least recently used
+ones are dropped first. A result is found by dictionary identity,
+checksum and file state, encoding and the searched word, so results of
+a changed dictionary are not used. A persistent result store may be
+attached to keep results between runs.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+
+from lib import meta
+from lib import errortype
+
+
+MAX_ENTRIES = 256
+MAX_SIZE = 4 * 1024 * 1024
+
+# Results with these errors do not depend on the moment of search
+_cachedErrors = (errortype.OK, errortype.NOT_FOUND)
+
+
+def getResultSize(result):
+    """Return approximate size of search result in bytes"""
+
+    size = 64 + len(result.getTranslation() or '')
+    for word in result.getWordList() or []:
+        size += len(word) + 8
+
+    return size
+
+
+def makeResult(translation, words, notFound):
+    """Return search result made of stored values"""
+
+    result = meta.SearchResult()
+    result.setTranslation(translation)
+    result.setWordList(words)
+    if notFound:
+        result.setError(errortype.NOT_FOUND)
+
+    return result
+
+
+def getWordKey(word, encoding):
+    """Return searched word as unicode string. It is not stripped or
+    normalized, as parsers may give other results for such words."""
+
+    if isinstance(word, bytes):
+        word = word.decode(encoding or 'UTF-8', 'surrogateescape')
+
+    return word
+
+
+class SearchCache:
+    """LRU cache of search results bound by entry count and size"""
+
+    def __init__(self, maxEntries=MAX_ENTRIES, maxSize=MAX_SIZE):
+        """Make empty cache"""
+
+        self.maxEntries = maxEntries
+        self.maxSize = maxSize
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+        self.store = None
+
+        self.resetStats()
+
+
+    def setLimits(self, maxEntries, maxSize):
+        """Set number of results and bytes kept"""
+
+        self.lock.acquire()
+        try:
+            self.maxEntries = maxEntries
+            self.maxSize = maxSize
+            self._trim()
+        finally:
+            self.lock.release()
+
+
+    def setStore(self, store):
+        """Use persistent result store for results not in memory, None
+        to stop using it. The old store is closed."""
+
+        old = self.store
+        self.store = store
+        if old is not None:
+            old.close()
+
+
+    def prewarm(self, count, job=None):
+        """Load most used results of the store into memory, no more
+        than fit in the cache"""
+
+        store = self.store
+        if store is None:
+            return 0
+
+        # Least used are put first, so the most used ones end up most
+        # recently used and are dropped last
+        results = store.getMostUsed(min(count, self.maxEntries))
+        results.reverse()
+        for i, (key, translation, words, notFound) in enumerate(results):
+            if job is not None:
+                job.update(i, len(results))
+            self.lock.acquire()
+            try:
+                known = key in self.entries
+            finally:
+                self.lock.release()
+            if not known:
+                self.put(key, makeResult(translation, words, notFound))
+
+        return len(results)
+
+
+    def resetStats(self):
+        """Set hit, miss and eviction counters to zero"""
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.storeHits = 0
+
+
+    def getStats(self):
+        """Return dictionary of counters, number of entries and size"""
+
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'storeHits': self.storeHits,
+                'entries': len(self.entries),
+                'size': self.size}
+
+
+    def getKey(self, dictionary, word):
+        """Return cache key for search of word in dictionary, None if
+        results of dictionary can not be cached"""
+
+        identity = dictionary.getCacheKey()
+        if identity is None:
+            return None
+
+        # Size and modification time notice file changes even before
+        # the checksum is updated
+        state = None
+        path = dictionary.getPath()
+        if path:
+            try:
+                st = os.stat(path)
+                state = (st.st_size, st.st_mtime_ns)
+            except (EnvironmentError, TypeError, ValueError):
+                pass
+
+        checksum = None
+        if hasattr(dictionary, 'getChecksum'):
+            checksum = dictionary.getChecksum()
+
+        encoding = dictionary.getEncoding()
+
+        return (identity, checksum, state, encoding,
+                getWordKey(word, encoding))
+
+
+    def search(self, dictionary, word):
+        """Return result of dictionary.search(word), from cache if
+        possible"""
+
+        try:
+            key = self.getKey(dictionary, word)
+        except Exception:
+            key = None
+
+        if key is not None:
+            self.lock.acquire()
+            try:
+                entry = self.entries.get(key)
+                if entry is not None:
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                else:
+                    self.misses += 1
+            finally:
+                self.lock.release()
+
+            store = self.store
+            if entry is not None:
+                # Use counts of the store decide what is prewarmed
+                if store is not None:
+                    store.touch(key)
+                return entry[0]
+
+            if store is not None:
+                result = store.get(key, makeResult)
+                if result is not None:
+                    self.storeHits += 1
+                    self.put(key, result)
+                    return result
+
+        result = dictionary.search(word)
+
+        if key is not None and isinstance(result, meta.SearchResult) \
+               and result.getError() in _cachedErrors:
+            self.put(key, result)
+            store = self.store
+            if store is not None:
+                store.put(key, result.getTranslation(),
+                          result.getWordList(),
+                          result.getError() == errortype.NOT_FOUND)
+
+        return result
+
+
+    def put(self, key, result):
+        """Store search result"""
+
+        size = getResultSize(result)
+
+        self.lock.acquire()
+        try:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.size -= old[1]
+            if size <= self.maxSize:
+                self.entries[key] = (result, size)
+                self.size += size
+                self._trim()
+        finally:
+            self.lock.release()
+
+
+    def invalidate(self, dictionary):
+        """Drop results of dictionary"""
+
+        identity = dictionary.getCacheKey()
+
+        self.lock.acquire()
+        try:
+            for key in [k for k in self.entries if k[0] == identity]:
+                self.size -= self.entries.pop(key)[1]
+        finally:
+            self.lock.release()
+
+
+    def clear(self):
+        """Drop all results"""
+
+        self.lock.acquire()
+        try:
+            self.entries.clear()
+            self.size = 0
+        finally:
+            self.lock.release()
+
+
+    def _trim(self):
+        """Drop least recently used results over limits"""
+
+        while self.entries and (len(self.entries) > self.maxEntries
+                                or self.size > self.maxSize):
+            key, entry = self.entries.popitem(last=False)
+            self.size -= entry[1]
+            self.evictions += 1
+
+
+
+# Cache used for searches in the main window
+resultCache = SearchCache()
+
+
+def search(dictionary, word):
+    """Search word in dictionary using the result cache"""
+
+    return resultCache.search(dictionary, word)
@@ -0,0 +1,135 @@
+#
+# OpenDict
+# Copyright (c) 2003-2006 Martynas Jocius <martynas.jocius@idiles.com>
+# Copyright (c) 2007 IDILES SYSTEMS, UAB <support@idiles.com>
+# Copyright (c) 2021 Celyo <celyo@mail.bg>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your opinion) any later version.
+#
+# This program is distributed in the hope that will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MECHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more detals.
+#
+# You shoud have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301 USA
+#
+
+"""
+DICT server metadata cache
+
+Database list, strategies and database information of every server
+used are kept in a file. The server greeting serves as the version of
+the data: when it changes, or the data gets old, everything is fetched
+again, with all SHOW commands sent at once.
+"""
+
+import os
+import re
+import time
+import json
+import asyncio
+
+from lib import info
+from lib.extra import aiodictclient
+from lib.logger import systemLog, DEBUG, WARNING
+
+
+# Seconds metadata is used without fetching it again, even if the
+# server greeting is the same
+MAX_AGE = 7 * 24 * 3600
+
+
+def getMetadataPath(server, port):
+    """Return path of metadata file of server"""
+
+    name = "%s_%d.json" % (re.sub(r'[^\w.-]', '_', server), port)
+    return os.path.join(info.LOCAL_HOME, 'cache', 'servers', name)
+
+
+def loadMetadata(path):
+    """Read metadata from file, return None if it is not available"""
+
+    try:
+        fd = open(path, encoding='UTF-8')
+        try:
+            metadata = json.load(fd)
+        finally:
+            fd.close()
+    except FileNotFoundError:
+        return None
+    except (EnvironmentError, ValueError) as e:
+        systemLog(WARNING, "Unable to read server metadata %s: %s" \
+                  % (path, e))
+        return None
+
+    for name in ('version', 'fetched', 'databases', 'strategies', 'info'):
+        if not name in metadata:
+            return None
+
+    return metadata
+
+
+def writeMetadata(metadata, path):
+    """Write metadata to file"""
+
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    tempPath = path + '.tmp'
+    fd = open(tempPath, 'w', encoding='UTF-8')
+    try:
+        json.dump(metadata, fd)
+    finally:
+        fd.close()
+    os.replace(tempPath, path)
+
+
+async def fetchMetadata(server, port, cached=None):
+    """Return metadata of server. If cached metadata is given and is
+    still valid, it is returned after checking the server greeting."""
+
+    conn = await aiodictclient.connect(server, port)
+    try:
+        version = conn.getbanner()
+        if cached and cached['version'] == version \
+               and 0 <= time.time() - cached['fetched'] < MAX_AGE:
+            return cached
+
+        databases, strategies = await asyncio.gather(conn.getdbdescs(),
+                                                     conn.getstratdescs())
+        names = list(databases)
+        infos = await asyncio.gather(*[conn.getdbobj(name).getinfo() \
+                                       for name in names])
+    finally:
+        await conn.close()
+
+    return {'version': version,
+            'fetched': time.time(),
+            'databases': databases,
+            'strategies': strategies,
+            'info': dict(zip(names, infos))}
+
+
+def updateMetadata(server, port, job=None):
+    """Fetch metadata of server if cached one is outdated and return it.
+    Runs in the background event loop of aiodictclient."""
+
+    path = getMetadataPath(server, port)
+    cached = loadMetadata(path)
+    metadata = aiodictclient.run(fetchMetadata(server, port, cached))
+
+    if metadata is not cached:
+        systemLog(DEBUG, "Fetched metadata of %s:%d" % (server, port))
+        try:
+            writeMetadata(metadata, path)
+        except EnvironmentError as e:
+            systemLog(WARNING, "Unable to write server metadata: %s" % e)
+
+    return metadata
@@ -0,0 +1,508 @@
+#
+# OpenDict
+# Copyright (c) 2003-2006 Martynas Jocius <martynas.jocius@idiles.com>
+# Copyright (c) 2007 IDILES SYSTEMS, UAB <support@idiles.com>
+# Copyright (c) 2021 Celyo <celyo@mail.bg>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your opinion) any later version.
+#
+# This program is distributed in the hope that will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MECHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more detals.
+#
+# You shoud have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301 USA
+#
+
+"""
+SQLite dictionaries
+
+A dictionary is a single SQLite file. Headwords are kept with their
+case folded keys in a table indexed by key, so exact and prefix lookups
+are index searches and do not load the dictionary into memory.
+Definitions are kept as HTML and, if SQLite has FTS5, their text is
+indexed for full text search.
+
+Dictionaries of the other plain formats are imported with
+importDictionary().
+"""
+
+import os
+import re
+import time
+import sqlite3
+import threading
+import unicodedata
+from html import escape
+
+from lib import meta
+from lib import errortype
+from lib import plaindict
+from lib.logger import systemLog, debugLog, DEBUG, WARNING
+
+
+FORMAT = 'opendict-sqlite'
+VERSION = 1
+
+# Most headwords returned for the word list
+WORD_LIST_LIMIT = 1000
+
+# Entries inserted at once while importing
+IMPORT_BATCH = 1000
+
+WORD_BG = "#dde2f1"
+
+_schema = """
+CREATE TABLE info (name TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE entries (
+    id INTEGER PRIMARY KEY,
+    headword TEXT NOT NULL,
+    folded TEXT NOT NULL,
+    title TEXT NOT NULL,
+    definition TEXT NOT NULL
+);
+"""
+
+_indexes = """
+CREATE INDEX entries_folded ON entries (folded);
+"""
+
+_fullText = """
+CREATE VIRTUAL TABLE fulltext USING fts5(text);
+"""
+
+_tags = re.compile(r'<[^>]*>')
+
+# Greater than any character, ends ranges of keys with a prefix
+_lastChar = '\U0010ffff'
+
+
+def foldKey(word):
+    """Return case folded key of headword"""
+
+    return unicodedata.normalize('NFC', word.strip()).lower()
+
+
+def getText(html):
+    """Return text of HTML definition for full text index"""
+
+    text = _tags.sub(' ', html)
+    for entity, char in (('&lt;', '<'), ('&gt;', '>'), ('&quot;', '"'),
+                         ('&nbsp;', ' '), ('&amp;', '&')):
+        text = text.replace(entity, char)
+
+    return text
+
+
+def _quoteQuery(query):
+    """Return FTS5 query matching all words of query"""
+
+    return " ".join(['"%s"' % word.replace('"', '""') \
+                     for word in query.split()])
+
+
+class SQLiteDictionary(plaindict.PlainDictionary):
+    """Dictionary stored in SQLite file"""
+
+    def __init__(self, filePath):
+        """Initialize"""
+
+        self.filePath = filePath
+        self.needsList = True
+        self.name = os.path.splitext(os.path.basename(filePath))[0]
+        self.encoding = 'UTF-8'
+        self.checksum = None
+
+        self.configChanged = False
+
+        self.hasFullText = False
+        self.local = None
+        self.connections = []
+        self.lock = threading.Lock()
+
+
+    def start(self):
+        """Check the file and get ready for searching"""
+
+        self.local = threading.local()
+        db = self._getConnection()
+
+        info = dict(db.execute("SELECT name, value FROM info"))
+        if info.get('format') != FORMAT:
+            raise Exception("%s is not an OpenDict SQLite dictionary" \
+                            % self.filePath)
+        if int(info.get('version', 0)) > VERSION:
+            raise Exception("%s needs newer OpenDict" % self.filePath)
+
+        self.hasFullText = info.get('fulltext') == '1'
+
+
+    def stop(self):
+        """Close connections of all threads"""
+
+        self.lock.acquire()
+        try:
+            for db in self.connections:
+                try:
+                    db.close()
+                except sqlite3.Error:
+                    pass
+            self.connections = []
+            self.local = None
+        finally:
+            self.lock.release()
+
+
+    def _getConnection(self):
+        """Return read-only connection of current thread. Threads share
+        the file, but not connections."""
+
+        local = self.local
+        if local is None:
+            raise Exception("Dictionary %s is not started" % self.name)
+
+        db = getattr(local, 'db', None)
+        if db is None:
+            uri = 'file:%s?mode=ro' % os.path.abspath(self.filePath) \
+                  .replace('?', '%3f').replace('#', '%23')
+            db = sqlite3.connect(uri, uri=True, check_same_thread=False)
+            local.db = db
+            self.lock.acquire()
+            try:
+                self.connections.append(db)
+            finally:
+                self.lock.release()
+
+        return db
+
+
+    def getPath(self):
+        """Return full file path"""
+
+        return self.filePath
+
+
+    def getType(self):
+        """Return dictionary type"""
+
+        from lib import dicttype
+        return dicttype.SQLITE
+
+
+    def setName(self, name):
+        """Set new name"""
+
+        self.name = name
+
+
+    def getName(self):
+        """Return file name"""
+
+        return self.name
+
+
+    def setEncoding(self, encoding):
+        """Set encoding"""
+
+        self.encoding = encoding
+
+
+    def getEncoding(self):
+        """Return encoding set for that dictionary"""
+
+        return self.encoding
+
+
+    def setChecksum(self, newSum, first=False):
+        """Set checksum. Used after checksum change"""
+
+        if self.checksum == None:
+            self.configChanged = True
+
+        self.checksum = newSum
+
+
+    def getChecksum(self):
+        """Return checksum"""
+
+        return self.checksum
+
+
+    def getUsesWordList(self):
+        """Return True if uses word list, False otherwise"""
+
+        return self.needsList
+
+
+    def getWords(self, prefix, limit=WORD_LIST_LIMIT):
+        """Return headwords starting with prefix, ignoring case"""
+
+        folded = foldKey(self._decodeWord(prefix))
+        rows = self._getConnection().execute(
+            "SELECT headword FROM entries WHERE folded >= ? AND folded < ? "
+            "ORDER BY folded, id LIMIT ?",
+            (folded, folded + _lastChar, limit))
+
+        return [row[0] for row in rows]
+
+
+    def getEntry(self, word):
+        """Return (title, definition) of word, entries written in the
+        same case first. None if there is no such word."""
+
+        word = self._decodeWord(word)
+        return self._getConnection().execute(
+            "SELECT title, definition FROM entries WHERE folded = ? "
+            "ORDER BY headword != ?, id LIMIT 1",
+            (foldKey(word), word.strip())).fetchone()
+
+
+    def searchText(self, query, limit=WORD_LIST_LIMIT):
+        """Return headwords of definitions containing all words of
+        query, best matches first"""
+
+        if not self.hasFullText or not query.strip():
+            return []
+
+        try:
+            rows = self._getConnection().execute(
+                "SELECT entries.headword FROM fulltext JOIN entries "
+                "ON entries.id = fulltext.rowid WHERE fulltext MATCH ? "
+                "ORDER BY rank LIMIT ?", (_quoteQuery(query), limit))
+            return [row[0] for row in rows]
+        except sqlite3.Error as e:
+            systemLog(WARNING, "Full text search failed: %s" % e)
+            return []
+
+
+    def search(self, word):
+        """Lookup word"""
+
+        _start = time.time()
+
+        result = meta.SearchResult()
+
+        words = self.getWords(word)
+        entry = self.getEntry(word)
+        if entry is None and words:
+            entry = self.getEntry(words[0])
+
+        html = []
+
+        html.append("<html><head>")
+        html.append("<meta http-equiv=\"Content-Type\" " \
+                    "content=\"text/html; charset=%s\">" \
+                    % str(self.getEncoding()))
+        html.append("<head><body>")
+
+        if entry:
+            title, definition = entry
+            html.append("<table width=\"100%\"><tr>")
+            html.append("<td bgcolor=\"%s\">" % WORD_BG)
+            html.append("<b>%s</b></td></tr>" % escape(title))
+            html.append("<tr><td>")
+            html.append("<p>%s</p>" % definition)
+            html.append("</td></tr></table>")
+        else:
+            result.setError(errortype.NOT_FOUND)
+
+        html.append("</body></html>")
+
+        result.setTranslation("".join(html))
+        result.setWordList(words)
+
+        debugLog(DEBUG, "SQLiteDictionary: Search took %f seconds" \
+                 % (time.time() - _start))
+
+        return result
+
+
+
+def _readLines(dictionary, job=None):
+    """Yield decoded lines of line-oriented dictionary file"""
+
+    encoding = dictionary.getEncoding() or 'UTF-8'
+    total = os.path.getsize(dictionary.getPath())
+
+    fd = open(dictionary.getPath(), 'rb')
+    try:
+        for number, line in enumerate(fd):
+            if job is not None and number % plaindict.PROGRESS_LINES == 0:
+                job.update(fd.tell(), total)
+            yield line.decode(encoding, 'replace').strip()
+    finally:
+        fd.close()
+
+
+def _slowoEntries(dictionary, job=None):
+    """Yield (headword, title, definition) of Slowo dictionary"""
+
+    for line in _readLines(dictionary, job):
+        headword = dictionary.getHeadword(line)
+        if headword:
+            yield (headword, headword, dictionary._formatTranslation(line))
+
+
+def _movaEntries(dictionary, job=None):
+    """Yield (headword, title, definition) of Mova dictionary"""
+
+    for line in _readLines(dictionary, job):
+        headword = dictionary.getHeadword(line)
+        if headword:
+            # Definitions are stored as HTML, Mova ones are plain text
+            yield (headword, headword,
+                   escape(line.split("  ", 1)[1].strip()))
+
+
+def _dictEntries(dictionary, job=None):
+    """Yield (headword, title, definition) of dictd dictionary"""
+
+    dictionary.start()
+    try:
+        words = dictionary.dict.getdeflist()
+        for number, word in enumerate(words):
+            if job is not None and number % plaindict.PROGRESS_LINES == 0:
+                job.update(number, len(words))
+            # Titles are stored as plain text, search() adds markup
+            title, definition = dictionary._getTranslation(word,
+                                                           markup=False)
+            if definition:
+                yield (word, title, definition)
+    finally:
+        dictionary.stop()
+
+
+def _sqliteEntries(dictionary, job=None):
+    """Yield (headword, title, definition) of SQLite dictionary"""
+
+    dictionary.start()
+    try:
+        db = dictionary._getConnection()
+        total = db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        rows = db.execute("SELECT headword, title, definition FROM entries "
+                          "ORDER BY id")
+        for number, row in enumerate(rows):
+            if job is not None and number % plaindict.PROGRESS_LINES == 0:
+                job.update(number, total)
+            yield row
+    finally:
+        dictionary.stop()
+
+
+def _odxEntries(dictionary, job=None):
+    """Yield (headword, title, definition) of compiled dictionary"""
+
+    dictionary.start()
+    try:
+        for number, entry in enumerate(dictionary.getEntries()):
+            if job is not None and number % plaindict.PROGRESS_LINES == 0:
+                job.update(number, len(dictionary))
+            yield entry
+    finally:
+        dictionary.stop()
+
+
+# Entry readers by dictionary type ID name
+_importers = {'slowo': _slowoEntries,
+              'mova': _movaEntries,
+              'dict': _dictEntries,
+              'sqlite': _sqliteEntries,
+              'odx': _odxEntries}
+
+
+def getEntries(dictionary, job=None):
+    """Return iterator over (headword, title, definition) of plain
+    dictionary of any type"""
+
+    importer = _importers.get(dictionary.getType().getIdName())
+    if importer is None:
+        raise Exception("Dictionaries of type %s cannot be imported" \
+                        % dictionary.getType().getName())
+
+    return importer(dictionary, job)
+
+
+def writeDictionary(entries, filePath, name=None, job=None):
+    """Write SQLite dictionary of (headword, title, definition) tuples.
+    Return number of entries written."""
+
+    tempPath = filePath + '.tmp'
+    if os.path.exists(tempPath):
+        os.unlink(tempPath)
+
+    db = sqlite3.connect(tempPath)
+    try:
+        db.execute("PRAGMA journal_mode=OFF")
+        db.execute("PRAGMA synchronous=OFF")
+        db.executescript(_schema)
+
+        try:
+            db.executescript(_fullText)
+            fullText = True
+        except sqlite3.Error as e:
+            systemLog(WARNING, "SQLite has no full text search: %s" % e)
+            fullText = False
+
+        count = 0
+        batch = []
+        for headword, title, definition in entries:
+            count += 1
+            batch.append((count, headword, foldKey(headword), title,
+                          definition))
+            if len(batch) >= IMPORT_BATCH:
+                _insert(db, batch, fullText)
+                batch = []
+        _insert(db, batch, fullText)
+
+        # Index is made after all rows are in, which is much faster
+        if job is not None:
+            job.update(99, 100)
+        db.executescript(_indexes)
+        if fullText:
+            db.execute("INSERT INTO fulltext (fulltext) VALUES ('optimize')")
+
+        info = {'format': FORMAT,
+                'version': str(VERSION),
+                'fulltext': fullText and '1' or '0',
+                'entries': str(count)}
+        if name:
+            info['name'] = name
+        db.executemany("INSERT INTO info (name, value) VALUES (?, ?)",
+                       list(info.items()))
+        db.commit()
+        db.execute("VACUUM")
+    finally:
+        db.close()
+
+    os.replace(tempPath, filePath)
+
+    return count
+
+
+def _insert(db, batch, fullText):
+    """Insert batch of (id, headword, folded, title, definition)"""
+
+    db.executemany("INSERT INTO entries (id, headword, folded, title, "
+                   "definition) VALUES (?, ?, ?, ?, ?)", batch)
+    if fullText:
+        db.executemany("INSERT INTO fulltext (rowid, text) VALUES (?, ?)",
+                       [(row[0], getText(row[4])) for row in batch])
+
+
+def importDictionary(dictionary, filePath, job=None):
+    """Write plain dictionary of any type to SQLite file. Takes long
+    for big dictionaries, so it is meant to be run as threads.Job."""
+
+    _start = time.time()
+    count = writeDictionary(getEntries(dictionary, job), filePath,
+                            dictionary.getName(), job)
+    systemLog(DEBUG, "Imported %d entries of %s in %f seconds" \
+              % (count, dictionary.getName(), time.time() - _start))
+
+    return count
@@ -0,0 +1,133 @@
+#
+# OpenDict
+# Copyright (c) 2003-2006 Martynas Jocius <martynas.jocius@idiles.com>
+# Copyright (c) 2007 IDILES SYSTEMS, UAB <support@idiles.com>
+#
+# Unit Test for aiodictclient.py
+#
+
+"""
+Unit tests for aiodictclient.py
+"""
+
+import unittest
+import asyncio
+import socket
+import sys
+
+sys.path.append('../..')
+
+from lib.extra import aiodictclient
+from lib.extra import dictclient
+from test_dictclient import FakeServer
+
+
+class TestConnection(unittest.TestCase):
+    """asyncio Connection test"""
+
+    def setUp(self):
+        self.servers = [FakeServer(), FakeServer()]
+        self.ports = [s.server_address[1] for s in self.servers]
+
+
+    def tearDown(self):
+        for server in self.servers:
+            server.stop()
+
+
+    def test_concurrent(self):
+        """Servers and databases should be queried from one loop"""
+
+        async def lookup():
+            conns = await asyncio.gather(
+                *[aiodictclient.connect('127.0.0.1', port) \
+                  for port in self.ports])
+            results = await asyncio.gather(conns[0].define('test', 'apple'),
+                                           conns[0].define('other', 'apple'),
+                                           conns[1].match('*', 'prefix', 'p'),
+                                           conns[1].define('!', 'plum'))
+            for conn in conns:
+                await conn.close()
+            return results
+
+        results = asyncio.run(lookup())
+        self.assertEqual([[(d.getdb().getdescription(), d.getdefstr()) \
+                           for d in r] for r in results],
+                         [[('Test Dictionary', 'apple\nA fruit.')],
+                          [('Other Dictionary', 'apple\nA company.')],
+                          [('Test Dictionary', None)],
+                          []])
+        self.assertEqual(results[2][0].getword(), 'pear')
+        for server in self.servers:
+            self.assertEqual(server.connections, 1)
+
+
+    def test_timeout(self):
+        """Silent server should time out"""
+
+        listener = socket.socket()
+        listener.bind(('127.0.0.1', 0))
+        listener.listen(1)
+        try:
+            self.assertRaises(asyncio.TimeoutError, asyncio.run,
+                              aiodictclient.connect('127.0.0.1',
+                                                    listener.getsockname()[1],
+                                                    connecttimeout=0.2))
+        finally:
+            listener.close()
+
+
+    def test_sharedShow(self):
+        """Concurrent callers should share one SHOW DB request"""
+
+        async def lookup():
+            conn = await aiodictclient.connect('127.0.0.1', self.ports[0])
+            results = await asyncio.gather(conn.getdbdescs(),
+                                           conn.define('test', 'apple'),
+                                           conn.match('*', 'exact', 'pear'))
+            await conn.close()
+            return results
+
+        dbdescs, defs, matches = asyncio.run(lookup())
+        self.assertEqual(sorted(dbdescs), ['other', 'test'])
+        self.assertEqual(defs[0].getdefstr(), 'apple\nA fruit.')
+        self.assertEqual(matches[0].getword(), 'pear')
+        # SHOW DB and SHOW STRAT once each
+        self.assertEqual(self.servers[0].commands.count('SHOW'), 2)
+
+
+    def test_sync(self):
+        """Blocking facade should work in a dictclient server group"""
+
+        pool = dictclient.ConnectionPool(
+            connection=aiodictclient.SyncConnection)
+        group = dictclient.ServerGroup([('127.0.0.1', self.ports[0])], pool)
+
+        def lookup(conn):
+            self.assertTrue(isinstance(conn, aiodictclient.SyncConnection))
+            conn.checkdefine('test')
+            conn.checkmatch('*', 'prefix')
+            conn.sendcommands([conn.definecommand('test', 'apple'),
+                               conn.matchcommand('*', 'prefix', 'p')])
+            return ([d.getdefstr() for d in conn.getdefinitions()],
+                    [d.getword() for d in conn.getmatches()])
+
+        for i in range(2):
+            self.assertEqual(group.run(lookup),
+                             (['apple\nA fruit.'], ['pear']))
+
+        conn = pool.get('127.0.0.1', self.ports[0])
+        self.assertTrue(conn.isalive())
+        self.assertEqual([[d.getdb().getname() for d in r] \
+                          for r in conn.define_many('*', ['apple', 'plum'])],
+                         [['other', 'test'], []])
+        self.assertRaises(ValueError, conn.sendcommand, 'SHOW DB')
+        conn.close()
+
+        # One connection is reused, SHOW DB is asked once for the pool
+        self.assertEqual(self.servers[0].connections, 1)
+        self.assertEqual(self.servers[0].commands.count('SHOW'), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,339 @@
+#
+# OpenDict
+# Copyright (c) 2003-2006 Martynas Jocius <martynas.jocius@idiles.com>
+# Copyright (c) 2007 IDILES SYSTEMS, UAB <support@idiles.com>
+#
+# Unit Test for dictclient.py
+#
+
+"""
+Unit tests for dictclient.py
+"""
+
+import unittest
+import re
+import socketserver
+import threading
+import socket
+import time
+import sys
+
+sys.path.append('../..')
+
+from lib.extra import dictclient
+
+
+DATABASES = {'test': 'Test Dictionary', 'other': 'Other Dictionary'}
+STRATEGIES = {'exact': 'Match headwords exactly',
+              'prefix': 'Match prefixes'}
+DEFINITIONS = {'test': {'apple': 'apple\n  A fruit.',
+                        'pear': 'pear\n  Another fruit.',
+                        'dot': 'dot\n.\n..two\n\nend'},
+               'other': {'apple': 'apple\n  A company.'}}
+
+
+class FakeHandler(socketserver.StreamRequestHandler):
+    """Minimal DICT server session"""
+
+    def send(self, text):
+        self.wfile.write((text + "\r\n").encode('utf-8'))
+
+
+    def sendBlock(self, lines):
+        for line in lines:
+            if line.startswith('.'):
+                line = '.' + line
+            self.send(line)
+        self.send(".")
+
+
+    def handle(self):
+        server = self.server
+        server.connections += 1
+        server.messageId += 1
+        self.send("220 %s <mime.auth> <%d@fake>" % (server.banner,
+                                                    server.messageId))
+
+        for line in self.rfile:
+            words = [dictclient.dequote(word) for word in
+                     re.findall(r'"[^"]*"|\S+', line.decode('utf-8'))]
+            command, args = words[0].upper(), words[1:]
+            server.commands.append(command)
+            time.sleep(server.delay)
+
+            if command == 'QUIT':
+                self.send("221 bye")
+                break
+            elif command == 'SHOW' and args[0].upper() == 'INFO':
+                self.send("112 database information follows")
+                self.sendBlock(["%s" % DATABASES[args[1]], "", "Info."])
+                self.send("250 ok")
+            elif command == 'SHOW':
+                items = args[0].upper() == 'DB' and DATABASES or STRATEGIES
+                self.send("11%d %d items present" % \
+                          (items is STRATEGIES, len(items)))
+                self.sendBlock(['%s "%s"' % (name, items[name]) \
+                                for name in sorted(items)])
+                self.send("250 ok")
+            elif command == 'MATCH':
+                db, strategy, word = args
+                found = [(name, key) for name in sorted(DEFINITIONS) \
+                         for key in sorted(DEFINITIONS[name]) \
+                         if db in ('*', name) and \
+                         (key == word or
+                          strategy == 'prefix' and key.startswith(word))]
+                if not found:
+                    self.send("552 no match")
+                    continue
+                self.send("152 %d matches found" % len(found))
+                self.sendBlock(['%s "%s"' % m for m in found])
+                self.send("250 ok")
+            elif command == 'DEFINE':
+                db, word = args
+                found = [(name, DEFINITIONS[name][word]) \
+                         for name in sorted(DEFINITIONS) \
+                         if db in ('*', name) and word in DEFINITIONS[name]]
+                if not found:
+                    self.send("552 no match")
+                    continue
+                self.send("150 %d definitions retrieved" % len(found))
+                for name, text in found:
+                    self.send('151 "%s" %s "%s"' % (word, name,
+                                                    DATABASES[name]))
+                    self.sendBlock(text.split('\n'))
+                self.send("250 ok")
+            else:
+                self.send("500 unknown command")
+
+            if server.dropAfter and len(server.commands) >= server.dropAfter:
+                server.dropAfter = 0
+                break
+
+
+
+class FakeServer(socketserver.ThreadingTCPServer):
+    """DICT server on a random local port"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        socketserver.ThreadingTCPServer.__init__(self, ('127.0.0.1', 0),
+                                                 FakeHandler)
+        self.connections = 0
+        self.commands = []
+        self.dropAfter = 0
+        self.delay = 0
+        self.banner = "fake 1.0"
+        self.messageId = 0
+        self.thread = threading.Thread(target=self.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+
+class TestConnectionPool(unittest.TestCase):
+    """ConnectionPool test"""
+
+    def setUp(self):
+        self.server = FakeServer()
+        self.port = self.server.server_address[1]
+        self.pool = dictclient.ConnectionPool()
+
+
+    def tearDown(self):
+        self.pool.clear()
+        self.server.stop()
+
+
+    def define(self, db, word):
+        func = lambda conn: [d.getdefstr() for d in conn.define(db, word)]
+        return self.pool.run('127.0.0.1', self.port, func)
+
+
+    def test_reuse(self):
+        """Lookups should share one connection and one SHOW DB"""
+
+        self.assertEqual(self.define('test', 'apple'), ['apple\nA fruit.'])
+        self.assertEqual(self.define('*', 'apple'),
+                         ['apple\nA company.', 'apple\nA fruit.'])
+        self.assertEqual(self.define('test', 'plum'), [])
+        self.assertEqual(self.server.connections, 1)
+        self.assertEqual(self.server.commands,
+                         ['SHOW', 'DEFINE', 'DEFINE', 'DEFINE'])
+
+
+    def test_reconnect(self):
+        """Broken connection should be replaced transparently"""
+
+        self.server.dropAfter = 2
+        self.define('test', 'apple')
+        self.assertEqual(self.define('test', 'pear'), ['pear\nAnother fruit.'])
+        self.assertEqual(self.server.connections, 2)
+
+
+    def test_idleTimeout(self):
+        """Connections idle for too long should not be reused"""
+
+        self.pool.idletimeout = 0
+        self.define('test', 'apple')
+        self.define('test', 'pear')
+        self.assertEqual(self.server.connections, 2)
+        # Database list is remembered across connections
+        self.assertEqual(self.server.commands.count('SHOW'), 1)
+
+
+
+class TestServerGroup(unittest.TestCase):
+    """Failover between servers test"""
+
+    def setUp(self):
+        self.servers = [FakeServer(), FakeServer()]
+        self.addresses = [s.server_address for s in self.servers]
+
+        # Nothing listens on this port after closing the socket
+        sock = socket.socket()
+        sock.bind(('127.0.0.1', 0))
+        self.dead = sock.getsockname()
+        sock.close()
+
+        self.group = dictclient.ServerGroup([self.dead] + self.addresses,
+                                            dictclient.ConnectionPool())
+
+
+    def tearDown(self):
+        self.group.pool.clear()
+        for server in self.servers:
+            server.stop()
+
+
+    def define(self, word):
+        func = lambda conn: [d.getdefstr() for d in conn.define('test', word)]
+        return self.group.run(func)
+
+
+    def test_parseServers(self):
+        """Servers should be parsed with default port"""
+
+        self.assertEqual(dictclient.parseservers(" dict.org, a:2629  b:x "),
+                         [('dict.org', 2628), ('a', 2629), ('b:x', 2628)])
+
+
+    def test_failover(self):
+        """Dead server should be skipped"""
+
+        self.assertEqual(self.define('apple'), ['apple\nA fruit.'])
+        self.assertFalse(self.group.ishealthy(self.dead))
+        # Left out until it is due to be probed
+        self.assertEqual(sorted(self.group.getcandidates()),
+                         sorted(self.addresses))
+
+        for server in self.servers:
+            server.stop()
+        self.servers = []
+        self.group.pool.clear()
+        self.assertRaises(OSError, self.define, 'pear')
+
+
+    def test_probe(self):
+        """Failed server should be left out while it is probed"""
+
+        self.assertEqual(self.define('apple'), ['apple\nA fruit.'])
+        self.group.failed[self.dead] -= dictclient.PROBE_INTERVAL
+        self.assertEqual(sorted(self.group.getcandidates()),
+                         sorted(self.addresses))
+        for i in range(100):
+            if not self.group.probing:
+                break
+            time.sleep(0.05)
+        self.assertFalse(self.group.ishealthy(self.dead))
+
+        # Read timeout of the lookup is not kept by idle connections
+        idle = [conn for conns in self.group.pool.idle.values() \
+                for conn in conns]
+        self.assertTrue(idle)
+        for conn in idle:
+            self.assertEqual(conn.sock.gettimeout(), None)
+
+
+    def test_readTimeout(self):
+        """Server that stops answering should be given up"""
+
+        timeout = dictclient.READ_TIMEOUT
+        dictclient.READ_TIMEOUT = 0.2
+        try:
+            self.group = dictclient.ServerGroup(self.addresses,
+                                                dictclient.ConnectionPool())
+            self.servers[0].delay = 0.5
+            self.assertEqual(self.define('apple'), ['apple\nA fruit.'])
+        finally:
+            dictclient.READ_TIMEOUT = timeout
+        self.assertFalse(self.group.ishealthy(self.addresses[0]))
+        self.assertTrue(self.group.ishealthy(self.addresses[1]))
+
+
+    def test_latency(self):
+        """Queries should go to the fastest server"""
+
+        self.servers[0].delay = 0.05
+        for i in range(6):
+            self.define('apple')
+        self.assertEqual(self.group.getcandidates()[0], self.addresses[1])
+        self.assertTrue(self.group.getlatency(self.addresses[0]) >
+                        self.group.getlatency(self.addresses[1]))
+
+
+
+class TestPipeline(unittest.TestCase):
+    """Pipelined DEFINE and MATCH test"""
+
+    def setUp(self):
+        self.server = FakeServer()
+        self.conn = dictclient.Connection('127.0.0.1',
+                                          self.server.server_address[1])
+        self.readSize = dictclient.READ_SIZE
+        self.window = dictclient.PIPELINE_WINDOW
+        # Make responses span many reads and refill the window often
+        dictclient.READ_SIZE = 7
+        dictclient.PIPELINE_WINDOW = 4
+
+
+    def tearDown(self):
+        dictclient.READ_SIZE = self.readSize
+        dictclient.PIPELINE_WINDOW = self.window
+        self.conn.close()
+        self.server.stop()
+
+
+    def test_defineMany(self):
+        """Results should come in the order of words"""
+
+        words = ['pear', 'plum', 'dot', 'apple'] * 5
+        results = self.conn.define_many('*', words)
+        self.assertEqual(len(results), len(words))
+        for word, defs in zip(words, results):
+            self.assertEqual([d.getdefstr() for d in defs],
+                             [d.getdefstr() for d in
+                              self.conn.define('*', word)])
+        self.assertEqual(results[2][0].getdefstr(), 'dot\n.\n..two\n\nend')
+        self.assertEqual([d.getdb().getname() for d in results[3]],
+                         ['other', 'test'])
+
+
+    def test_matchMany(self):
+        """Matches should be returned for every word"""
+
+        results = self.conn.match_many('test', 'prefix', ['p', 'x', 'a', ''])
+        self.assertEqual([[d.getword() for d in m] for m in results],
+                         [['pear'], [], ['apple'], ['apple', 'dot', 'pear']])
+        self.assertEqual(self.conn.match_many('*', 'exact', []), [])
+
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,574 @@
+#
+# OpenDict
+# Copyright (c) 2003-2006 Martynas Jocius <martynas.jocius@idiles.com>
+# Copyright (c) 2007 IDILES SYSTEMS, UAB <support@idiles.com>
+#
+# Unit Test for dictdlib.py
+#
+
+"""
+Unit tests for dictdlib.py
+"""
+
+import unittest
+import os
+import sys
+import gzip
+import struct
+import zlib
+import random
+import tempfile
+import shutil
+import subprocess
+
+sys.path.append('../..')
+
+from lib.extra import dictdlib
+
+
+def _writeDictzip(path, data, chunklen):
+    """Write data as dictzip file with given chunk length"""
+
+    chunks = []
+    compressor = zlib.compressobj(9, zlib.DEFLATED, -zlib.MAX_WBITS)
+    for pos in range(0, len(data), chunklen):
+        chunks.append(compressor.compress(data[pos:pos + chunklen]) \
+                      + compressor.flush(zlib.Z_FULL_FLUSH))
+    chunks.append(compressor.flush())
+
+    # Final flush belongs to the last chunk
+    last = chunks.pop()
+    if chunks:
+        chunks[-1] += last
+    else:
+        chunks.append(last)
+
+    ra = struct.pack("<HHH", 1, chunklen, len(chunks)) \
+         + struct.pack("<%dH" % len(chunks), *[len(c) for c in chunks])
+    extra = b"RA" + struct.pack("<H", len(ra)) + ra
+
+    fd = open(path, 'wb')
+    fd.write(b"\x1f\x8b\x08" + bytes([dictdlib.FEXTRA | dictdlib.FNAME]) \
+             + b"\0\0\0\0\x02\x03")
+    fd.write(struct.pack("<H", len(extra)) + extra)
+    fd.write(b"test.dict\0")
+    fd.write(b"".join(chunks))
+    fd.write(struct.pack("<II", zlib.crc32(data), len(data) & 0xffffffff))
+    fd.close()
+
+
+class TestDictzipFile(unittest.TestCase):
+    """DictzipFile test"""
+
+    def setUp(self):
+        """Make dictzip and plain gzip files of the same data"""
+
+        rand = random.Random(0)
+        self.data = bytes([rand.choice(b"abcdef \n") for i in range(50000)])
+        self.dir = tempfile.mkdtemp()
+        self.dzPath = os.path.join(self.dir, "test.dict.dz")
+        self.gzPath = os.path.join(self.dir, "plain.dict.dz")
+
+        _writeDictzip(self.dzPath, self.data, 4096)
+        fd = gzip.open(self.gzPath, 'wb')
+        fd.write(self.data)
+        fd.close()
+
+
+    def tearDown(self):
+        """Remove temporary files"""
+
+        shutil.rmtree(self.dir)
+
+
+    def test_gzipCompatible(self):
+        """dictzip file should be a valid gzip file"""
+
+        fd = gzip.open(self.dzPath, 'rb')
+        self.assertEqual(fd.read(), self.data)
+        fd.close()
+
+
+    def test_read(self):
+        """Random ranges should match uncompressed data"""
+
+        fd = dictdlib.opendictzip(self.dzPath)
+        self.assertTrue(isinstance(fd, dictdlib.DictzipFile))
+        self.assertEqual(fd.size, len(self.data))
+
+        rand = random.Random(1)
+        for i in range(200):
+            start = rand.randrange(len(self.data))
+            length = rand.randrange(10000)
+            fd.seek(start)
+            self.assertEqual(fd.read(length),
+                             self.data[start:start + length])
+
+        fd.seek(len(self.data) - 10)
+        self.assertEqual(fd.read(100), self.data[-10:])
+        self.assertEqual(fd.read(100), b"")
+        fd.close()
+
+
+    def test_cache(self):
+        """Chunks should be shared between files and fit in the budget"""
+
+        cache = dictdlib.ChunkCache(3 * 4096)
+        first = dictdlib.DictzipFile(self.dzPath, cache)
+        second = dictdlib.DictzipFile(self.dzPath, cache)
+
+        first.seek(100)
+        first.read(10)
+        second.seek(200)
+        self.assertEqual(second.read(10), self.data[200:210])
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+        for chunk in range(5):
+            first.seek(chunk * 4096)
+            first.read(1)
+        stats = cache.getstats()
+        self.assertEqual(stats['evictions'], 2)
+        self.assertEqual(stats['chunks'], 3)
+        self.assertTrue(stats['size'] <= stats['budget'])
+
+        cache.setbudget(4096)
+        self.assertEqual(cache.getstats()['chunks'], 1)
+
+        first.close()
+        second.close()
+
+
+    def test_writedictzip(self):
+        """Written file should be readable by gzip and by chunks"""
+
+        source = os.path.join(self.dir, "source.dict")
+        open(source, 'wb').write(self.data)
+
+        dest = os.path.join(self.dir, "written.dict.dz")
+        dictdlib.writedictzip(source, dest, 1000, processes=1)
+        fd = gzip.open(dest, 'rb')
+        self.assertEqual(fd.read(), self.data)
+        fd.close()
+
+        fd = dictdlib.DictzipFile(dest, dictdlib.ChunkCache(0))
+        self.assertEqual(len(fd.offsets), 51)
+        for start in (0, 999, 1000, 25500, 49990):
+            fd.seek(start)
+            self.assertEqual(fd.read(1500), self.data[start:start + 1500])
+        fd.close()
+
+        parallel = os.path.join(self.dir, "parallel.dict.dz")
+        dictdlib.writedictzip(source, parallel, 1000, processes=2)
+        self.assertEqual(open(parallel, 'rb').read(), open(dest, 'rb').read())
+
+
+    def test_plainGzip(self):
+        """Files without chunk table should be read with GzipFile"""
+
+        fd = dictdlib.opendictzip(self.gzPath)
+        self.assertTrue(isinstance(fd, gzip.GzipFile))
+        fd.seek(40000)
+        self.assertEqual(fd.read(5), self.data[40000:40005])
+        fd.close()
+
+
+    def test_getdef(self):
+        """DictDB should read definitions from dictzip file"""
+
+        basename = os.path.join(self.dir, "test")
+        fd = open(basename + ".index", 'w')
+        fd.write("first\tA\tK\n")
+        fd.write("second\t%s\t%s\n" % (dictdlib.b64_encode(45000),
+                                       dictdlib.b64_encode(20)))
+        fd.close()
+
+        db = dictdlib.DictDB(basename)
+        self.assertEqual(db.getdef("first"), [self.data[0:10]])
+        self.assertEqual(db.getdef("second"), [self.data[45000:45020]])
+        db.dictfile.close()
+
+
+
+class TestSearchIndex(unittest.TestCase):
+    """Lazy and compact DictDB test"""
+
+    words = ["apple", "Apple", "a-b", "ab", "abc", "Bob", "b", "zoo",
+             "'quote", "žuvis", "ab cd"]
+
+    def setUp(self):
+        """Write dictionary with index sorted as by sort -df"""
+
+        self.dir = tempfile.mkdtemp()
+        self.basename = os.path.join(self.dir, "test")
+
+        lines = []
+        fd = open(self.basename + ".dict", 'wb')
+        for word in self.words:
+            for i in range(2):
+                data = ("%s %d\n" % (word, i)).encode('UTF-8')
+                lines.append("%s\t%s\t%s" % (word,
+                                             dictdlib.b64_encode(fd.tell()),
+                                             dictdlib.b64_encode(len(data))))
+                fd.write(data)
+        fd.close()
+
+        lines.sort(key=lambda line: (dictdlib.collatekey(
+            line.encode('UTF-8')), line))
+        fd = open(self.basename + ".index", 'w', encoding='UTF-8')
+        fd.write("\n".join(lines) + "\n")
+        fd.close()
+
+        self.memory = dictdlib.DictDB(self.basename)
+        self.mapped = dictdlib.DictDB(self.basename, lazy=1)
+        self.compact = dictdlib.DictDB(self.basename, compact=1)
+
+
+    def tearDown(self):
+        """Remove temporary files"""
+
+        self.memory.close()
+        self.mapped.close()
+        self.compact.close()
+        shutil.rmtree(self.dir)
+
+
+    def test_getdef(self):
+        """Lookups should give the same definitions as in memory"""
+
+        for db in (self.mapped, self.compact):
+            for word in self.words:
+                self.assertTrue(db.hasdef(word))
+                self.assertEqual(len(db.getdef(word)), 2)
+                self.assertEqual(sorted(db.getdef(word)),
+                                 sorted(self.memory.getdef(word)))
+
+            self.assertFalse(db.hasdef("APPLE"))
+            self.assertEqual(db.getdef("missing"), [])
+            self.assertEqual(sorted(db.getdeflist()),
+                             sorted(self.memory.getdeflist()))
+
+
+    def test_getprefix(self):
+        """Prefix search should ignore case and punctuation order"""
+
+        for db in (self.mapped, self.compact):
+            for prefix in ("a", "AB", "a-", "b", "'", "ž", "", "x"):
+                self.assertEqual(sorted(db.getprefix(prefix)),
+                                 sorted(self.memory.getprefix(prefix)))
+
+            self.assertEqual(sorted(db.getprefix("ab")),
+                             ["ab", "ab cd", "abc"])
+
+        # Index read into memory is searched in file order
+        for prefix in ("a", "", "'", "ž", "x"):
+            self.assertEqual(self.memory.getprefix(prefix),
+                             sorted(self.memory.getprefix(prefix),
+                                    key=str.lower))
+            self.assertEqual(self.memory.getprefix(prefix),
+                             self.mapped.getprefix(prefix))
+            self.assertEqual(self.memory.getprefix(prefix),
+                             self.compact.getprefix(prefix))
+        self.assertEqual(self.memory.getprefix("A"),
+                         ["a-b", "ab", "ab cd", "abc", "apple", "Apple"])
+
+
+    def test_getcaseless(self):
+        """Words differing in case only should be found"""
+
+        for db in (self.memory, self.mapped, self.compact):
+            self.assertEqual(sorted(db.getcaseless("APPLE")),
+                             ["Apple", "apple"])
+            self.assertEqual(db.getcaseless("BOB"), ["Bob"])
+            self.assertEqual(db.getcaseless("bo"), [])
+
+
+    def test_displayField(self):
+        """Index lines with 4th field should be read by all indexes"""
+
+        lines = open(self.basename + ".index", 'rb').read().splitlines()
+        fd = open(self.basename + ".index", 'wb')
+        for i, line in enumerate(lines):
+            if i % 2:
+                line += b"\t" + line.split(b"\t")[0].upper()
+            fd.write(line + b"\n")
+        fd.close()
+
+        memory = dictdlib.DictDB(self.basename)
+        for db in (memory, dictdlib.DictDB(self.basename, lazy=1),
+                   dictdlib.DictDB(self.basename, compact=1)):
+            for word in self.words:
+                self.assertEqual(sorted(db.getdef(word)),
+                                 sorted(self.memory.getdef(word)))
+            self.assertEqual(sorted(db.getdeflist()),
+                             sorted(self.memory.getdeflist()))
+            db.close()
+
+
+    def test_tieRun(self):
+        """Words without ASCII letters should be found in large index"""
+
+        rand = random.Random(3)
+        letters = "абвгдежАБВГДЕЖαβγΩ-'"
+        words = ["".join([rand.choice(letters) \
+                          for i in range(rand.randint(1, 8))]) \
+                 for j in range(5000)]
+        basename = os.path.join(self.dir, "tierun")
+        compiler = dictdlib.DictCompiler(basename, quiet=1)
+        for word in words:
+            compiler.addentry("%s\n definition" % word, [word])
+        compiler.finish()
+
+        memory = dictdlib.DictDB(basename)
+        mapped = dictdlib.DictDB(basename, lazy=1)
+        for word in words[:500]:
+            self.assertEqual(sorted(mapped.getdef(word)),
+                             sorted(memory.getdef(word)))
+            self.assertEqual(sorted(mapped.getcaseless(word.upper())),
+                             sorted(memory.getcaseless(word.upper())))
+        self.assertEqual(mapped.getdef("ёж"), [])
+
+        # All words have an empty primary key, one table is built
+        self.assertEqual(list(mapped.searchindex.tieruns), [b""])
+        self.assertEqual(len(mapped.searchindex.tieruns[b""]), len(words))
+        memory.close()
+        mapped.close()
+
+
+    def test_nonAsciiPrefix(self):
+        """Prefix without ASCII letters should not scan the index"""
+
+        words = [word + suffix for suffix in ("", "а", "аб", "б", "ба", "бв") \
+                 for word in ("жук", "журнал", "яблоко", "ёж")]
+        rand = random.Random(5)
+        words += ["".join([rand.choice("абвгдежАБВГДЕЖ") \
+                           for i in range(rand.randint(2, 8))]) \
+                  for j in range(5000)]
+        basename = os.path.join(self.dir, "prefix")
+        compiler = dictdlib.DictCompiler(basename, quiet=1)
+        for word in words:
+            compiler.addentry("%s\n definition" % word, [word])
+        compiler.finish()
+
+        memory = dictdlib.DictDB(basename)
+        mapped = dictdlib.DictDB(basename, lazy=1)
+        for prefix in ("ж", "Жу", "жукб", "ё", "-", "щ"):
+            self.assertEqual(mapped.getprefix(prefix),
+                             sorted(memory.getprefix(prefix), key=str.lower))
+
+        index = mapped.searchindex
+        headword = index._headword
+        touched = []
+        def countingHeadword(pos):
+            touched.append(pos)
+            return headword(pos)
+        index._headword = countingHeadword
+
+        self.assertEqual(mapped.getprefix("ЖУРНАЛ"),
+                         ["журнал", "журнала", "журналаб", "журналб",
+                          "журналба", "журналбв"])
+        self.assertTrue(0 < len(touched) < 100)
+        memory.close()
+        mapped.close()
+
+
+    def test_b64DecodeColumn(self):
+        """Column decoder should match b64_decode"""
+
+        values = [0, 1, 63, 64, 4095, 123456789, 2 ** 36 - 1]
+        encoded = [dictdlib.b64_encode(value).encode() for value in values]
+        self.assertEqual(list(dictdlib.b64_decode_column(encoded)), values)
+        self.assertEqual([dictdlib.b64_decode(value.decode()) \
+                          for value in encoded], values)
+        self.assertRaises(ValueError, dictdlib.b64_decode_column, [b"A B"])
+        self.assertRaises(ValueError, dictdlib.b64_decode_column, [b"A-B"])
+
+
+
+class TestDictCompiler(unittest.TestCase):
+    """Streaming dictionary writer test"""
+
+    def setUp(self):
+        """Make random headwords"""
+
+        rand = random.Random(2)
+        letters = "abcAB -'.1ž"
+        self.words = ["".join([rand.choice(letters) \
+                               for i in range(rand.randint(1, 6))]) \
+                      for j in range(300)]
+        self.dir = tempfile.mkdtemp()
+        self.basename = os.path.join(self.dir, "test")
+        self.fanin = dictdlib.SORT_MERGE_FANIN
+
+
+    def tearDown(self):
+        """Remove temporary files"""
+
+        dictdlib.SORT_MERGE_FANIN = self.fanin
+        shutil.rmtree(self.dir)
+
+
+    def _compile(self, runsize):
+        """Write dictionary and return its index data"""
+
+        compiler = dictdlib.DictCompiler(self.basename, quiet=1,
+                                         runsize=runsize, tempdir=self.dir)
+        for word in self.words:
+            compiler.addentry("%s\n definition" % word, [word])
+        compiler.finish()
+
+        return open(self.basename + ".index", 'rb').read()
+
+
+    def test_runs(self):
+        """Merged runs should give the same index as one sort"""
+
+        dictdlib.SORT_MERGE_FANIN = 4
+        index = self._compile(7)
+        self.assertEqual(index, self._compile(1000))
+
+        db = dictdlib.DictDB(self.basename, compact=1)
+        for word in self.words:
+            self.assertTrue(("%s\n definition\n" % word).encode("UTF-8") \
+                            in db.getdef(word))
+        db.close()
+
+
+    @unittest.skipUnless(shutil.which("sort"), "sort is not available")
+    def test_sortOrder(self):
+        """Index should be sorted like LC_ALL=C sort -df"""
+
+        index = self._compile(10)
+        env = dict(os.environ, LC_ALL="C")
+        sorted = subprocess.run(["sort", "-df", self.basename + ".index"],
+                                stdout=subprocess.PIPE, env=env).stdout
+        self.assertEqual(index, sorted)
+
+
+    def test_compress(self):
+        """Compressed dictionary should give the same definitions"""
+
+        index = self._compile(1000)
+        definitions = open(self.basename + ".dict", 'rb').read()
+
+        compiler = dictdlib.DictCompiler(self.basename, quiet=1)
+        for word in self.words:
+            compiler.addentry("%s\n definition" % word, [word])
+        compiler.finish(compress=1)
+
+        self.assertFalse(os.path.exists(self.basename + ".dict"))
+        self.assertEqual(open(self.basename + ".index", 'rb').read(), index)
+        fd = gzip.open(self.basename + ".dict.dz", 'rb')
+        self.assertEqual(fd.read(), definitions)
+        fd.close()
+
+        db = dictdlib.DictDB(self.basename, compact=1)
+        self.assertTrue(isinstance(db.dictfile, dictdlib.DictzipFile))
+        for word in self.words:
+            self.assertTrue(("%s\n definition\n" % word).encode("UTF-8") \
+                            in db.getdef(word))
+        db.close()
+
+
+    def test_vacuum(self):
+        """Compaction should drop dead definitions only"""
+
+        self._compile(1000)
+        db = dictdlib.DictDB(self.basename, 'update', quiet=1)
+        words = sorted(set(self.words))
+        for word in words[::2]:
+            db.delindexentry(word)
+        for word in words[1::4]:
+            db.delindexentry(word)
+            db.addentry("%s\n new definition" % word, [word])
+        db.addentry("shared\n definition", ["first", "second"])
+        expected = dict([(word, db.getdef(word)) for word in db.getdeflist()])
+        oldsize = os.path.getsize(self.basename + ".dict")
+
+        reclaimed = db.vacuum()
+        self.assertTrue(reclaimed > 0)
+        self.assertEqual(os.path.getsize(self.basename + ".dict"),
+                         oldsize - reclaimed)
+        self.assertEqual(db.indexentries["first"], db.indexentries["second"])
+        db.addentry("after\n vacuum", ["after"])
+        db.finish()
+
+        db = dictdlib.DictDB(self.basename)
+        for word, definitions in expected.items():
+            self.assertEqual(db.getdef(word), definitions)
+        self.assertEqual(db.getdef("after"), [b"after\n vacuum\n"])
+
+        # Definitions follow index order. Order of headwords equal by
+        # the primary sort key depends on offsets, so groups are compared.
+        # Definition of "second" is shared with "first".
+        groups = {}
+        fd = open(self.basename + ".index", 'rb')
+        for line in fd:
+            word, start, size = line.split(b"\t")
+            if word not in (b"after", b"second"):
+                groups.setdefault(dictdlib.collatekey(word), []).append(
+                    dictdlib.b64_decode(start.decode()))
+        fd.close()
+        ranges = [(min(groups[key]), max(groups[key])) \
+                  for key in sorted(groups)]
+        for i in range(len(ranges) - 1):
+            self.assertTrue(ranges[i][1] < ranges[i + 1][0])
+        db.close()
+
+
+    def test_vacuumCrash(self):
+        """Files of interrupted compaction should be put in place"""
+
+        self._compile(1000)
+        words = sorted(set(self.words))
+        db = dictdlib.DictDB(self.basename, 'update', quiet=1)
+        for word in words[::2]:
+            db.delindexentry(word)
+        expected = dict([(word, db.getdef(word)) for word in db.getdeflist()])
+
+        # Crash after the new .dict replaced the old one
+        replace = os.replace
+        renames = []
+        def crashingReplace(src, dst):
+            renames.append(dst)
+            if len(renames) == 3:
+                raise KeyboardInterrupt
+            replace(src, dst)
+
+        os.replace = crashingReplace
+        try:
+            self.assertRaises(KeyboardInterrupt, db.vacuum)
+        finally:
+            os.replace = replace
+        self.assertEqual(renames[1], self.basename + ".dict")
+        self.assertTrue(os.path.exists(self.basename + ".index.new"))
+
+        db = dictdlib.DictDB(self.basename)
+        self.assertEqual(sorted(db.getdeflist()), sorted(expected))
+        for word, definitions in expected.items():
+            self.assertEqual(db.getdef(word), definitions)
+        db.close()
+        self.assertFalse(os.path.exists(self.basename + ".index.new"))
+
+        # Incomplete files are dropped when opened for update
+        open(self.basename + ".dict.new", 'wb').close()
+        db = dictdlib.DictDB(self.basename, 'update', quiet=1)
+        self.assertFalse(os.path.exists(self.basename + ".dict.new"))
+        self.assertEqual(db.getdef(words[1]), expected[words[1]])
+        db.close()
+
+
+    def test_dictDBFinish(self):
+        """DictDB should write sorted index too"""
+
+        db = dictdlib.DictDB(self.basename, 'write', quiet=1)
+        for word in self.words:
+            db.addentry("%s\n definition" % word, [word])
+        db.finish()
+        index = open(self.basename + ".index", 'rb').read()
+
+        self.assertEqual(index, self._compile(1000))
+
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,155 @@
+#
+# OpenDict
+# Copyright (c) 2003-2006 Martynas Jocius <martynas.jocius@idiles.com>
+# Copyright (c) 2007 IDILES SYSTEMS, UAB <support@idiles.com>
+#
+# Unit Test for odxdict.py
+#
+
+"""
+Unit tests for odxdict.py
+"""
+
+import unittest
+import os
+import sys
+import random
+import shutil
+import tempfile
+
+sys.path.append('../..')
+
+from lib import odxdict
+from lib import errortype
+from lib.extra import dictdlib
+from lib.parser import SlowoParser, MovaParser, DictParser
+
+
+class TestOdxDictionary(unittest.TestCase):
+    """OdxDictionary test"""
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.fileName = os.path.join(self.path, 'test.odx')
+
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+
+    def _open(self):
+        dictionary = odxdict.OdxDictionary(self.fileName)
+        dictionary.start()
+        self.addCleanup(dictionary.stop)
+        return dictionary
+
+
+    def test_compile(self):
+        """Slowo dictionary should be searched the same way after
+        compiling"""
+
+        source = SlowoParser("data/sampledict.dwa")
+        source.setEncoding('UTF-8')
+        self.assertEqual(odxdict.compileDictionary(source, self.fileName), 7)
+
+        dictionary = self._open()
+        result = dictionary.search('Žirafa'.encode('UTF-8'))
+        self.assertEqual(result.getError(), errortype.OK)
+        self.assertTrue('giraphe' in result.getTranslation())
+        self.assertEqual(result.getWordList(), ['žirafa'])
+
+        self.assertEqual(dictionary.search('k').getWordList(), ['keturi'])
+        self.assertEqual(dictionary.search('x').getError(),
+                         errortype.NOT_FOUND)
+
+
+    def test_escape(self):
+        """Titles and Mova definitions should be escaped"""
+
+        movaName = os.path.join(self.path, 'sample.mova')
+        fd = open(movaName, 'w', encoding='UTF-8')
+        fd.write("a&b  <i>not</i> markup\n")
+        fd.close()
+
+        source = MovaParser(movaName)
+        source.setEncoding('UTF-8')
+        self.assertEqual(odxdict.compileDictionary(source, self.fileName), 1)
+
+        translation = self._open().search('a&b').getTranslation()
+        self.assertTrue('<b>a&amp;b</b>' in translation)
+        self.assertTrue('&lt;i&gt;not&lt;/i&gt; markup' in translation)
+
+
+    def test_groups(self):
+        """Prefix lookups should work across groups and blocks"""
+
+        rand = random.Random(3)
+        letters = "abcAB -ž"
+        words = set(["".join([rand.choice(letters) \
+                              for i in range(rand.randint(1, 6))]).strip() \
+                     for j in range(500)])
+        words.discard('')
+        entries = [(word, word, "<p>%s</p>" % word * 10) for word in words]
+
+        for compression in odxdict.compressions.values():
+            odxdict.writeDictionary(entries, self.fileName, 'test',
+                                    compression, blockSize=1000)
+            dictionary = self._open()
+            self.assertEqual(len(dictionary), len(entries))
+
+            for prefix in ('a', 'Ab', 'ž', 'b -', ''):
+                expected = sorted([word for word in words \
+                                   if word.lower().startswith(prefix.lower())],
+                                  key=lambda w: (w.lower().encode('UTF-8'),
+                                                 w.encode('UTF-8')))
+                found = dictionary.findPrefix(prefix, len(words))
+                self.assertEqual([word for number, word in found], expected)
+                for number, word in found[:5]:
+                    self.assertEqual(dictionary.getEntry(number)[0], word)
+
+            self.assertEqual(sorted(dictionary.getEntries()), sorted(entries))
+            dictionary.stop()
+            dictdlib.chunkcache.clear()
+
+
+    def test_damaged(self):
+        """Damaged blocks should be noticed"""
+
+        odxdict.writeDictionary([('word', 'word', 'definition')],
+                                self.fileName, compression=odxdict.NONE)
+        data = open(self.fileName, 'rb').read()
+        data = data.replace(b'definition', b'defimition')
+        open(self.fileName, 'wb').write(data)
+
+        dictionary = self._open()
+        self.assertRaises(odxdict.OdxError, dictionary.search, 'word')
+
+        open(self.fileName, 'wb').write(b'not a dictionary' * 10)
+        self.assertRaises(odxdict.OdxError, self._open)
+
+        # Short files and tables outside the file
+        for size in (0, 4, odxdict._header.size - 1):
+            open(self.fileName, 'wb').write(data[:size])
+            self.assertRaises(odxdict.OdxError, self._open)
+        open(self.fileName, 'wb').write(data[:odxdict._header.size + 20])
+        self.assertRaises(odxdict.OdxError, self._open)
+
+
+    def test_compileDict(self):
+        """Titles of compiled dictd entries should be bold once"""
+
+        basename = os.path.join(self.path, 'sample')
+        compiler = dictdlib.DictCompiler(basename, quiet=1)
+        compiler.addentry("pear\nA fruit.", ["pear"])
+        compiler.finish()
+
+        odxdict.compileDictionary(DictParser(basename + ".dict"),
+                                  self.fileName)
+        translation = self._open().search('pear').getTranslation()
+        self.assertTrue('<b>pear</b>' in translation)
+        self.assertFalse('<b><b>' in translation)
+
+
+
+if __name__ == "__main__":
+    unittest.main()
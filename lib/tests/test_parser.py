@@ -0,0 +1,101 @@
+#
+# OpenDict
+# Copyright (c) 2003-2006 Martynas Jocius <martynas.jocius@idiles.com>
+# Copyright (c) 2007 IDILES SYSTEMS, UAB <support@idiles.com>
+#
+# Unit Test for parser.py
+#
+
+"""
+Unit tests for parser.py
+"""
+
+import unittest
+import sys
+
+sys.path.append('../..')
+
+from lib import errortype
+from lib import remotecache
+from lib.extra import aiodictclient
+from lib.parser import DictConnection
+from test_dictclient import FakeServer
+
+
+class TestDictConnection(unittest.TestCase):
+    """DICT server word list test"""
+
+    def setUp(self):
+        self.server = FakeServer()
+        self.dictionary = DictConnection('127.0.0.1',
+                                         self.server.server_address[1],
+                                         'test', '')
+        remotecache.lookupCache.clear()
+
+
+    def tearDown(self):
+        aiodictclient.pool.clear()
+        remotecache.lookupCache.clear()
+        self.server.stop()
+
+
+    def matches(self):
+        return self.server.commands.count('MATCH')
+
+
+    def test_lookupLists(self):
+        """Words should be listed by the lookup and reused"""
+
+        result = self.dictionary.search('ap')
+        self.assertEqual(result.getError(), errortype.NOT_FOUND)
+        self.assertEqual(result.getWordList(), ['apple'])
+        self.assertEqual(self.matches(), 1)
+
+        # Longer prefix is filtered from the list of the shorter one
+        result = self.dictionary.search('apple')
+        self.assertTrue('A fruit.' in result.getTranslation())
+        self.assertEqual(result.getWordList(), ['apple'])
+        self.assertEqual(self.dictionary.listWords('app'), ['apple'])
+        self.assertEqual(self.dictionary.listWords('apx'), [])
+        self.assertEqual(self.matches(), 1)
+
+
+    def test_listWords(self):
+        """Word lists should be asked for each new prefix once"""
+
+        self.assertEqual(self.dictionary.listWords('p'), [])
+        self.assertEqual(self.matches(), 0)
+
+        self.assertEqual(self.dictionary.listWords(b'pe'), ['pear'])
+        self.assertEqual(self.dictionary.listWords('Pea'), ['pear'])
+        self.assertEqual(self.dictionary.listWords('pe'), ['pear'])
+        self.assertEqual(self.matches(), 1)
+
+        self.assertEqual(self.dictionary.listWords('do'), ['dot'])
+        self.assertEqual(self.matches(), 2)
+        # One connection is reused
+        self.assertEqual(self.server.connections, 1)
+
+
+    def test_strategy(self):
+        """Lists of other strategies should not be filtered"""
+
+        dictionary = DictConnection('127.0.0.1',
+                                    self.server.server_address[1],
+                                    'test', 'exact')
+        self.assertEqual(dictionary.listWords('pe'), [])
+        self.assertEqual(dictionary.listWords('pear'), ['pear'])
+        self.assertEqual(self.matches(), 2)
+
+
+    def test_connectionError(self):
+        """Failed lookup should not be reported as not found"""
+
+        self.server.stop()
+        result = self.dictionary.search('apple')
+        self.assertEqual(result.getError(), errortype.CONNECTION_ERROR)
+
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,226 @@
+#
+# OpenDict
+# Copyright (c) 2003-2006 Martynas Jocius <martynas.jocius@idiles.com>
+# Copyright (c) 2007 IDILES SYSTEMS, UAB <support@idiles.com>
+#
+# Unit Test for plaindict.py
+#
+
+"""
+Unit tests for plaindict.py
+"""
+
+import unittest
+import os
+import sys
+import shutil
+import tempfile
+
+sys.path.append('../..')
+
+from lib import info
+from lib import plaindict
+from lib.parser import SlowoParser, MovaParser
+
+
+# Sorted like dictionaries are, with ASCII and non-ASCII headwords
+_words = ["abėcėlė", "abu", "Abu", "ąžuolas", "bananas", "du", "dvi",
+          "miškas", "žirafa", "žirklės", "Žolė", "жук", "журнал",
+          "яблоко"]
+
+
+def _writeDictionary(path, lineFormat, count=1):
+    """Write dictionary of _words, each repeated count times with
+    numbered translations"""
+
+    fd = open(path, 'w', encoding='UTF-8')
+    for word in _words:
+        for i in range(count):
+            fd.write(lineFormat % (word, "%s %d" % (word[::-1], i)))
+    fd.close()
+
+
+def _openDictionary(dictClass, path, useMmap):
+    """Return started dictionary with literal index made in memory"""
+
+    dictionary = dictClass(path)
+    dictionary.setEncoding('UTF-8')
+    index, headwords, checksum = plaindict._makeIndexSerial(
+        dictionary, 'UTF-8', False, os.path.getsize(path))
+    dictionary.setIndex(index)
+    dictionary.setUseMmap(useMmap)
+    dictionary.start()
+    return dictionary
+
+
+
+class TestMappedScan(unittest.TestCase):
+    """Memory-mapped scan test"""
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+
+    def _compare(self, dictClass, lineFormat):
+        """Mapped scan should give the same results as reading lines"""
+
+        fileName = os.path.join(self.path, 'test')
+        _writeDictionary(fileName, lineFormat, 3)
+        lines = _openDictionary(dictClass, fileName, False)
+        mapped = _openDictionary(dictClass, fileName, True)
+        self.assertTrue(mapped.mappedFile is not None)
+
+        try:
+            for word in _words + ["a", "ž", "Ž", "жу", "zzz", "ё"]:
+                first = lines.search(word)
+                second = mapped.search(word.encode('UTF-8'))
+                self.assertEqual(second.getWordList(), first.getWordList())
+                self.assertEqual(second.getTranslation(),
+                                 first.getTranslation())
+                self.assertEqual(second.getError(), first.getError())
+
+            self.assertEqual(mapped.search('жу').getWordList(),
+                             ['жук'] * 3 + ['журнал'] * 3)
+        finally:
+            lines.stop()
+            mapped.stop()
+
+
+    def test_slowo(self):
+        """Slowo dictionaries should be scanned the same way"""
+
+        self._compare(SlowoParser, "%s = %s ;\n")
+
+
+    def test_mova(self):
+        """Mova dictionaries should be scanned the same way"""
+
+        self._compare(MovaParser, "%s  %s\n")
+
+
+
+class TestSlowoSearch(unittest.TestCase):
+    """Slowo search test"""
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.fileName = os.path.join(self.path, 'test')
+        fd = open(self.fileName, 'w', encoding='UTF-8')
+        fd.write("du = two // two pieces ; pair ;\n"
+                 "dvi = two ;\n"
+                 "žirafa = giraffe ;\n")
+        fd.close()
+
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+
+    def test_search(self):
+        """Matched lines should be formatted after the scan"""
+
+        for useMmap in (False, True):
+            dictionary = _openDictionary(SlowoParser, self.fileName, useMmap)
+            try:
+                result = dictionary.search('du')
+                self.assertEqual(result.getWordList(), ['du'])
+                self.assertTrue("<b>du</b>" in result.getTranslation())
+                self.assertTrue("<ul><li>two (<i>two pieces</i>)</li>"
+                                "<li>pair</li></ul>"
+                                in result.getTranslation())
+
+                result = dictionary.search('žirafa')
+                self.assertTrue("<ul><li>giraffe</li></ul>"
+                                in result.getTranslation())
+                self.assertFalse("two" in result.getTranslation())
+            finally:
+                dictionary.stop()
+
+
+
+class TestMakeIndex(unittest.TestCase):
+    """Index making test"""
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.homes = (info.LOCAL_HOME, info.GLOBAL_HOME)
+        info.LOCAL_HOME = os.path.join(self.path, 'local')
+        info.GLOBAL_HOME = os.path.join(self.path, 'global')
+
+        self.fileName = os.path.join(self.path, 'test.dwa')
+        _writeDictionary(self.fileName, "%s = %s ;\n", 50)
+        for home in (info.LOCAL_HOME, info.GLOBAL_HOME):
+            for directory in ('data', 'conf'):
+                os.makedirs(os.path.join(home, info.PLAIN_DICT_DIR,
+                                         'test.dwa', directory))
+
+
+    def tearDown(self):
+        info.LOCAL_HOME, info.GLOBAL_HOME = self.homes
+        shutil.rmtree(self.path)
+
+
+    def _newDictionary(self):
+        """Return dictionary as it is loaded from configuration"""
+
+        dictionary = SlowoParser(self.fileName)
+        dictionary.setEncoding('UTF-8')
+        dictionary.setDescription('')
+        return dictionary
+
+
+    def _makeIndex(self, processes):
+        """Return contents of index files made by processes workers"""
+
+        dictionary = self._newDictionary()
+        plaindict.makeIndex(dictionary, 'UTF-8', True, processes=processes)
+
+        files = []
+        for fileName in (plaindict.INDEX_FILE, plaindict.FULL_INDEX_FILE):
+            fd = open(plaindict.getDataFile(dictionary, fileName), 'rb')
+            files.append(fd.read())
+            fd.close()
+        return files + [dictionary.getChecksum()]
+
+
+    def test_parallel(self):
+        """Index made by worker processes should equal serial one"""
+
+        serial = self._makeIndex(1)
+        self.assertEqual(self._makeIndex(3), serial)
+
+        # makeIndex() falls back to one process silently
+        dictionary = self._newDictionary()
+        size = os.path.getsize(self.fileName)
+        self.assertEqual(plaindict._makeIndexParallel(dictionary, True,
+                                                      size, 3),
+                         plaindict._makeIndexSerial(dictionary, 'UTF-8',
+                                                    True, size))
+
+
+    def test_dataFile(self):
+        """Files written locally should be read back"""
+
+        dictionary = self._newDictionary()
+        globalPath = os.path.join(info.GLOBAL_HOME, info.PLAIN_DICT_DIR,
+                                  'test.dwa', 'data',
+                                  plaindict.FINGERPRINT_FILE)
+        open(globalPath, 'w').close()
+        self.assertEqual(plaindict.getDataFile(dictionary,
+                                               plaindict.FINGERPRINT_FILE),
+                         globalPath)
+
+        plaindict.makeIndex(dictionary, 'UTF-8')
+        localPath = plaindict.getDataFile(dictionary,
+                                          plaindict.FINGERPRINT_FILE)
+        self.assertTrue(localPath.startswith(info.LOCAL_HOME))
+        self.assertFalse(plaindict.indexShouldBeMade(dictionary))
+
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,206 @@
+#
+# OpenDict
+# Copyright (c) 2003-2006 Martynas Jocius <martynas.jocius@idiles.com>
+# Copyright (c) 2007 IDILES SYSTEMS, UAB <support@idiles.com>
+#
+# Unit Test for plainindex.py
+#
+
+"""
+Unit tests for plainindex.py
+"""
+
+import unittest
+import os
+import sys
+import tempfile
+
+sys.path.append('../..')
+
+from lib import plainindex
+
+
+def _readEntries(path):
+    """Return (key, offset) list for Slowo file"""
+
+    entries = []
+    count = 0
+    fd = open(path, 'rb')
+    for line in fd:
+        text = line.decode('UTF-8')
+        if '=' in text:
+            entries.append((plainindex.foldKey(text.split('=', 1)[0]),
+                            count))
+        count += len(line)
+    fd.close()
+
+    return entries
+
+
+class TestHeadwordIndex(unittest.TestCase):
+    """HeadwordIndex test"""
+
+    def setUp(self):
+        """Build index of sample dictionary"""
+
+        self.index = plainindex.buildHeadwordIndex(
+            _readEntries("data/sampledict.dwa"))
+
+
+    def test_sorted(self):
+        """Entries should be sorted by key"""
+
+        keys = [self.index.getKey(i) for i in range(len(self.index))]
+        self.assertEqual(len(keys), 7)
+        self.assertEqual(keys, sorted(keys))
+
+
+    def test_offsets(self):
+        """Offsets should point to the line of the headword in bytes"""
+
+        fd = open("data/sampledict.dwa", 'rb')
+        for word in ('vienas', 'žirafa', 'ąžuolas', 'miškas'):
+            i = self.index.findExact(word)
+            self.assertTrue(i >= 0)
+            fd.seek(self.index.getOffset(i))
+            line = fd.readline().decode('UTF-8')
+            self.assertTrue(line.startswith(word))
+        fd.close()
+
+
+    def test_findExact(self):
+        """findExact() should ignore case and report missing words"""
+
+        self.assertTrue(self.index.findExact('DU') >= 0)
+        self.assertEqual(self.index.findExact('d'), -1)
+        self.assertEqual(self.index.findExact('zzz'), -1)
+
+
+    def test_findPrefix(self):
+        """findPrefix() should return range of matching entries"""
+
+        first, last = self.index.findPrefix('ke')
+        self.assertEqual(last - first, 1)
+        self.assertEqual(self.index.getKey(first), 'keturi'.encode('UTF-8'))
+
+        first, last = self.index.findPrefix('x')
+        self.assertEqual(first, last)
+
+        first, last = self.index.findPrefix('')
+        self.assertEqual((first, last), (0, 7))
+
+
+    def test_writeLoad(self):
+        """Index should be the same after writing and loading"""
+
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            plainindex.writeHeadwordIndex(self.index, path)
+            loaded = plainindex.loadHeadwordIndex(path)
+        finally:
+            os.unlink(path)
+
+        self.assertEqual(len(loaded), len(self.index))
+        for i in range(len(self.index)):
+            self.assertEqual(loaded.getKey(i), self.index.getKey(i))
+            self.assertEqual(loaded.getOffset(i), self.index.getOffset(i))
+
+
+    def test_loadInvalid(self):
+        """Loading other file should fail"""
+
+        self.assertRaises(ValueError, plainindex.loadHeadwordIndex,
+                          "data/sampledict.dwa")
+
+
+
+class TestRanges(unittest.TestCase):
+    """Indexing file in ranges test"""
+
+    def test_splitRanges(self):
+        """Ranges should cover the file and start at line beginnings"""
+
+        path = "data/sampledict.dwa"
+        data = open(path, 'rb').read()
+        for parts in (1, 2, 3, 5, 100):
+            ranges = plainindex.splitRanges(path, parts)
+            self.assertEqual(ranges[0][0], 0)
+            self.assertEqual(ranges[-1][1], len(data))
+            for i in range(len(ranges) - 1):
+                self.assertEqual(ranges[i][1], ranges[i + 1][0])
+            for start, end in ranges[1:]:
+                self.assertEqual(data[start - 1:start], b'\n')
+
+
+    def test_mergeRanges(self):
+        """Merged ranges should give the same index as the whole file"""
+
+        path = "data/sampledict.dwa"
+        getHeadword = lambda text: text.split('=', 1)[0] \
+                      if '=' in text else None
+        whole = plainindex.indexRange(path, 0, os.path.getsize(path),
+                                      'UTF-8', getHeadword)
+        merged = plainindex.mergeRanges(
+            [plainindex.indexRange(path, start, end, 'UTF-8', getHeadword)
+             for start, end in plainindex.splitRanges(path, 4)])
+
+        self.assertEqual(list(merged[0].items()), list(whole[0].items()))
+        self.assertEqual(merged[1], whole[1])
+        self.assertEqual(merged[1], _readEntries(path))
+
+
+
+class TestFingerprint(unittest.TestCase):
+    """Fingerprint test"""
+
+    def setUp(self):
+        """Make a copy of sample dictionary"""
+
+        fd, self.path = tempfile.mkstemp()
+        os.close(fd)
+        data = open("data/sampledict.dwa", 'rb').read()
+        open(self.path, 'wb').write(data)
+
+
+    def tearDown(self):
+        """Remove temporary files"""
+
+        os.unlink(self.path)
+
+
+    def test_writeLoad(self):
+        """Fingerprint should be the same after writing and loading"""
+
+        fingerprint = plainindex.makeFingerprint(self.path)
+        path = self.path + ".fp"
+        try:
+            plainindex.writeFingerprint(fingerprint, path)
+            self.assertEqual(plainindex.loadFingerprint(path), fingerprint)
+        finally:
+            os.unlink(path)
+
+        self.assertEqual(plainindex.loadFingerprint(path), None)
+
+
+    def test_changed(self):
+        """Fingerprint should change with file contents and time"""
+
+        fingerprint = plainindex.makeFingerprint(self.path)
+        self.assertEqual(fingerprint['size'], os.path.getsize(self.path))
+        self.assertEqual(plainindex.makeFingerprint(self.path), fingerprint)
+
+        fd = open(self.path, 'r+b')
+        fd.write(b'X')
+        fd.close()
+        os.utime(self.path, ns=(fingerprint['mtime_ns'],
+                                fingerprint['mtime_ns']))
+
+        changed = plainindex.makeFingerprint(self.path)
+        self.assertEqual(changed['mtime_ns'], fingerprint['mtime_ns'])
+        self.assertNotEqual(changed['sample'], fingerprint['sample'])
+
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+#
+# OpenDict
+# Copyright (c) 2003-2006 Martynas Jocius <martynas.jocius@idiles.com>
+# Copyright (c) 2007 IDILES SYSTEMS, UAB <support@idiles.com>
+#
+# Unit Test for remotecache.py
+#
+
+"""
+Unit tests for remotecache.py
+"""
+
+import unittest
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+sys.path.append('../..')
+
+from lib import remotecache
+
+
+def _key(word):
+    return ('dict.org', 2628, '*', '', word)
+
+
+class TestLookupCache(unittest.TestCase):
+    """LookupCache test"""
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+
+    def test_memory(self):
+        """Least recently used results should be dropped first"""
+
+        data = [('Test Dictionary', 'x' * 100)]
+        size = remotecache._resultSize(data)
+        cache = remotecache.LookupCache(memorySize=size * 2)
+        cache.put(_key('a'), data)
+        cache.put(_key('b'), data)
+        self.assertEqual(cache.get(_key('a')), data)
+        cache.put(_key('c'), data)
+
+        self.assertEqual(cache.get(_key('b')), None)
+        self.assertEqual(cache.get(_key('a')), data)
+        self.assertEqual(cache.get(_key('c')), data)
+
+
+    def test_disk(self):
+        """Results should be read back by another cache"""
+
+        data = [('Test Dictionary', 'apple\nA fruit.')]
+        remotecache.LookupCache(self.path).put(_key('apple'), data)
+        remotecache.LookupCache(self.path).put(_key('plum'), [])
+
+        cache = remotecache.LookupCache(self.path)
+        self.assertEqual(cache.get(_key('apple')), data)
+        self.assertEqual(cache.get(_key('plum')), [])
+        self.assertEqual(cache.get(_key('pear')), None)
+        self.assertEqual((cache.hits, cache.misses), (2, 1))
+
+
+    def test_ttl(self):
+        """Results without definitions should expire sooner"""
+
+        cache = remotecache.LookupCache(self.path, ttl=100, negativeTTL=10)
+        cache.put(_key('apple'), [('Test', 'apple')])
+        cache.put(_key('plum'), [])
+
+        # Read the files back 50 seconds later
+        cache = remotecache.LookupCache(self.path, ttl=100, negativeTTL=10)
+        cache._isFresh = lambda stored, data, now, isFresh=cache._isFresh: \
+                         isFresh(stored, data, now + 50)
+
+        self.assertEqual(cache.get(_key('plum')), None)
+        self.assertEqual(cache.get(_key('apple')), [('Test', 'apple')])
+        cache.setTTL(40, 10)
+        self.assertEqual(cache.get(_key('apple')), None)
+        self.assertEqual(os.listdir(self.path), [])
+
+
+    def test_diskSize(self):
+        """Files over the disk size should be removed, oldest first"""
+
+        data = [('Test Dictionary', 'x' * 1000)]
+        cache = remotecache.LookupCache(self.path, diskSize=5000)
+        for i in range(10):
+            cache.put(_key(str(i)), data)
+            fileName = cache._fileName(_key(str(i)))
+            os.utime(fileName, (time.time() - 100 + i, time.time() - 100 + i))
+
+        files = os.listdir(self.path)
+        self.assertTrue(0 < len(files) < 5)
+        self.assertTrue(os.path.exists(cache._fileName(_key('9'))))
+        self.assertFalse(os.path.exists(cache._fileName(_key('0'))))
+
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,143 @@
+#
+# OpenDict
+# Copyright (c) 2003-2006 Martynas Jocius <martynas.jocius@idiles.com>
+# Copyright (c) 2007 IDILES SYSTEMS, UAB <support@idiles.com>
+#
+# Unit Test for resultstore.py
+#
+
+"""
+Unit tests for resultstore.py
+"""
+
+import unittest
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+sys.path.append('../..')
+
+from lib import resultstore
+
+
+def _key(word, checksum='abc'):
+    return (('PlainDictionary', 'test', '/tmp/test'), checksum,
+            (100, 1), 'UTF-8', word)
+
+
+def _result(translation, words, notFound):
+    return (translation, words, notFound)
+
+
+class TestResultStore(unittest.TestCase):
+    """ResultStore test"""
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.fileName = os.path.join(self.path, 'results.sqlite')
+
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+
+    def test_reopen(self):
+        """Results should be read back after reopening the store"""
+
+        store = resultstore.ResultStore(self.fileName)
+        store.put(_key('apple'), '<p>apple</p>', ['apple'], False)
+        store.put(_key('pear'), '', [], True)
+        store.close()
+
+        store = resultstore.ResultStore(self.fileName)
+        self.assertEqual(store.get(_key('apple'), _result),
+                         ('<p>apple</p>', ['apple'], False))
+        self.assertEqual(store.get(_key('pear'), _result), ('', [], True))
+        self.assertEqual(store.get(_key('plum'), _result), None)
+
+        # Changed dictionary fingerprint
+        self.assertEqual(store.get(_key('apple', 'def'), _result), None)
+        store.flush()
+        self.assertEqual(store.get(_key('apple'), _result), None)
+        store.close()
+
+
+    def test_mostUsed(self):
+        """Most used results should be returned first with full keys"""
+
+        store = resultstore.ResultStore(self.fileName)
+        for word in ('a', 'b', 'c'):
+            store.put(_key(word), word, [word], False)
+        store.flush()
+        for i in range(3):
+            store.get(_key('b'), _result)
+        store.get(_key('c'), _result)
+        store.flush()
+
+        used = store.getMostUsed(2)
+        self.assertEqual([key for key, t, w, n in used],
+                         [_key('b'), _key('c')])
+        store.close()
+
+
+    def test_json(self):
+        """Results should be kept as JSON, other data dropped"""
+
+        store = resultstore.ResultStore(self.fileName)
+        store.put(_key('apple'), '<p>apple</p>', ['apple'], False)
+        store.put(_key('pear'), '<p>pear</p>', ['pear'], False)
+        store.put(_key('plum'), b'bytes', [], False)
+        store.flush()
+        db = store._connect()
+        self.assertEqual(db.execute("SELECT data FROM results WHERE key = ?",
+                                    (resultstore.splitKey(_key('apple'))[0],)
+                                    ).fetchone()[0],
+                         '["<p>apple</p>", ["apple"]]')
+        db.execute("UPDATE results SET data = ? WHERE key = ?",
+                   (b'\x80\x04K\x01.',
+                    resultstore.splitKey(_key('pear'))[0]))
+        db.commit()
+        db.close()
+
+        self.assertEqual(store.get(_key('pear'), _result), None)
+        self.assertEqual(store.get(_key('plum'), _result), None)
+        self.assertEqual([key for key, t, w, n in store.getMostUsed()],
+                         [_key('apple')])
+        store.close()
+
+
+    def test_touch(self):
+        """Uses found elsewhere should count, closed store ignores all"""
+
+        store = resultstore.ResultStore(self.fileName)
+        for word in ('a', 'b'):
+            store.put(_key(word), word, [word], False)
+        store.touch(_key('b'))
+        store.flush()
+        self.assertEqual([key for key, t, w, n in store.getMostUsed(1)],
+                         [_key('b')])
+        store.close()
+
+        store.put(_key('c'), 'c', ['c'], False)
+        store.touch(_key('a'))
+        self.assertTrue(store.queue.empty())
+
+
+    def test_evict(self):
+        """Least recently used results should be removed over size"""
+
+        store = resultstore.ResultStore(self.fileName, maxSize=5000)
+        for i in range(10):
+            store.put(_key(str(i)), 'x' * 1000, [], False)
+            store.flush()
+
+        self.assertEqual(store.get(_key('0'), _result), None)
+        self.assertNotEqual(store.get(_key('9'), _result), None)
+        store.close()
+
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,183 @@
+#
+# OpenDict
+# Copyright (c) 2003-2006 Martynas Jocius <martynas.jocius@idiles.com>
+# Copyright (c) 2007 IDILES SYSTEMS, UAB <support@idiles.com>
+#
+# Unit Test for searchcache.py
+#
+
+"""
+Unit tests for searchcache.py
+"""
+
+import unittest
+import os
+import sys
+import shutil
+import tempfile
+
+sys.path.append('../..')
+
+from lib import searchcache
+from lib import resultstore
+from lib import meta
+from lib import errortype
+
+
+class CountingDictionary(meta.Dictionary):
+    """Dictionary counting its searches"""
+
+    def __init__(self, path=None):
+        self.path = path
+        self.encoding = 'UTF-8'
+        self.searches = 0
+
+
+    def getName(self):
+        return 'counting'
+
+
+    def getPath(self):
+        return self.path
+
+
+    def getEncoding(self):
+        return self.encoding
+
+
+    def search(self, word):
+        self.searches += 1
+        result = meta.SearchResult()
+        result.setTranslation("<p>%s</p>" % word)
+        result.setWordList([word])
+        if word == 'error':
+            result.setError(errortype.INTERNAL_ERROR)
+        return result
+
+
+
+class TestSearchCache(unittest.TestCase):
+    """SearchCache test"""
+
+    def setUp(self):
+        self.cache = searchcache.SearchCache()
+        self.dictionary = CountingDictionary()
+
+
+    def test_hit(self):
+        """Same word should be searched once"""
+
+        first = self.cache.search(self.dictionary, b'word')
+        self.assertTrue(self.cache.search(self.dictionary, 'word') is first)
+        self.cache.search(self.dictionary, 'Word')
+        self.assertEqual(self.dictionary.searches, 2)
+
+        # Parsers get the word as it is, so it is not normalized
+        self.cache.search(self.dictionary, 'word ')
+        self.cache.search(self.dictionary, 'e\u0301')
+        self.cache.search(self.dictionary, '\u00e9')
+        self.assertEqual(self.dictionary.searches, 5)
+
+        self.cache.search(self.dictionary, 'error')
+        self.cache.search(self.dictionary, 'error')
+        self.assertEqual(self.dictionary.searches, 7)
+
+        stats = self.cache.getStats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 7))
+
+
+    def test_limits(self):
+        """Least recently used results should be dropped"""
+
+        self.cache.setLimits(2, 1024)
+        for word in ('a', 'b', 'a', 'c', 'a', 'b'):
+            self.cache.search(self.dictionary, word)
+        self.assertEqual(self.dictionary.searches, 4)
+        self.assertEqual(self.cache.getStats()['evictions'], 2)
+
+        self.cache.setLimits(100, searchcache.getResultSize(
+            self.cache.search(self.dictionary, 'a')) * 3)
+        for word in 'defgh':
+            self.cache.search(self.dictionary, word)
+        self.assertEqual(len(self.cache.entries), 3)
+
+
+    def test_changed(self):
+        """Results should not be used after dictionary file changes"""
+
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            dictionary = CountingDictionary(path)
+            self.cache.search(dictionary, 'word')
+            self.cache.search(dictionary, 'word')
+            open(path, 'w').write('changed')
+            self.cache.search(dictionary, 'word')
+            dictionary.encoding = 'ISO-8859-1'
+            self.cache.search(dictionary, 'word')
+            self.assertEqual(dictionary.searches, 3)
+
+            self.cache.invalidate(dictionary)
+            self.cache.search(dictionary, 'word')
+            self.assertEqual(dictionary.searches, 4)
+        finally:
+            os.unlink(path)
+
+
+    def test_store(self):
+        """Results should be found in the store after restart"""
+
+        path = tempfile.mkdtemp()
+        try:
+            fileName = os.path.join(path, 'results.sqlite')
+            self.cache.setStore(resultstore.ResultStore(fileName))
+            self.cache.search(self.dictionary, 'word')
+            self.cache.search(self.dictionary, 'error')
+            self.cache.setStore(None)
+
+            cache = searchcache.SearchCache()
+            cache.setStore(resultstore.ResultStore(fileName))
+            self.assertEqual(cache.prewarm(10), 1)
+            result = cache.search(self.dictionary, 'word')
+            self.assertEqual(result.getTranslation(), "<p>word</p>")
+            self.assertEqual(result.getError(), errortype.OK)
+            cache.setStore(None)
+
+            cache = searchcache.SearchCache()
+            cache.setStore(resultstore.ResultStore(fileName))
+            cache.search(self.dictionary, 'word')
+            self.assertEqual(cache.getStats()['storeHits'], 1)
+            self.assertEqual(self.dictionary.searches, 2)
+            cache.setStore(None)
+        finally:
+            shutil.rmtree(path)
+
+
+    def test_prewarm(self):
+        """Most used results should survive prewarming a small cache"""
+
+        path = tempfile.mkdtemp()
+        try:
+            fileName = os.path.join(path, 'results.sqlite')
+            self.cache.setStore(resultstore.ResultStore(fileName))
+            words = ['w%d' % i for i in range(6)]
+            for i, word in enumerate(words):
+                # Hits from memory count too, w5 is used most
+                for j in range(i + 1):
+                    self.cache.search(self.dictionary, word)
+            self.cache.setStore(None)
+
+            cache = searchcache.SearchCache(maxEntries=3)
+            cache.setStore(resultstore.ResultStore(fileName))
+            self.assertEqual(cache.prewarm(500), 3)
+            self.assertEqual([key[-1] for key in cache.entries],
+                             ['w3', 'w4', 'w5'])
+            self.assertEqual(cache.getStats()['evictions'], 0)
+            cache.setStore(None)
+        finally:
+            shutil.rmtree(path)
+
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+#
+# OpenDict
+# Copyright (c) 2003-2006 Martynas Jocius <martynas.jocius@idiles.com>
+# Copyright (c) 2007 IDILES SYSTEMS, UAB <support@idiles.com>
+#
+# Unit Test for servermeta.py
+#
+
+"""
+Unit tests for servermeta.py
+"""
+
+import unittest
+import os
+import sys
+import shutil
+import tempfile
+
+sys.path.append('../..')
+
+from lib import info
+from lib import servermeta
+from test_dictclient import FakeServer
+
+
+class TestMetadata(unittest.TestCase):
+    """Server metadata cache test"""
+
+    def setUp(self):
+        self.localHome = info.LOCAL_HOME
+        info.LOCAL_HOME = tempfile.mkdtemp()
+        self.server = FakeServer()
+        self.port = self.server.server_address[1]
+
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(info.LOCAL_HOME)
+        info.LOCAL_HOME = self.localHome
+
+
+    def test_fetch(self):
+        """Metadata should be fetched once while the greeting is the same"""
+
+        metadata = servermeta.updateMetadata('127.0.0.1', self.port)
+        self.assertEqual(metadata['databases'],
+                         {'other': 'Other Dictionary',
+                          'test': 'Test Dictionary'})
+        self.assertEqual(sorted(metadata['strategies']), ['exact', 'prefix'])
+        self.assertEqual(metadata['info']['test'], 'Test Dictionary\n\nInfo.')
+        self.assertEqual(metadata['version'], 'fake 1.0 <mime.auth>')
+        self.assertEqual(self.server.commands.count('SHOW'), 4)
+
+        path = servermeta.getMetadataPath('127.0.0.1', self.port)
+        self.assertEqual(servermeta.loadMetadata(path), metadata)
+
+        self.assertEqual(servermeta.updateMetadata('127.0.0.1', self.port),
+                         metadata)
+        self.assertEqual(self.server.commands.count('SHOW'), 4)
+
+        self.server.banner = "fake 1.1"
+        servermeta.updateMetadata('127.0.0.1', self.port)
+        self.assertEqual(self.server.commands.count('SHOW'), 8)
+        self.assertEqual(servermeta.loadMetadata(path)['version'],
+                         'fake 1.1 <mime.auth>')
+
+
+
+if __name__ == "__main__":
+    unittest.main()
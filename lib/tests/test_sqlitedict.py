@@ -0,0 +1,153 @@
+#
+# OpenDict
+# Copyright (c) 2003-2006 Martynas Jocius <martynas.jocius@idiles.com>
+# Copyright (c) 2007 IDILES SYSTEMS, UAB <support@idiles.com>
+#
+# Unit Test for sqlitedict.py
+#
+
+"""
+Unit tests for sqlitedict.py
+"""
+
+import unittest
+import os
+import sys
+import shutil
+import threading
+import tempfile
+
+sys.path.append('../..')
+
+from lib import sqlitedict
+from lib import errortype
+from lib.extra import dictdlib
+from lib.parser import SlowoParser, MovaParser, DictParser
+
+
+class TestSQLiteDictionary(unittest.TestCase):
+    """SQLiteDictionary test"""
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.fileName = os.path.join(self.path, 'sample.sqlite')
+
+        source = SlowoParser("data/sampledict.dwa")
+        source.setEncoding('UTF-8')
+        self.count = sqlitedict.importDictionary(source, self.fileName)
+
+        self.dictionary = sqlitedict.SQLiteDictionary(self.fileName)
+        self.dictionary.start()
+
+
+    def tearDown(self):
+        self.dictionary.stop()
+        shutil.rmtree(self.path)
+
+
+    def test_search(self):
+        """Words should be found ignoring case, prefixes listed"""
+
+        self.assertEqual(self.count, 7)
+
+        result = self.dictionary.search('DU'.encode('UTF-8'))
+        self.assertEqual(result.getError(), errortype.OK)
+        self.assertTrue('two pieces' in result.getTranslation())
+        self.assertEqual(result.getWordList(), ['du'])
+
+        result = self.dictionary.search('Žir')
+        self.assertEqual(result.getWordList(), ['žirafa'])
+        self.assertTrue('giraphe' in result.getTranslation())
+
+        result = self.dictionary.search('xyz')
+        self.assertEqual(result.getError(), errortype.NOT_FOUND)
+        self.assertEqual(result.getWordList(), [])
+
+
+    def test_fullText(self):
+        """Definitions should be searched by their words"""
+
+        self.assertEqual(self.dictionary.searchText('africa'), ['žirafa'])
+        self.assertEqual(sorted(self.dictionary.searchText('wood')),
+                         ['miškas', 'ąžuolas'])
+
+        # Query syntax characters are taken as text
+        self.assertEqual(self.dictionary.searchText('"tree'), ['trys'])
+        self.assertEqual(self.dictionary.searchText('banana'), [])
+
+
+    def test_threads(self):
+        """Every thread should search using its own connection"""
+
+        results = []
+        def search():
+            results.append(self.dictionary.search('trys').getWordList())
+
+        threads = [threading.Thread(target=search) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results, [['trys']] * 4)
+        self.assertEqual(len(self.dictionary.connections), 5)
+
+
+    def test_import(self):
+        """Mova dictionaries should be imported too"""
+
+        movaName = os.path.join(self.path, 'sample.mova')
+        fd = open(movaName, 'w', encoding='UTF-8')
+        fd.write("alpha  first letter\nbeta  second letter\n"
+                 "x<y  less <than>\n")
+        fd.close()
+
+        source = MovaParser(movaName)
+        source.setEncoding('UTF-8')
+        fileName = os.path.join(self.path, 'mova.sqlite')
+        self.assertEqual(sqlitedict.importDictionary(source, fileName), 3)
+
+        dictionary = sqlitedict.SQLiteDictionary(fileName)
+        dictionary.start()
+        try:
+            result = dictionary.search('beta')
+            self.assertTrue('second letter' in result.getTranslation())
+            self.assertEqual(dictionary.searchText('letter first'),
+                             ['alpha'])
+
+            # Plain text is escaped
+            translation = dictionary.search('x<y').getTranslation()
+            self.assertTrue('<b>x&lt;y</b>' in translation)
+            self.assertTrue('<p>less &lt;than&gt;</p>' in translation)
+        finally:
+            dictionary.stop()
+
+
+    def test_importDict(self):
+        """Titles of dictd entries should be stored without markup"""
+
+        basename = os.path.join(self.path, 'sample')
+        compiler = dictdlib.DictCompiler(basename, quiet=1)
+        compiler.addentry("apple [a-pl]\nA fruit.", ["apple"])
+        compiler.addentry("pear\nAnother fruit.", ["pear"])
+        compiler.finish()
+
+        fileName = os.path.join(self.path, 'dict.sqlite')
+        self.assertEqual(sqlitedict.importDictionary(
+            DictParser(basename + ".dict"), fileName), 2)
+
+        dictionary = sqlitedict.SQLiteDictionary(fileName)
+        dictionary.start()
+        try:
+            self.assertEqual(dictionary.getEntry('apple')[0],
+                             'apple [a-pl]')
+            translation = dictionary.search('pear').getTranslation()
+            self.assertTrue('<b>pear</b>' in translation)
+            self.assertFalse('<b><b>' in translation)
+        finally:
+            dictionary.stop()
+
+
+
+if __name__ == "__main__":
+    unittest.main()
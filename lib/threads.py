@@ -87,3 +87,83 @@ class Process:
         self.__C.notify()
         self.__C.release()
 
+
+
+class JobCancelled(Exception):
+    """Raised inside a job when cancellation was requested"""
+
+    pass
+
+
+class Job:
+    """Background job with progress reporting and cancellation.
+
+    func is called in a separate thread as func(*param, job=self).
+    It should call update() from time to time to report progress; update()
+    raises JobCancelled when stop() was requested, so the job finishes
+    as soon as possible.
+    """
+
+    def __init__(self, func, *param):
+        self.__done = False
+        self.__cancelled = False
+        self.__result = None
+        self.__error = None
+        self.__processed = 0
+        self.__total = 0
+
+        self.__T = Thread(target=self.Wrapper, args=(func, param))
+        self.__T.setName("JobThread")
+        self.__T.daemon = True
+        self.__T.start()
+
+    def __repr__(self):
+        return "<Job at %s: %d/%d>" % (hex(id(self)), self.__processed,
+                                       self.__total)
+
+    def update(self, processed, total):
+        """Report progress, raise JobCancelled if job was cancelled"""
+        self.__processed = processed
+        self.__total = total
+        if self.__cancelled:
+            raise JobCancelled()
+
+    def getProgress(self):
+        """Return (processed, total) tuple"""
+        return (self.__processed, self.__total)
+
+    def getPercentage(self):
+        """Return progress in percents"""
+        if not self.__total:
+            return 0
+        return int(float(self.__processed) / self.__total * 100)
+
+    def stop(self):
+        """Request cancellation"""
+        self.__cancelled = True
+
+    def isCancelled(self):
+        return self.__cancelled
+
+    def isDone(self):
+        return self.__done
+
+    def getResult(self):
+        """Return value returned by func"""
+        return self.__result
+
+    def getError(self):
+        """Return exception raised by func, None if succeeded"""
+        return self.__error
+
+    def Wrapper(self, func, param):
+        try:
+            self.__result = func(*param, job=self)
+        except JobCancelled as e:
+            self.__error = e
+        except Exception as e:
+            self.__error = e
+            print("".join(traceback.format_exception(sys.exc_info()[0],
+                                                     sys.exc_info()[1],
+                                                     sys.exc_info()[2])))
+        self.__done = True
@@ -38,6 +38,10 @@ from lib import info
 from lib.logger import systemLog, debugLog, DEBUG, INFO, WARNING, ERROR
 
 
+# Files are hashed by chunks of this size
+MD5_CHUNK_SIZE = 1024 * 1024
+
+
 class UniqueIdGenerator:
     """Unique ID generator (using singleton design pattern)"""
 
@@ -81,15 +85,26 @@ def generateUniqueID():
     return gen.getID()
 
 
-def getMD5Sum(filePath):
-    """Return MD5 checksum for given file"""
+def getMD5Sum(filePath, job=None):
+    """Return MD5 checksum for given file. If job is given, progress
+    is reported to it."""
 
+    generator = hashlib.md5()
+    size = os.path.getsize(filePath)
+    count = 0
 
     fd = open(filePath, 'rb')
-    data = fd.read()
-    fd.close()
-
-    generator = hashlib.md5(data)
+    try:
+        while True:
+            data = fd.read(MD5_CHUNK_SIZE)
+            if not data:
+                break
+            generator.update(data)
+            count += len(data)
+            if job:
+                job.update(count, size)
+    finally:
+        fd.close()
 
     return generator.hexdigest()
 
@@ -24,6 +24,7 @@ import os
 import traceback
 import string
 import time
+import multiprocessing
 
 # main_is_frozen() returns True when running the exe, and False when
 # running from a script.
@@ -64,6 +65,11 @@ from lib import info
 from lib import newplugin
 from lib import plaindict
 from lib import util
+from lib import remotecache
+from lib import searchcache
+from lib import resultstore
+from lib.threads import Job
+from lib.extra import dictdlib
 
 
 class OpenDictApp(wx.App):
@@ -123,6 +129,36 @@ class OpenDictApp(wx.App):
       self.config = Configuration()
       self.config.load()
 
+      try:
+         dictdlib.chunkcache.setbudget(
+            int(self.config.get('dictCacheSize')) * 1024 * 1024)
+      except ValueError:
+         systemLog(WARNING, "Invalid dictCacheSize value: %s" \
+                   % self.config.get('dictCacheSize'))
+
+      try:
+         searchcache.resultCache.setLimits(
+            int(self.config.get('searchCacheEntries')),
+            int(self.config.get('searchCacheSize')) * 1024 * 1024)
+      except ValueError:
+         systemLog(WARNING, "Invalid search cache settings")
+
+      self.prewarmJob = None
+      if self.config.get('searchStore') == 'True':
+         self.openResultStore()
+
+      remotecache.lookupCache.setPath(os.path.join(info.LOCAL_HOME,
+                                                   'cache', 'dictserver'))
+      try:
+         remotecache.lookupCache.setTTL(
+            int(self.config.get('dictServerCacheTTL')),
+            int(self.config.get('dictServerCacheNegativeTTL')))
+         remotecache.lookupCache.setSizes(
+            int(self.config.get('dictServerCacheMemory')) * 1024 * 1024,
+            int(self.config.get('dictServerCacheSize')) * 1024 * 1024)
+      except ValueError:
+         systemLog(WARNING, "Invalid DICT server cache settings")
+
       self.agreements = util.AgreementsManager(os.path.join(info.LOCAL_HOME,
                                                             'agreements.txt'))
 
@@ -170,7 +206,33 @@ class OpenDictApp(wx.App):
       return True
 
 
+   def openResultStore(self):
+      """Attach persistent result store to the search cache and load
+      the most used results in the background"""
+
+      try:
+         size = int(self.config.get('searchStoreSize')) * 1024 * 1024
+         count = int(self.config.get('searchStorePrewarm'))
+      except ValueError:
+         systemLog(WARNING, "Invalid search store settings")
+         size = resultstore.MAX_SIZE
+         count = resultstore.PREWARM_COUNT
+
+      path = os.path.join(info.LOCAL_HOME, 'cache', 'results.sqlite')
+      try:
+         store = resultstore.ResultStore(path, size)
+      except Exception as e:
+         systemLog(WARNING, "Unable to open result store %s: %s" % (path, e))
+         return
+
+      searchcache.resultCache.setStore(store)
+      self.prewarmJob = Job(searchcache.resultCache.prewarm, count)
+
+
 if __name__ == "__main__":
 
+   # Needed by index building worker processes in frozen executables
+   multiprocessing.freeze_support()
+
    openDictApp = OpenDictApp(0)
    openDictApp.MainLoop()
@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+
+# Slowo search benchmark
+# Compares the old eager per-line parsing with the two-phase
+# SlowoParser search (headword first, translation on hit only).
+#
+# Usage: bench_slowo.py <dwa file> [lines to generate]
+#
+# If number of lines is given, a synthetic dictionary of that size is
+# written to <dwa file> first. The headword of the last entry is looked
+# up and no index is used, so every search scans the whole file and
+# the number of lines per second can be compared directly.
+
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                                '..'))
+
+from lib.parser import SlowoParser
+
+
+ROUNDS = 3
+
+
+def generate(filePath, count):
+    """Write synthetic Slowo dictionary"""
+
+    letters = "abcdefghijklmnopqrstuvwxyząčęėįšųūž"
+    rand = random.Random(0)
+    words = set()
+
+    while len(words) < count:
+        words.add("".join([rand.choice(letters) \
+                           for i in range(rand.randint(3, 12))]))
+
+    fd = open(filePath, 'w', encoding='UTF-8')
+    for word in sorted(words):
+        fd.write("%s = %s // comment ; %s ; %s // other\n" \
+                 % (word, word[::-1], word.upper(), word[1:]))
+    fd.close()
+
+
+def lastHeadword(filePath):
+    """Return headword of the last entry of Slowo dictionary"""
+
+    headword = None
+    fd = open(filePath, 'r', encoding='UTF-8')
+    for line in fd:
+        if '=' in line:
+            headword = line.split('=', 1)[0].strip()
+    fd.close()
+
+    return headword
+
+
+def eagerScan(lines, word):
+    """Old SlowoParser.search loop: every line is split into
+    translations and rendered before the headword is compared"""
+
+    word_lowered = word.lower()
+    words = []
+    count = 0
+
+    for line in lines:
+        count += 1
+        line = line.strip()
+        orig = ""
+        end = ""
+        try:
+            orig, end = line.split('=', 1)
+        except ValueError:
+            pass
+        orig = orig.strip()
+        chunks = end.split(';')
+
+        translation = ["<ul>"]
+        for chunk in chunks:
+            comment = []
+            trans = chunk.split('//')
+            if len(trans) > 1:
+                comment = trans[1:]
+            trans = "".join(trans[:1]).strip()
+            comment = "".join(comment).strip()
+            if len(trans) and len(comment) != 0:
+                translation.append("<li>%s (<i>%s</i>)</li>" \
+                                   % (trans, comment))
+            elif len(trans):
+                translation.append("<li>%s</li>" % trans)
+        translation.append("</ul>")
+        translation = "".join(translation)
+
+        if line.lower().startswith(word_lowered):
+            if not orig.lower().startswith(word_lowered):
+                break
+            words.append(orig)
+        elif len(words):
+            break
+
+    return count
+
+
+def measure(name, func, lineCount):
+    """Run func several times and print lines per second"""
+
+    best = None
+    for i in range(ROUNDS):
+        start = time.time()
+        func()
+        took = time.time() - start
+        if best is None or took < best:
+            best = took
+
+    print("%-24s %8.3f s %12d lines/s" % (name, best, lineCount / best))
+
+    return best
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: %s <dwa file> [lines to generate]" % sys.argv[0])
+        sys.exit(1)
+
+    filePath = sys.argv[1]
+    if len(sys.argv) > 2:
+        print("Generating %s lines..." % sys.argv[2])
+        generate(filePath, int(sys.argv[2]))
+
+    fd = open(filePath, 'rb')
+    lineCount = sum(1 for line in fd)
+    fd.close()
+
+    word = lastHeadword(filePath)
+    print("%s: %d lines, %d bytes, looking up \"%s\"" \
+          % (filePath, lineCount, os.path.getsize(filePath), word))
+
+    dictionary = SlowoParser(filePath)
+    dictionary.setEncoding('UTF-8')
+    dictionary.setIndex({})
+
+    dictionary.start()
+    before = measure("before (eager parsing)",
+                     lambda: eagerScan(dictionary._getLines(word), word),
+                     lineCount)
+    after = measure("after (two-phase)",
+                    lambda: dictionary.search(word),
+                    lineCount)
+    dictionary.stop()
+
+    dictionary.setUseMmap(True)
+    dictionary.start()
+    mapped = measure("after (two-phase, mmap)",
+                     lambda: dictionary.search(word),
+                     lineCount)
+    dictionary.stop()
+
+    print("Speedup: %.1fx, %.1fx with mmap" % (before / after,
+                                                 before / mapped))
@@ -0,0 +1,68 @@
+# convertdict
+# Command line handling shared by makeodx.py and makesqlite.py, which
+# convert a Slowo, Mova, dictd, SQLite or compiled dictionary file into
+# another format. Both take these options:
+#
+#   -e  character encoding of the dictionary file, UTF-8 by default
+#   -n  dictionary name, file name by default
+
+import os
+import sys
+import getopt
+
+from lib import dicttype
+
+
+def usage(options, target):
+    """Print usage of script taking options besides -e and -n, writing
+    target file, and exit"""
+
+    print("Usage: %s [-e encoding] [-n name]%s <dictionary file> " \
+          "<%s file>" % (sys.argv[0], options, target))
+    sys.exit(1)
+
+
+def getDictionaryType(filePath):
+    """Return plain dictionary type of file by its extention"""
+
+    extention = os.path.splitext(filePath)[1][1:].lower()
+    for t in dicttype.plainTypes:
+        if extention in t.getFileExtentions():
+            return t
+
+    return None
+
+
+def parseArguments(shortOptions, options, target):
+    """Parse command line. shortOptions are getopt options besides -e
+    and -n, options and target are shown by usage(). Return
+    (dictionary, target file, other options) tuple"""
+
+    try:
+        opts, files = getopt.getopt(sys.argv[1:], "e:n:" + shortOptions)
+    except getopt.GetoptError as e:
+        print(e)
+        usage(options, target)
+
+    if len(files) != 2:
+        usage(options, target)
+
+    source, targetPath = files
+    dictType = getDictionaryType(source)
+    if dictType is None:
+        print("Unknown dictionary type of '%s'" % source)
+        sys.exit(1)
+
+    dictionary = dictType.getClass()(source)
+    dictionary.setEncoding('UTF-8')
+
+    other = []
+    for opt, value in opts:
+        if opt == "-e":
+            dictionary.setEncoding(value)
+        elif opt == "-n":
+            dictionary.setName(value)
+        else:
+            other.append((opt, value))
+
+    return dictionary, targetPath, other
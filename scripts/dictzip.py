@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+
+# dictzip
+# Compresses dictd .dict files to random access .dict.dz files,
+# like dictzip of the dictd package does.
+#
+# Usage: dictzip.py [-k] [-j processes] [-s chunk size] <dict file>...
+#
+#   -k  keep the original file
+#   -j  number of compressing processes, one per CPU by default
+#   -s  uncompressed chunk size, 58315 by default
+
+import os
+import sys
+import getopt
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                                '..'))
+
+from lib.extra import dictdlib
+
+
+def usage():
+    print("Usage: %s [-k] [-j processes] [-s chunk size] <dict file>..." \
+          % sys.argv[0])
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+    try:
+        opts, files = getopt.getopt(sys.argv[1:], "kj:s:")
+    except getopt.GetoptError as e:
+        print(e)
+        usage()
+
+    if not files:
+        usage()
+
+    keep = False
+    processes = None
+    chunklen = dictdlib.DICTZIP_CHUNK_LEN
+
+    for opt, value in opts:
+        if opt == "-k":
+            keep = True
+        elif opt == "-j":
+            processes = int(value)
+        elif opt == "-s":
+            chunklen = int(value)
+
+    for filePath in files:
+        print("Compressing '%s'..." % filePath, end=' ')
+        sys.stdout.flush()
+        if keep:
+            dictdlib.writedictzip(filePath, filePath + ".dz", chunklen,
+                                  processes)
+        else:
+            dictdlib.compressdict(filePath, chunklen, processes)
+        print("done")
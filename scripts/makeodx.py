@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+
+# makeodx
+# Compiles Slowo, Mova, dictd or SQLite dictionary into a compiled
+# OpenDict dictionary (.odx), which can then be installed like any
+# other dictionary.
+#
+# Usage: makeodx.py [-e encoding] [-n name] [-c compression] [-b block size]
+#                   <dictionary file> <odx file>
+#
+#   -e  character encoding of the dictionary file, UTF-8 by default
+#   -n  dictionary name, file name by default
+#   -c  zlib (default), lzma or none
+#   -b  uncompressed size of definition blocks, 65536 by default
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                                '..'))
+
+from lib import odxdict
+import convertdict
+
+
+# Options shown by usage besides -e and -n
+OPTIONS = " [-c compression] [-b block size]"
+
+
+if __name__ == "__main__":
+    dictionary, target, opts = convertdict.parseArguments("c:b:", OPTIONS,
+                                                          "odx")
+    compression = odxdict.ZLIB
+    blockSize = odxdict.BLOCK_SIZE
+
+    for opt, value in opts:
+        if opt == "-c":
+            if not value in odxdict.compressions:
+                convertdict.usage(OPTIONS, "odx")
+            compression = odxdict.compressions[value]
+        elif opt == "-b":
+            blockSize = int(value)
+
+    print("Compiling '%s'..." % dictionary.getPath(), end=' ')
+    sys.stdout.flush()
+    count = odxdict.compileDictionary(dictionary, target, compression,
+                                      blockSize)
+    print("%d entries" % count)
@@ -0,0 +1,28 @@
+#!/usr/bin/env python
+
+# makesqlite
+# Imports Slowo, Mova or dictd dictionary into an OpenDict SQLite
+# dictionary, which can then be installed like any other dictionary.
+#
+# Usage: makesqlite.py [-e encoding] [-n name] <dictionary file> <sqlite file>
+#
+#   -e  character encoding of the dictionary file, UTF-8 by default
+#   -n  dictionary name, file name by default
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                                '..'))
+
+from lib import sqlitedict
+import convertdict
+
+
+if __name__ == "__main__":
+    dictionary, target, opts = convertdict.parseArguments("", "", "sqlite")
+
+    print("Importing '%s'..." % dictionary.getPath(), end=' ')
+    sys.stdout.flush()
+    count = sqlitedict.importDictionary(dictionary, target)
+    print("%d entries" % count)